@@ -8,7 +8,8 @@
 """Common elements to all dictionary formats."""
 
 from os.path import splitext
-from bisect import bisect_left
+from array import array
+from bisect import bisect_left, bisect_right
 import collections
 import functools
 import itertools
@@ -16,8 +17,14 @@ import operator
 import re
 import threading
 
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
 from plover import formatting
 from plover.registry import registry
+from plover import trace
 
 # Characters to strip from ends of translation when performing inexact bisection search
 SEARCH_STRIP_CHARS = "".join(set(
@@ -30,6 +37,39 @@ SEARCH_STRIP_CHARS = "".join(set(
 # Regex to match ASCII characters matched as literals counting from the start of a regex pattern
 REGEX_MATCH_PREFIX = re.compile(r'[\w \"#%\',\-:;<=>@`~]+').match
 
+# Regex to split text into words (including their trailing whitespace) for phrase searches
+WORD_RX = re.compile(r'(?:\w+|[^\w\s]+)\s*')
+
+# Maximum edit distance used by fuzzy searches by default (smaller for short translations, see fuzzy_match_values)
+FUZZY_MAX_DISTANCE = 2
+
+
+def _required_literals(parsed):
+    """ Return a list of literal strings that any match of the parsed regex must contain (possibly empty). """
+    literals = []
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            literals.append(''.join(run))
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            literals.extend(_required_literals(av[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            literals.extend(_required_literals(av[2]))
+    if run:
+        literals.append(''.join(run))
+    return literals
+
+
+def _values(items, count=None):
+    """ Return a list of the values of at most <count> (key, value) <items>. """
+    if count is not None:
+        items = itertools.islice(items, count)
+    return [v for (k, v) in items]
+
 
 def _get_dictionary_class(filename):
     extension = splitext(filename)[1].lower()[1:]
@@ -75,7 +115,8 @@ def load_dictionary(resource, threaded_save=True):
 
     The format is inferred from the extension.
     '''
-    d = _get_dictionary_class(resource).load(resource)
+    with trace.span('load_dictionary', resource=resource):
+        d = _get_dictionary_class(resource).load(resource)
     if not d.readonly and threaded_save:
         d.save = _threaded(_locked(d.save))
     return d
@@ -154,6 +195,14 @@ class SimilarSearchDict(dict):
             for (k, v) in dict(*args, **kwargs).items():
                 self[k] = v
 
+    def copy(self):
+        """ Return a shallow copy (of the same class), without having to sort the list again. """
+        other = self.__class__.__new__(self.__class__)
+        dict.update(other, self)
+        other.__dict__.update(self.__dict__)
+        other._list = list(self._list)
+        return other
+
     def filter_keys(self, k, count=None, filterfn=None):
         """
         Starting from the leftmost position in the list where <k> could be, return keys in order until:
@@ -163,14 +212,9 @@ class SimilarSearchDict(dict):
         Either condition will terminate the loop, as will reaching the end of the list.
         """
         simkey = self._simfn(k)
-        idx_start = self._index_left(k)
-        # Creating a list iterator and manually setting the index is much faster than islice
-        # or subscripting for the case where an indefinite iterator over a long list is needed.
-        list_iter = iter(self._list)
-        list_iter.__setstate__(idx_start)
         keys = []
         keys_append = keys.append
-        for (sk, rk) in list_iter:
+        for (sk, rk) in self._list_iter(self._index_left(k)):
             if filterfn is not None and not filterfn(sk, simkey):
                 break
             keys_append(rk)
@@ -178,31 +222,150 @@ class SimilarSearchDict(dict):
                 break
         return keys
 
+    def filter_items(self, k, filterfn=None, after=None):
+        """ Lazy version of `filter_keys`: return an iterator over the (simkey, rawkey) list items, in sort order.
+            If <after> is not None, start after the key <after> instead (for resuming a previous search). """
+        simkey = self._simfn(k)
+        idx_start = self._index_left(k)
+        if after is not None:
+            idx_start = max(idx_start, self._index_after(after))
+        items = self._list_iter(idx_start)
+        if filterfn is None:
+            return items
+        return itertools.takewhile(lambda item: filterfn(item[0], simkey), items)
+
     def get_similar_keys(self, k, count=None):
         """ Return a list of at most <count> keys that compare equal to <k> under the similarity function. """
         return self.filter_keys(k, count=count, filterfn=operator.eq)
 
     def prefix_search(self, prefix):
         """ Return a generator producing all possible raw keys that could contain <prefix>. """
+        items = self.prefix_items(prefix)
+        if not items:
+            return []
+        return map(operator.itemgetter(1), items)
+
+    def prefix_items(self, prefix, after=None, reverse=False):
+        """ Return an iterator over the (simkey, rawkey) list items that could contain <prefix>, in sort order
+            (or in reverse sort order if <reverse> is True). If <after> is not None, start after the key <after>
+            in this order (for resuming a previous search). """
         sim_prefix = self._simfn(prefix)
         # If the prefix is empty after transformation, it could possibly match anything in the list.
         if not sim_prefix:
-            return map(operator.itemgetter(1), self._list)
-        # All possibilities will be found in the sort order between the prefix itself (inclusive) and
-        # the prefix with one added to the numerical value of its final character (exclusive).
-        idx_start = self._index_left(sim_prefix, already_transformed=True)
-        marker_end = sim_prefix[:-1] + chr(ord(sim_prefix[-1]) + 1)
-        idx_end = self._index_left(marker_end, already_transformed=True)
-        # If the range is empty, return a blank list instead of a generator so that it compares False.
-        if idx_start == idx_end:
+            if not reverse:
+                return self._list_iter(0 if after is None else self._index_after(after))
+            idx_start, idx_end = 0, len(self._list)
+        else:
+            # All possibilities will be found in the sort order between the prefix itself (inclusive) and
+            # the prefix with one added to the numerical value of its final character (exclusive).
+            idx_start = self._index_left(sim_prefix, already_transformed=True)
+            marker_end = sim_prefix[:-1] + chr(ord(sim_prefix[-1]) + 1)
+            idx_end = self._index_left(marker_end, already_transformed=True)
+        if after is not None:
+            if reverse:
+                idx_end = min(idx_end, self._index_exact(after))
+            else:
+                idx_start = max(idx_start, self._index_after(after))
+        # If the range is empty, return a blank list instead of an iterator so that it compares False.
+        if idx_start >= idx_end:
             return []
-        return map(operator.itemgetter(1), self._list[idx_start:idx_end])
+        if reverse:
+            list_iter = reversed(self._list)
+            list_iter.__setstate__(idx_end - 1)
+        else:
+            list_iter = self._list_iter(idx_start)
+        return itertools.islice(list_iter, idx_end - idx_start)
+
+    def fuzzy_search(self, k, max_distance):
+        """
+        Return a list of (distance, key) tuples for the keys that are within <max_distance> edits of <k> under
+        the similarity function, ranked by distance, then in sort order. Edits are insertions, deletions, and
+        substitutions of a character, and transpositions of two adjacent characters (optimal string alignment
+        distance, so a transposed character pair counts as one edit, but is not edited further).
+
+        The sorted list is walked as a trie: rows of the edit distance matrix are shared with the previous
+        key for their common prefix, and when no row cell is within <max_distance>, all the keys starting
+        with the current prefix are skipped with a bisection search. Only cells in the band of width
+        2 * <max_distance> + 1 around the diagonal are computed, the others are known to be too far.
+        """
+        simkey = self._simfn(k)
+        size = len(simkey)
+        limit = max_distance + 1
+        # rows[i] is the row of the matrix for prefix[:i] (values are capped at <limit>).
+        # Note: no row can have a smaller minimum than the previous one, even with
+        # transpositions, so a prefix can be pruned as soon as a row is too far.
+        rows = [[min(j, limit) for j in range(size + 1)]]
+        prefix = ""
+        results = []
+        items = self._list
+        idx = 0
+        end = len(items)
+        while idx < end:
+            sk, rk = items[idx]
+            common = 0
+            common_max = min(len(sk), len(prefix))
+            while common < common_max and sk[common] == prefix[common]:
+                common += 1
+            del rows[common + 1:]
+            pruned = False
+            for i in range(common + 1, len(sk) + 1):
+                ch = sk[i - 1]
+                previous_ch = sk[i - 2] if i > 1 else None
+                above = rows[-1]
+                row = [limit] * (size + 1)
+                if i < limit:
+                    row[0] = i
+                best = row[0]
+                start = max(1, i - max_distance)
+                left = row[start - 1]
+                for j in range(start, min(size, i + max_distance) + 1):
+                    v = above[j - 1] + (simkey[j - 1] != ch)
+                    if above[j] + 1 < v:
+                        v = above[j] + 1
+                    if left + 1 < v:
+                        v = left + 1
+                    if previous_ch == simkey[j - 1] and j > 1 and ch == simkey[j - 2] and rows[-2][j - 2] + 1 < v:
+                        v = rows[-2][j - 2] + 1
+                    if v > limit:
+                        v = limit
+                    row[j] = left = v
+                    if v < best:
+                        best = v
+                rows.append(row)
+                if best > max_distance:
+                    # No key starting with this prefix can be close enough: skip them all.
+                    prefix = sk[:i]
+                    marker_end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                    idx = bisect_left(items, (marker_end,), idx + 1)
+                    pruned = True
+                    break
+            if pruned:
+                continue
+            prefix = sk
+            distance = rows[-1][size]
+            if distance <= max_distance:
+                results.append((distance, rk))
+            idx += 1
+        results.sort(key=operator.itemgetter(0))
+        return results
+
+    def _list_iter(self, idx_start):
+        """ Return an iterator over the list, starting from the index <idx_start>. """
+        # Creating a list iterator and manually setting the index is much faster than islice
+        # or subscripting for the case where an indefinite iterator over a long list is needed.
+        list_iter = iter(self._list)
+        list_iter.__setstate__(idx_start)
+        return list_iter
 
     def _index_left(self, k, already_transformed=False):
         """ Find the leftmost list index of the key <k> (or the place it should be) using bisection search. """
         # Out of all tuples with an equal first value, the 1-tuple with this value compares less than any 2-tuple.
         return bisect_left(self._list, (k if already_transformed else self._simfn(k),))
 
+    def _index_after(self, k):
+        """ Find the list index right after the key <k> (or the place it should be) using bisection search. """
+        return bisect_right(self._list, (self._simfn(k), k))
+
     def _index_exact(self, k):
         """ Find the exact list index of the key <k>  using bisection search (if it exists). """
         return bisect_left(self._list, (self._simfn(k), k))
@@ -230,23 +393,56 @@ class ReverseStenoDict(SimilarSearchDict):
         def simfn(s, strip=str.strip, lower=str.lower, strip_chars=SEARCH_STRIP_CHARS):
             """ Translations are similar if they compare equal when stripped of case and certain exterior symbols. """
             return lower(strip(s, strip_chars))
+        # Search indexes, built on demand and discarded when values are added or removed:
+        # - trie of multi-word translations (see phrase_match_values)
+        self._phrase_trie = None
+        # - trigrams (lowercase) to the sorted indexes in the list of the values containing them
+        self._trigram_index = None
         super().__init__(simfn=simfn, *args, **kwargs)
 
+    def _invalidate_indexes(self):
+        self._phrase_trie = None
+        self._trigram_index = None
+
+    def clear(self):
+        super().clear()
+        self._invalidate_indexes()
+
+    def __setitem__(self, k, v):
+        if k not in self:
+            self._invalidate_indexes()
+        super().__setitem__(k, v)
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self._invalidate_indexes()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._invalidate_indexes()
+
     def append_key(self, v, k):
         """ Append the key <k> to the list located under the value <v>.
             Create a new list with that key if the value doesn't exist yet. """
-        if v in self:
-            self[v].append(k)
-        else:
+        keys = dict.get(self, v)
+        if keys is None:
             self[v] = [k]
+        else:
+            # Replace the list instead of modifying it in place: copies (see SimilarSearchDict.copy) share it.
+            dict.__setitem__(self, v, keys + [k])
 
     def remove_key(self, v, k):
         """ Remove the key <k> from the list located under the value <v>. The key must exist.
             If it was the last key in the list, remove the dictionary entry entirely. """
-        if v in self:
-            self[v].remove(k)
-            if not self[v]:
-                del self[v]
+        keys = dict.get(self, v)
+        if keys is None:
+            return
+        keys = list(keys)
+        keys.remove(k)
+        if keys:
+            dict.__setitem__(self, v, keys)
+        else:
+            del self[v]
 
     def match_forward(self, fdict):
         """ Make this dict into the reverse of the given forward dict by rebuilding all of the lists.
@@ -258,29 +454,224 @@ class ReverseStenoDict(SimilarSearchDict):
             list_append(rdict[v], k)
         self.update(rdict)
 
+    # The *_match_items methods are lazy versions of the corresponding *_match_values methods: they return
+    # an iterator over the matching (simkey, value) items in sort order, so the results of several dictionaries
+    # can be merged, and only the items needed are checked. If <after> is not None, the search starts after
+    # the value <after> (so a search can be resumed from the last value returned).
+
     def partial_match_values(self, v, count=None):
         """ Return a list of at most <count> values that are equal to
             or begin with the value <v> under the similarity function. """
         return self.filter_keys(v, count=count, filterfn=str.startswith)
 
+    def partial_match_items(self, v, after=None):
+        return self.filter_items(v, filterfn=str.startswith, after=after)
+
     def regex_match_values(self, pattern, count=None):
         """ Return a list of at most <count> translations that match the regex <pattern> from the start. """
+        return _values(self.regex_match_items(pattern), count)
+
+    def regex_match_items(self, pattern, after=None):
         # First, figure out how much of the pattern string from the start is literal (no regex special characters).
         prefix_match = REGEX_MATCH_PREFIX(pattern)
         prefix = prefix_match.group() if prefix_match else ""
-        # If we know that all matches start with a certain prefix, we can narrow the range of our search.
-        value_gen = self.prefix_search(prefix)
-        if not value_gen:
-            return []
+        if prefix:
+            # If we know that all matches start with a certain prefix, we can narrow the range of our search.
+            item_gen = self.prefix_items(prefix, after)
+        else:
+            # Otherwise, use the literal parts of the pattern to narrow the search with the trigram index.
+            item_gen = self._trigram_search(_required_literals(sre_parse.parse(pattern)), after)
+        if not item_gen:
+            return iter(())
         # If the prefix and pattern are equal, we have a complete literal string. Regex is not necessary.
         # Just do a partial case-sensitive match in that case. Otherwise, compile the regular expression.
         if prefix == pattern:
             match_op = operator.methodcaller("startswith", pattern)
         else:
             match_op = re.compile(pattern).match
-        # Set up the match filter and limit the output to <count> if requested.
-        results = filter(match_op, value_gen)
+        # Set up the match filter (on the values).
+        return (item for item in item_gen if match_op(item[1]))
+
+    def substring_match_values(self, v, count=None):
+        """ Return a list of at most <count> values that contain the value <v> (case-insensitive), in sort order. """
+        return _values(self.substring_match_items(v), count)
+
+    def substring_match_items(self, v, after=None):
+        substring = v.lower()
+        return (item for item in self._trigram_search((substring,), after)
+                if substring in item[1].lower())
+
+    def fuzzy_match_values(self, v, count=None, max_distance=None):
+        """ Return a list of at most <count> (distance, value) tuples for the values within <max_distance> edits of
+            the value <v> under the similarity function, closest first. By default, the maximum distance depends on
+            the length of <v>: up to `FUZZY_MAX_DISTANCE`, with one edit allowed for each 3 characters. """
+        if max_distance is None:
+            max_distance = min(FUZZY_MAX_DISTANCE, len(self._simfn(v)) // 3)
+        results = self.fuzzy_search(v, max_distance)
         if count is not None:
-            results = itertools.islice(results, count)
-        # Execute the entire chain of iterators at the end to return a list.
-        return list(results)
+            del results[count:]
+        return results
+
+    def _build_trigram_index(self):
+        """ Index the (lowercase) trigrams of each value. Posting lists are arrays of indexes in the sorted list. """
+        index = collections.defaultdict(lambda: array('I'))
+        for n, (sk, rk) in enumerate(self._list):
+            v = rk.lower()
+            for trigram in {v[i:i + 3] for i in range(len(v) - 2)}:
+                index[trigram].append(n)
+        return dict(index)
+
+    def _trigram_search(self, substrings, after=None):
+        """ Return an iterable over the (simkey, value) items (in sort order, after the value <after> if not None)
+            whose values may contain all of <substrings> (case-insensitive). Candidates must still be checked: the
+            search is only narrowed down to the values containing the rarest trigram, and all items are returned
+            if no substring is long enough to use the index. """
+        idx_start = 0 if after is None else self._index_after(after)
+        trigrams = {s[i:i + 3] for s in map(str.lower, substrings) for i in range(len(s) - 2)}
+        if not trigrams:
+            return self._list_iter(idx_start)
+        if self._trigram_index is None:
+            self._trigram_index = self._build_trigram_index()
+        rarest = min((self._trigram_index.get(t, ()) for t in trigrams), key=len)
+        positions = itertools.islice(rarest, bisect_left(rarest, idx_start), None)
+        return map(self._list.__getitem__, positions)
+
+    def _build_phrase_trie(self):
+        """ Build a trie of the translations made of multiple words, indexed by their words (as split
+            by WORD_RX after applying the similarity function) in reverse order. Each node is a dict
+            mapping the previous word to the next node, and None to the translations ending there. """
+        trie = {}
+        split_words = WORD_RX.findall
+        for (sk, rk) in self._list:
+            words = split_words(sk)
+            if len(words) < 2:
+                continue
+            node = trie
+            for w in reversed(words):
+                node = node.setdefault(w, {})
+            node.setdefault(None, []).append(rk)
+        return trie
+
+    def phrase_match_values(self, words):
+        """
+        Find values similar to each phrase made of the last words of <words>, in a single pass.
+        <words> is a list of words as split by WORD_RX (i.e. with their trailing whitespace).
+        Return a list of (start, values) tuples for each phrase <words[start:]> with matches, longest first.
+        """
+        results = []
+        strip_chars = SEARCH_STRIP_CHARS
+        words = [w.lower() for w in words]
+        # The similarity function strips the ends of the phrases: the last
+        # words made only of stripped characters are dropped from them.
+        end = len(words) - 1
+        while end >= 0 and not words[end].strip(strip_chars):
+            end -= 1
+        if end < len(words) - 1:
+            # Phrases made only of stripped characters.
+            values = self.get_similar_keys(words[-1])
+            if values:
+                results.extend((start, values) for start in range(len(words) - 1, end, -1))
+        if end < 0:
+            return results
+        if self._phrase_trie is None:
+            self._phrase_trie = self._build_phrase_trie()
+        # Walk the trie from the last word, backward. The first word of each
+        # phrase is stripped of its leading characters: a phrase starting
+        # with words made only of stripped characters has the same
+        # matches as the phrase starting with the next word.
+        values = self.get_similar_keys(words[end])
+        node = self._phrase_trie.get(words[end].rstrip(strip_chars))
+        for start in range(end, -1, -1):
+            w = words[start]
+            if start < end:
+                if w.lstrip(strip_chars):
+                    match = node and node.get(w.lstrip(strip_chars))
+                    values = match and match.get(None)
+                node = node and node.get(w)
+            if values:
+                results.append((start, values))
+            elif not node:
+                break
+        results.reverse()
+        return results
+
+
+class StenoKeyIndex:
+    """
+    An index of steno dictionary keys (tuples of strokes) for queries on outlines:
+
+    - a list of (outline, key) tuples sorted by outline (the strokes joined with "/"), so all the keys with an
+      outline starting with a given prefix ("KPA/", or even "KP") are found in a single range of the list;
+    - posting lists: for each stroke, the set of keys that contain it.
+
+    Like the list of SimilarSearchDict, keys are inserted and removed in O(n) time, and the index is most
+    useful for large dictionaries that are mutated rarely.
+    """
+
+    def __init__(self, keys=()):
+        self._list = sorted(zip(map('/'.join, keys), keys))
+        self._postings = collections.defaultdict(set)
+        for (outline, k) in self._list:
+            for stroke in k:
+                self._postings[stroke].add(k)
+
+    def __len__(self):
+        return len(self._list)
+
+    def add(self, k):
+        """ Add the key <k> to the index (it must not be in it already). """
+        item = ('/'.join(k), k)
+        self._list.insert(bisect_left(self._list, item), item)
+        for stroke in k:
+            self._postings[stroke].add(k)
+
+    def remove(self, k):
+        """ Remove the key <k> from the index (if it exists). """
+        item = ('/'.join(k), k)
+        idx = bisect_left(self._list, item)
+        if idx == len(self._list) or self._list[idx] != item:
+            return
+        del self._list[idx]
+        for stroke in set(k):
+            keys = self._postings[stroke]
+            keys.discard(k)
+            if not keys:
+                del self._postings[stroke]
+
+    def prefix_items(self, prefix, after=None, reverse=False):
+        """ Return an iterator over the (outline, key) items with an outline starting with <prefix>, in sort order
+            (or in reverse sort order if <reverse> is True). If <after> is not None, start after the key <after>
+            in this order (for resuming a previous search). """
+        idx_start = 0
+        idx_end = len(self._list)
+        if prefix:
+            # Same range as for SimilarSearchDict.prefix_items.
+            idx_start = bisect_left(self._list, (prefix,))
+            idx_end = bisect_left(self._list, (prefix[:-1] + chr(ord(prefix[-1]) + 1),))
+        if after is not None:
+            if reverse:
+                idx_end = min(idx_end, bisect_left(self._list, ('/'.join(after), after)))
+            else:
+                idx_start = max(idx_start, bisect_right(self._list, ('/'.join(after), after)))
+        if idx_start >= idx_end:
+            return []
+        if reverse:
+            list_iter = reversed(self._list)
+            list_iter.__setstate__(idx_end - 1)
+        else:
+            list_iter = iter(self._list)
+            list_iter.__setstate__(idx_start)
+        return itertools.islice(list_iter, idx_end - idx_start)
+
+    def stroke_items(self, strokes, after=None):
+        """ Return a list of the (outline, key) items with a key containing all of the given <strokes>,
+            in sort order. If <after> is not None, only return the items after the key <after>. """
+        postings = sorted((self._postings.get(stroke, ()) for stroke in set(strokes)), key=len)
+        if not postings or not postings[0]:
+            return []
+        # Start from the smallest posting list.
+        keys = postings[0].intersection(*postings[1:])
+        items = sorted(zip(map('/'.join, keys), keys))
+        if after is not None:
+            del items[:bisect_right(items, ('/'.join(after), after))]
+        return items
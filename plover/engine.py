@@ -1,15 +1,18 @@
 
-from collections import namedtuple, OrderedDict
+from collections import deque, namedtuple, OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 from queue import Queue
 import os
 import shutil
 import threading
+import time
 
-from plover import log, system
+from plover import log, system, trace
 from plover.dictionary.loading_manager import DictionaryLoadingManager
 from plover.exception import DictionaryLoaderException
-from plover.formatting import Formatter
+from plover.formatting import Formatter, has_engine_command
+from plover.metrics import LatencyMetrics
 from plover.misc import shorten_path
 from plover.registry import registry
 from plover.resource import ASSET_SCHEME, resource_filename
@@ -23,6 +26,10 @@ StartingStrokeState = namedtuple('StartingStrokeState', 'attach capitalize')
 
 MachineParams = namedtuple('MachineParams', 'type options keymap')
 
+# Read-only snapshot of the dictionaries <source> (as of <generation>),
+# and suggestions searching it, see `StenoEngine._get_snapshot`.
+DictionariesSnapshot = namedtuple('DictionariesSnapshot', 'source generation dictionaries suggestions')
+
 
 class ErroredDictionary(StenoDictionary):
     """ Placeholder for dictionaries that failed to load. """
@@ -72,6 +79,68 @@ def with_lock(func):
     return _with_lock
 
 
+# Hooks dispatch modes:
+# - synchronous: callbacks are called directly from the engine thread.
+HOOK_DISPATCH_SYNC = 'sync'
+# - asynchronous: callbacks are called from a dedicated worker thread,
+#   through a bounded queue; on overflow, either the new event is dropped,
+#   or the oldest pending event is discarded (so the latest state wins).
+HOOK_DISPATCH_DROP = 'drop'
+HOOK_DISPATCH_COALESCE = 'coalesce'
+
+# Default maximum number of pending events per asynchronous hook callback.
+HOOK_QUEUE_SIZE = 256
+
+
+class HookWorker(threading.Thread):
+    """ Deliver hook events to a callback from a dedicated thread. """
+
+    def __init__(self, hook, callback, policy=HOOK_DISPATCH_DROP, queue_size=HOOK_QUEUE_SIZE):
+        super().__init__(name='hook-%s' % hook, daemon=True)
+        assert policy in (HOOK_DISPATCH_DROP, HOOK_DISPATCH_COALESCE)
+        self.hook = hook
+        self.callback = callback
+        self.policy = policy
+        self.queue_size = queue_size
+        # Number of events dropped because the queue was full.
+        self.overflows = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def __call__(self, *args, **kwargs):
+        """ Queue an event, never blocking the caller. """
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                self.overflows += 1
+                if self.policy == HOOK_DISPATCH_DROP:
+                    return
+                self._queue.popleft()
+            self._queue.append((args, kwargs))
+            self._condition.notify()
+
+    def stop(self):
+        """ Stop the worker, once all pending events are delivered. """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                args, kwargs = self._queue.popleft()
+            try:
+                self.callback(*args, **kwargs)
+            except Exception:
+                log.error('hook %r callback %r failed',
+                          self.hook, self.callback,
+                          exc_info=True)
+
+
 class StenoEngine:
 
     HOOKS = '''
@@ -89,13 +158,31 @@ class StenoEngine:
     configure
     lookup
     quit
+    latency_updated
     '''.split()
 
+    # Hooks on the output path: those must stay synchronous.
+    SYNCHRONOUS_HOOKS = '''
+    send_string
+    send_backspaces
+    send_key_combination
+    '''.split()
+
+    # Number of strokes between `latency_updated` hook calls.
+    LATENCY_UPDATE_INTERVAL = 100
+
     def __init__(self, config, keyboard_emulation):
         self._config = config
         self._is_running = False
         self._queue = Queue()
         self._lock = threading.RLock()
+        # Strokes received from the machine, but not processed yet.
+        self._pending_strokes = []
+        self._pending_strokes_lock = threading.Lock()
+        self._latency = LatencyMetrics()
+        self._latency_strokes = 0
+        # Time spent in keyboard emulation, for the current batch.
+        self._output_time = 0
         self._machine = None
         self._machine_state = None
         self._machine_params = MachineParams(None, None, None)
@@ -106,10 +193,13 @@ class StenoEngine:
         self._translator.add_listener(log.translation)
         self._translator.add_listener(self._formatter.format)
         self._dictionaries = self._translator.get_dictionary()
+        # Latest dictionaries snapshot, see `_get_snapshot`.
+        self._snapshot = None
         self._dictionaries_manager = DictionaryLoadingManager()
         self._running_state = self._translator.get_state()
         self._keyboard_emulation = keyboard_emulation
         self._hooks = { hook: [] for hook in self.HOOKS }
+        self._hook_workers = {}
         self._running_extensions = {}
 
     def __enter__(self):
@@ -163,6 +253,7 @@ class StenoEngine:
         self._translator.set_dictionary(self._dictionaries)
         self._trigger_hook('dictionaries_loaded', self._dictionaries)
 
+    @trace.traced('StenoEngine._update')
     def _update(self, config_update=None, full=False, reset_machine=False):
         original_config = self._config.as_dict()
         # Update configuration.
@@ -216,7 +307,7 @@ class StenoEngine:
             self._machine = machine_class(machine_options)
             self._machine.set_suppression(self._is_running)
             self._machine.add_state_callback(self._machine_state_callback)
-            self._machine.add_stroke_callback(self._machine_stroke_callback)
+            self._machine.add_stroke_callback(self._machine_stroke_callback, batch=True)
             self._machine_params = machine_params
             update_keymap = True
             start_machine = True
@@ -286,6 +377,8 @@ class StenoEngine:
         self._stop()
         self.code = code
         self._trigger_hook('quit')
+        for worker in self._hook_workers.values():
+            worker.stop()
         return True
 
     def _toggle_output(self):
@@ -306,8 +399,15 @@ class StenoEngine:
     def _machine_state_callback(self, machine_state):
         self._same_thread_hook(self._on_machine_state_changed, machine_state)
 
-    def _machine_stroke_callback(self, steno_keys):
-        self._same_thread_hook(self._on_stroked, steno_keys)
+    def _machine_stroke_callback(self, strokes, timestamp):
+        # Only queue a call if one is not already pending: so strokes
+        # received while the engine is busy are processed as one batch.
+        with self._pending_strokes_lock:
+            queue_call = not self._pending_strokes
+            self._pending_strokes.extend((steno_keys, timestamp)
+                                         for steno_keys in strokes)
+        if queue_call:
+            self._same_thread_hook(self._on_pending_strokes)
 
     @with_lock
     def _on_machine_state_changed(self, machine_state):
@@ -340,17 +440,91 @@ class StenoEngine:
             self._trigger_hook('add_translation')
         elif command == 'LOOKUP':
             self._trigger_hook('lookup')
+        elif command == 'TRACE':
+            self._toggle_trace()
         else:
             command_args = command.split(':', 1)
             command_fn = registry.get_plugin('command', command_args[0]).obj
             command_fn(self, command_args[1] if len(command_args) == 2 else '')
         return False
 
-    def _on_stroked(self, steno_keys):
-        stroke = Stroke(steno_keys)
-        log.stroke(stroke)
-        self._translator.translate(stroke)
-        self._trigger_hook('stroked', stroke)
+    def _toggle_trace(self):
+        if trace.is_enabled():
+            trace.disable()
+            try:
+                log.info('trace written to %s', trace.dump())
+            except OSError as e:
+                log.error('writing trace failed: %s', e)
+        else:
+            trace.clear()
+            trace.enable()
+            log.info('tracing enabled')
+
+    def _translated_engine_command(self):
+        translations = self._translator.get_state().translations
+        if not translations:
+            return False
+        english = translations[-1].english
+        return english is not None and has_engine_command(english)
+
+    def _on_pending_strokes(self):
+        with self._pending_strokes_lock:
+            strokes, self._pending_strokes = self._pending_strokes, []
+        self._on_strokes(strokes)
+
+    def _on_strokes(self, strokes):
+        # Note: <strokes> is a list of `(steno_keys, timestamp)`.
+        strokes = [(Stroke(steno_keys), timestamp)
+                   for steno_keys, timestamp in strokes]
+        record = self._latency.record
+        while strokes:
+            # Translate the whole batch before flushing: this way only
+            # the final result is output, and not every intermediate
+            # correction.
+            batch = []
+            start = time.perf_counter()
+            for stroke, timestamp in strokes:
+                batch.append((stroke, timestamp))
+                record('queue', start - timestamp)
+                log.stroke(stroke)
+                self._translator.translate_stroke(stroke)
+                end = time.perf_counter()
+                record('translate', end - start)
+                start = end
+                # When output is disabled, process strokes one by one, so
+                # a `RESUME` or `TOGGLE` command applies to the next strokes.
+                # Likewise, end the batch after an engine command, since it
+                # may change the output state (`SUSPEND`) or the engine's.
+                if not self._is_running or self._translated_engine_command():
+                    break
+            strokes = strokes[len(batch):]
+            self._output_time = 0
+            with self._keyboard_batch():
+                self._translator.flush()
+            end = time.perf_counter()
+            record('format', end - start - self._output_time)
+            record('output', self._output_time)
+            for stroke, timestamp in batch:
+                record('total', end - timestamp)
+            for stroke, timestamp in batch:
+                self._trigger_hook('stroked', stroke)
+            self._latency_strokes += len(batch)
+            if self._latency_strokes >= self.LATENCY_UPDATE_INTERVAL:
+                self._latency_strokes = 0
+                self._trigger_hook('latency_updated', self._latency.summary())
+
+    @contextmanager
+    def _keyboard_batch(self):
+        # Let the keyboard emulation group all the key events
+        # (backspaces, text, and key combinations), if supported.
+        batch = getattr(self._keyboard_emulation, 'batch', None)
+        if batch is None:
+            yield
+            return
+        with batch():
+            yield
+            start = time.perf_counter()
+        self._output_time += time.perf_counter() - start
 
     def _on_translated(self, old, new):
         if not self._is_running:
@@ -360,19 +534,28 @@ class StenoEngine:
     def send_backspaces(self, b):
         if not self._is_running:
             return
-        self._keyboard_emulation.send_backspaces(b)
+        start = time.perf_counter()
+        with trace.span('send_backspaces'):
+            self._keyboard_emulation.send_backspaces(b)
+        self._output_time += time.perf_counter() - start
         self._trigger_hook('send_backspaces', b)
 
     def send_string(self, s):
         if not self._is_running:
             return
-        self._keyboard_emulation.send_string(s)
+        start = time.perf_counter()
+        with trace.span('send_string'):
+            self._keyboard_emulation.send_string(s)
+        self._output_time += time.perf_counter() - start
         self._trigger_hook('send_string', s)
 
     def send_key_combination(self, c):
         if not self._is_running:
             return
-        self._keyboard_emulation.send_key_combination(c)
+        start = time.perf_counter()
+        with trace.span('send_key_combination'):
+            self._keyboard_emulation.send_key_combination(c)
+        self._output_time += time.perf_counter() - start
         self._trigger_hook('send_key_combination', c)
 
     def send_engine_command(self, command):
@@ -445,22 +628,43 @@ class StenoEngine:
     def join(self):
         return self.code
 
-    @with_lock
+    def _get_snapshot(self):
+        '''Return the latest `DictionariesSnapshot`.
+
+        Lookups and searches use a read-only snapshot of the dictionaries,
+        so they don't need the engine lock, and can't delay the processing
+        of strokes. The lock is only taken to create a new snapshot, after
+        the dictionaries have been changed, and only the dictionaries that
+        changed are copied (see `StenoDictionaryCollection.snapshot`).
+        '''
+        snapshot = self._snapshot
+        if snapshot is None or \
+           snapshot.source is not self._dictionaries or \
+           snapshot.generation != self._dictionaries.generation:
+            with self._lock:
+                dictionaries = self._dictionaries
+                generation = dictionaries.generation
+                snapshot = self._snapshot
+                if snapshot is None or \
+                   snapshot.source is not dictionaries or \
+                   snapshot.generation != generation:
+                    copy = dictionaries.snapshot()
+                    snapshot = self._snapshot = DictionariesSnapshot(
+                        dictionaries, generation, copy, Suggestions(copy))
+        return snapshot
+
     def lookup(self, translation):
-        return self._dictionaries.lookup(translation)
+        return self._get_snapshot().dictionaries.lookup(translation)
 
-    @with_lock
     def raw_lookup(self, translation):
-        return self._dictionaries.raw_lookup(translation)
+        return self._get_snapshot().dictionaries.raw_lookup(translation)
 
-    @with_lock
     def reverse_lookup(self, translation):
-        matches = self._dictionaries.reverse_lookup(translation)
+        matches = self._get_snapshot().dictionaries.reverse_lookup(translation)
         return [] if matches is None else matches
 
-    @with_lock
     def casereverse_lookup(self, translation):
-        matches = self._dictionaries.casereverse_lookup(translation)
+        matches = self._get_snapshot().dictionaries.casereverse_lookup(translation)
         return set() if matches is None else matches
 
     @with_lock
@@ -471,9 +675,22 @@ class StenoEngine:
     def remove_dictionary_filter(self, dictionary_filter):
         self._dictionaries.remove_filter(dictionary_filter)
 
-    @with_lock
     def get_suggestions(self, translation, **kwargs):
-        return Suggestions(self._dictionaries).find(translation, **kwargs)
+        return self._get_snapshot().suggestions.find(translation, **kwargs)
+
+    def get_suggestions_page(self, translation, **kwargs):
+        return self._get_snapshot().suggestions.find_page(translation, **kwargs)
+
+    def get_suggestions_snapshot(self):
+        '''Return the `Suggestions` of the latest dictionaries snapshot.
+
+        Its searches all use the same (read-only) state of the dictionaries,
+        for searches done in several steps (see `SearchWorker`).
+        '''
+        return self._get_snapshot().suggestions
+
+    def get_phrase_suggestions(self, words):
+        return self._get_snapshot().suggestions.find_phrases(words)
 
     @property
     @with_lock
@@ -516,6 +733,14 @@ class StenoEngine:
     def dictionaries(self):
         return self._dictionaries
 
+    def latency_summary(self):
+        '''Return the rolling latency percentiles of each stroke processing stage.
+
+        See `plover.metrics.LatencyMetrics.summary`: the engine lock is not
+        needed (and not taken, so polling does not delay strokes processing).
+        '''
+        return self._latency.summary()
+
     # Hooks.
 
     def _trigger_hook(self, hook, *args, **kwargs):
@@ -528,9 +753,48 @@ class StenoEngine:
                           exc_info=True)
 
     @with_lock
-    def hook_connect(self, hook, callback):
+    def hook_connect(self, hook, callback, dispatch=HOOK_DISPATCH_SYNC,
+                     queue_size=HOOK_QUEUE_SIZE):
+        '''Connect a callback to a hook.
+
+        Arguments:
+
+        dispatch -- How the callback is called: synchronously from the
+                    engine thread (HOOK_DISPATCH_SYNC), or asynchronously
+                    from a dedicated worker thread (HOOK_DISPATCH_DROP or
+                    HOOK_DISPATCH_COALESCE, see `HookWorker`). Note: hooks
+                    on the output path (`SYNCHRONOUS_HOOKS`) cannot be
+                    dispatched asynchronously.
+
+        queue_size -- Maximum number of pending events, for asynchronous
+                      dispatch.
+        '''
+        if dispatch != HOOK_DISPATCH_SYNC:
+            if hook in self.SYNCHRONOUS_HOOKS:
+                raise ValueError('hook %r cannot be dispatched asynchronously' % hook)
+            if (hook, callback) in self._hook_workers:
+                raise ValueError('callback %r is already connected to hook %r' % (callback, hook))
+            worker = HookWorker(hook, callback, dispatch, queue_size)
+            worker.start()
+            self._hook_workers[(hook, callback)] = worker
+            callback = worker
         self._hooks[hook].append(callback)
 
     @with_lock
     def hook_disconnect(self, hook, callback):
+        worker = self._hook_workers.pop((hook, callback), None)
+        if worker is not None:
+            worker.stop()
+            callback = worker
         self._hooks[hook].remove(callback)
+
+    @with_lock
+    def hook_overflows(self):
+        '''Return the number of events dropped by each asynchronous hook callback.
+
+        The result is a dictionary mapping `(hook, callback)` to a count.
+        '''
+        return {
+            key: worker.overflows
+            for key, worker in self._hook_workers.items()
+        }
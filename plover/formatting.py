@@ -7,12 +7,14 @@ This module defines and implements plover's custom dictionary language.
 
 """
 from collections import namedtuple
+from functools import lru_cache
 import re
 import string
 
 from plover.misc import common_prefix_length
 from plover.orthography import add_suffix
 from plover.registry import registry
+from plover.trace import traced
 
 
 CASE_CAP_FIRST_WORD = 'cap_first_word'
@@ -84,9 +86,81 @@ META_RE = re.compile(r"""(?:%s%s|%s%s|[^%s%s])+ # One or more of anything
 #             """, re.VERBOSE)
 
 
+# Maximum number of parsed translations kept in cache.
+PARSED_TRANSLATIONS_CACHE_SIZE = 4096
+
 WORD_RX = re.compile(r'(?:\d+(?:[.,]\d+)+|[\'\w]+[-\w\']*|[^\w\s]+)\s*', re.UNICODE)
 
 
+class _TextTail:
+    """Mirror of the last characters of the output text.
+
+    The formatter keeps one up to date as actions are rendered, and each
+    formatted translation holds a snapshot of it (so instances must be
+    treated as immutable), allowing retrospective queries to be answered
+    without re-rendering past translations.
+
+    The mirror is bounded: when its text grows over MAX_SIZE characters,
+    it is trimmed to the last TRIM_SIZE characters (on a fragment boundary
+    when possible) and flagged as truncated.
+    """
+
+    __slots__ = ('text', 'truncated', '_fragments')
+
+    MAX_SIZE = 1024
+    TRIM_SIZE = 512
+
+    TRIM_RX = re.compile(r'\s\S')
+
+    def __init__(self, text='', truncated=False):
+        self.text = text
+        self.truncated = truncated
+        self._fragments = None
+
+    @classmethod
+    def render(cls, tail, action):
+        """Return the mirror resulting from rendering <action> after <tail>.
+
+        Note: <tail> is None if there are no previous actions.
+        """
+        if tail is None:
+            text, truncated = '', False
+        elif action.text is None and not action.prev_replace:
+            return tail
+        else:
+            text, truncated = tail.text, tail.truncated
+            if action.text is not None and not action.prev_attach:
+                text += action.space_char
+        if action.prev_replace:
+            text = text[:-len(action.prev_replace)]
+        if action.text:
+            text += action.text
+        if len(text) > cls.MAX_SIZE:
+            m = cls.TRIM_RX.search(text, len(text) - cls.TRIM_SIZE)
+            text = text[-cls.TRIM_SIZE:] if m is None else text[m.start() + 1:]
+            truncated = True
+        return cls(text, truncated)
+
+    def fragments(self):
+        """Return the list of text fragments (last first)."""
+        if self._fragments is None:
+            fragments = RetroFormatter.FRAGMENT_RX.findall(self.text)
+            if not self.truncated:
+                # Leading whitespace is not part of the first fragment.
+                if fragments[0].isspace():
+                    del fragments[0]
+                else:
+                    fragments[0] = fragments[0].lstrip()
+            fragments.reverse()
+            self._fragments = fragments
+        return self._fragments
+
+    def __str__(self):
+        return '_TextTail(%r%s)' % (self.text, ', truncated' if self.truncated else '')
+
+    __repr__ = __str__
+
+
 class RetroFormatter:
     """Helper for iterating over the result of previous translations.
 
@@ -109,40 +183,33 @@ class RetroFormatter:
             for action in reversed(translation.formatting):
                 yield action
 
+    def text_tail(self):
+        """Return a mirror of the output text, or None if there's no output.
+
+        The snapshot saved on the last translation by the formatter is
+        used when available, otherwise it is rendered from the actions.
+        """
+        translations = self.previous_translations
+        if translations:
+            tail = getattr(translations[-1], 'text_tail', None)
+            if tail is not None:
+                return tail
+        tail = None
+        for translation in translations:
+            for action in translation.formatting:
+                tail = _TextTail.render(tail, action)
+        return tail
+
     def iter_last_fragments(self):
         """Iterate over last text fragments (last first).
 
         A text fragment is a series of non-whitespace characters
         followed by zero or more trailing whitespace characters.
         """
-        replace = 0
-        next_action = None
-        current_fragment = ''
-        for action in self.iter_last_actions():
-            part = '' if action.text is None else action.text
-            if next_action is not None and \
-               next_action.text is not None and \
-               not next_action.prev_attach:
-                part += next_action.space_char
-            if replace:
-                # Ignore replaced content.
-                if len(part) > replace:
-                    part = part[:-replace]
-                    replace = 0
-                else:
-                    replace -= len(part)
-                    part = ''
-            if part:
-                # Find out new complete fragments.
-                fragments = self.FRAGMENT_RX.findall(part + current_fragment)
-                for f in reversed(fragments[1:]):
-                    yield f
-                current_fragment = fragments[0]
-            replace += len(action.prev_replace)
-            next_action = action
-        # Don't forget to process the current (first) fragment.
-        if not current_fragment.isspace():
-            yield current_fragment.lstrip()
+        tail = self.text_tail()
+        if tail is None:
+            tail = _TextTail()
+        return iter(tail.fragments())
 
     def last_fragments(self, count=1):
         """Return the last <count> text fragments."""
@@ -203,6 +270,8 @@ class _Context(RetroFormatter):
         assert last_action is not None
         self.last_action = last_action
         self.translated_actions = []
+        self._text_tail = None
+        self._text_tail_actions = None
 
     def new_action(self):
         """Create a new action, only copying global state."""
@@ -225,6 +294,22 @@ class _Context(RetroFormatter):
         for action in super().iter_last_actions():
             yield action
 
+    def text_tail(self):
+        """Custom version with support for newly translated actions.
+
+        The mirror is only updated with the actions translated since
+        the last call.
+        """
+        if self._text_tail_actions is None:
+            self._text_tail = super().text_tail()
+            self._text_tail_actions = 0
+        tail = self._text_tail
+        for action in self.translated_actions[self._text_tail_actions:]:
+            tail = _TextTail.render(tail, action)
+        self._text_tail = tail
+        self._text_tail_actions = len(self.translated_actions)
+        return tail
+
 
 class Formatter:
     """Convert translations into output.
@@ -288,6 +373,7 @@ class Formatter:
         # before the output or after the output
         self.spaces_after = bool(s == 'After Output')
 
+    @traced('Formatter.format')
     def format(self, undo, do, prev):
         """Format the given translations.
 
@@ -326,6 +412,7 @@ class Formatter:
                     t.formatting = _translation_to_actions(t.english, ctx)
                 else:
                     t.formatting = _raw_to_actions(t.rtfcre[0], ctx)
+                t.text_tail = ctx.text_tail()
             new = ctx.translated_actions
         else:
             new = []
@@ -441,6 +528,7 @@ class OutputHelper:
         self.before = TextFormatter(before_spaces_after)
         self.after = TextFormatter(after_spaces_after)
 
+    @traced('OutputHelper.flush')
     def flush(self):
         # FIXME:
         # - what about things like emoji zwj sequences?
@@ -597,19 +685,9 @@ def _translation_to_actions(translation, ctx):
     Returns: A list of actions.
 
     """
-    # Reduce the translation to atoms. An atom is an irreducible string that is
-    # either entirely a single meta command or entirely text containing no meta
-    # commands.
-    if translation.isdigit():
-        # If a translation is only digits then glue it to neighboring digits.
-        atoms = [_glue_translation(translation)]
-    else:
-        atoms = filter(None, (
-            x.strip(' ') for x in META_RE.findall(translation))
-        )
     action_list = []
-    for atom in atoms:
-        action = _atom_to_action(atom, ctx)
+    for parsed_atom in _parse_translation(translation):
+        action = _parsed_atom_to_action(parsed_atom, ctx)
         action_list.append(action)
         ctx.translated(action)
     if not action_list:
@@ -647,6 +725,86 @@ def _raw_to_actions(stroke, ctx):
     return [action]
 
 
+@lru_cache(maxsize=PARSED_TRANSLATIONS_CACHE_SIZE)
+def _parse_translation(translation):
+    """Reduce a translation to a tuple of parsed atoms.
+
+    An atom is an irreducible string that is either entirely a single
+    meta command or entirely text containing no meta commands. Parsing
+    only depends on the translation string, so the result is cached:
+    use `_parse_translation.cache_info()` for hit/miss statistics.
+
+    """
+    if translation.isdigit():
+        # If a translation is only digits then glue it to neighboring digits.
+        atoms = [_glue_translation(translation)]
+    else:
+        atoms = filter(None, (
+            x.strip(' ') for x in META_RE.findall(translation))
+        )
+    return tuple(map(_parse_atom, atoms))
+
+
+def has_engine_command(translation):
+    """Return True if the translation contains an engine command (`{PLOVER:...}`)."""
+    return any(handler is _apply_meta_command
+               for handler, argument in _parse_translation(translation))
+
+
+def _parse_atom(atom):
+    """Classify an atom.
+
+    Arguments:
+
+    atom -- A string holding an atom.
+
+    Returns: a `(handler, argument)` pair, with `handler(argument, ctx)`
+    creating the (not yet finalized) action for the atom.
+
+    """
+    meta = _get_meta(atom)
+    if meta is None:
+        return _apply_text, _unescape_atom(atom)
+    meta = _unescape_atom(meta)
+    if meta in META_COMMAS:
+        return _apply_meta_comma, meta
+    if meta in META_STOPS:
+        return _apply_meta_stop, meta
+    if meta == META_CAPITALIZE:
+        return _apply_meta_case, CASE_CAP_FIRST_WORD
+    if meta == META_LOWER:
+        return _apply_meta_case, CASE_LOWER_FIRST_CHAR
+    if meta == META_UPPER:
+        return _apply_meta_case, CASE_UPPER_FIRST_WORD
+    if meta == META_RETRO_CAPITALIZE:
+        return _apply_meta_retro_case, CASE_CAP_FIRST_WORD
+    if meta == META_RETRO_LOWER:
+        return _apply_meta_retro_case, CASE_LOWER_FIRST_CHAR
+    if meta == META_RETRO_UPPER:
+        return _apply_meta_retro_case, CASE_UPPER_FIRST_WORD
+    if (meta.startswith(META_CARRY_CAPITALIZATION) or
+        meta.startswith(META_ATTACH_FLAG + META_CARRY_CAPITALIZATION)):
+        return _apply_meta_carry_capitalize, meta
+    if meta.startswith(META_RETRO_FORMAT):
+        return _apply_meta_currency, meta
+    if meta.startswith(META_COMMAND):
+        return _apply_meta_command, meta
+    if meta.startswith(META_MODE):
+        return _apply_meta_mode, meta
+    if meta.startswith(META_GLUE_FLAG):
+        return _apply_meta_glue, meta
+    if (meta.startswith(META_ATTACH_FLAG) or
+        meta.endswith(META_ATTACH_FLAG)):
+        return _apply_meta_attach, meta
+    if meta.startswith(META_KEY_COMBINATION):
+        return _apply_meta_combo, meta
+    if meta.startswith(META_CUSTOM):
+        meta_args = meta[1:].split(':', 1)
+        return _apply_meta_custom, (meta_args[0],
+                                    meta_args[1] if len(meta_args) == 2 else '')
+    return _apply_meta_unknown, meta
+
+
 def _atom_to_action(atom, ctx):
     """Convert an atom into an action.
 
@@ -661,50 +819,13 @@ def _atom_to_action(atom, ctx):
     Returns: An action for the atom.
 
     """
-    meta = _get_meta(atom)
-    if meta is not None:
-        meta = _unescape_atom(meta)
-        if meta in META_COMMAS:
-            action = _apply_meta_comma(meta, ctx)
-        elif meta in META_STOPS:
-            action = _apply_meta_stop(meta, ctx)
-        elif meta == META_CAPITALIZE:
-            action = _apply_meta_case(CASE_CAP_FIRST_WORD, ctx)
-        elif meta == META_LOWER:
-            action = _apply_meta_case(CASE_LOWER_FIRST_CHAR, ctx)
-        elif meta == META_UPPER:
-            action = _apply_meta_case(CASE_UPPER_FIRST_WORD, ctx)
-        elif meta == META_RETRO_CAPITALIZE:
-            action = _apply_meta_retro_case(CASE_CAP_FIRST_WORD, ctx)
-        elif meta == META_RETRO_LOWER:
-            action = _apply_meta_retro_case(CASE_LOWER_FIRST_CHAR, ctx)
-        elif meta == META_RETRO_UPPER:
-            action = _apply_meta_retro_case(CASE_UPPER_FIRST_WORD, ctx)
-        elif (meta.startswith(META_CARRY_CAPITALIZATION) or
-              meta.startswith(META_ATTACH_FLAG + META_CARRY_CAPITALIZATION)):
-            action = _apply_meta_carry_capitalize(meta, ctx)
-        elif meta.startswith(META_RETRO_FORMAT):
-            action = _apply_meta_currency(meta, ctx)
-        elif meta.startswith(META_COMMAND):
-            action = _apply_meta_command(meta, ctx)
-        elif meta.startswith(META_MODE):
-            action = _apply_meta_mode(meta, ctx)
-        elif meta.startswith(META_GLUE_FLAG):
-            action = _apply_meta_glue(meta, ctx)
-        elif (meta.startswith(META_ATTACH_FLAG) or
-              meta.endswith(META_ATTACH_FLAG)):
-            action = _apply_meta_attach(meta, ctx)
-        elif meta.startswith(META_KEY_COMBINATION):
-            action = _apply_meta_combo(meta, ctx)
-        elif meta.startswith(META_CUSTOM):
-            meta_args = meta[1:].split(':', 1)
-            meta_fn = registry.get_plugin('meta', meta_args[0]).obj
-            action = meta_fn(ctx, meta_args[1] if len(meta_args) == 2 else '')
-        else:
-            action = ctx.new_action()
-    else:
-        action = ctx.new_action()
-        action.text = _unescape_atom(atom)
+    return _parsed_atom_to_action(_parse_atom(atom), ctx)
+
+
+def _parsed_atom_to_action(parsed_atom, ctx):
+    """Convert a parsed atom (see `_parse_atom`) into an action."""
+    handler, argument = parsed_atom
+    action = handler(argument, ctx)
     # Finalize action's text.
     text = action.text
     if text is not None:
@@ -729,6 +850,22 @@ def _atom_to_action(atom, ctx):
     return action
 
 
+def _apply_text(text, ctx):
+    action = ctx.new_action()
+    action.text = text
+    return action
+
+
+def _apply_meta_unknown(meta, ctx):
+    return ctx.new_action()
+
+
+def _apply_meta_custom(meta_args, ctx):
+    name, args = meta_args
+    meta_fn = registry.get_plugin('meta', name).obj
+    return meta_fn(ctx, args)
+
+
 def _apply_meta_attach(meta, ctx):
     action = ctx.new_action()
     begin = meta.startswith(META_ATTACH_FLAG)
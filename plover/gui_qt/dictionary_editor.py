@@ -1,7 +1,9 @@
 
-from operator import attrgetter, itemgetter
 from collections import namedtuple
-from itertools import chain
+from functools import partial
+from heapq import merge
+from itertools import chain, islice
+from operator import itemgetter
 
 from PyQt5.QtCore import (
     QAbstractTableModel,
@@ -24,6 +26,9 @@ from plover.gui_qt.utils import ToolBar, WindowState
 
 _COL_STENO, _COL_TRANS, _COL_DICT, _COL_COUNT = range(3 + 1)
 
+# Number of rows loaded at once when the view needs more.
+_FETCH_SIZE = 256
+
 
 class DictionaryItem(namedtuple('DictionaryItem', 'strokes translation dictionary')):
 
@@ -52,29 +57,121 @@ class DictionaryItemDelegate(QStyledItemDelegate):
 
 
 class DictionaryItemModel(QAbstractTableModel):
+    """ Table of the entries of several dictionaries.
+
+    Entries are not all loaded at once: rows are produced on demand (see
+    fetchMore) from the sorted orders of the dictionaries, merged together:
+    the index of their keys for the strokes order, and their reverse
+    dictionary for the translations order (case insensitive). Filtering
+    on the sorted column only walks the range of entries with this prefix.
+    Those orders are walked lazily, a chunk at a time (see _walk).
+    """
 
     def __init__(self, dictionary_list, sort_column, sort_order):
         super().__init__()
         self._dictionary_list = dictionary_list
         self._operations = []
+        # Loaded rows.
         self._entries = []
+        # Iterator over the rows not loaded yet (None when exhausted).
+        self._pending = None
+        # Entries added or changed through the model, shown out of order,
+        # and so skipped when loading the other rows: (dictionary path, strokes).
+        self._shown = set()
+        self._strokes_filter = None
+        self._translation_filter = None
         self._sort_column = sort_column
         self._sort_order = sort_order
         self._update_entries()
 
-    def _update_entries(self, strokes_filter=None, translation_filter=None):
-        self._entries = []
-        for dictionary in self._dictionary_list:
-            for strokes, translation in dictionary.items():
-                if strokes_filter is not None and \
-                   not '/'.join(strokes).startswith(strokes_filter):
+    @staticmethod
+    def _walk(items_fn, descending):
+        """ Return an iterator over the (sort key, dictionary key) items returned by <items_fn>,
+            called to get at most `_FETCH_SIZE` items at a time, each time resuming after the
+            last key: the dictionary may be modified between two calls. """
+        after = None
+        while True:
+            chunk = list(islice(items_fn(after=after, reverse=descending), _FETCH_SIZE))
+            yield from chunk
+            if len(chunk) < _FETCH_SIZE:
+                return
+            after = chunk[-1][1]
+
+    def _steno_rows(self, dictionary, descending):
+        """ Return an iterator over the (sort key, item) rows of <dictionary>, in strokes order. """
+        strokes_filter, translation_filter = self._strokes_filter, self._translation_filter
+        order = self._walk(partial(dictionary.prefix_key_items, strokes_filter or ''), descending)
+        for joined, strokes in order:
+            # Skip entries deleted since.
+            translation = dictionary.get(strokes)
+            if translation is None:
+                continue
+            if translation_filter and not translation.startswith(translation_filter):
+                continue
+            yield joined, DictionaryItem(strokes, translation, dictionary)
+
+    def _translation_rows(self, dictionary, descending):
+        """ Return an iterator over the (sort key, item) rows of <dictionary>, in translations order. """
+        strokes_filter, translation_filter = self._strokes_filter, self._translation_filter
+        order = self._walk(partial(dictionary.reverse.prefix_items, translation_filter or ''), descending)
+        for simkey, translation in order:
+            if translation_filter and not translation.startswith(translation_filter):
+                continue
+            entries = sorted(('/'.join(strokes), strokes)
+                             for strokes in dictionary.reverse_lookup(translation))
+            if descending:
+                entries.reverse()
+            for joined, strokes in entries:
+                if strokes_filter and not joined.startswith(strokes_filter):
                     continue
-                if translation_filter is not None and \
-                   not translation.startswith(translation_filter):
-                    continue
-                item = DictionaryItem(strokes, translation, dictionary)
-                self._entries.append(item)
-        self.sort(self._sort_column, self._sort_order)
+                yield (simkey, translation, joined), DictionaryItem(strokes, translation, dictionary)
+
+    def _update_entries(self):
+        self._shown = set()
+        descending = self._sort_order == Qt.DescendingOrder
+        if self._sort_column == _COL_DICT:
+            dictionary_list = sorted(self._dictionary_list,
+                                     key=lambda dictionary: dictionary.path,
+                                     reverse=descending)
+            rows = chain.from_iterable(self._steno_rows(dictionary, False)
+                                       for dictionary in dictionary_list)
+        else:
+            if self._sort_column == _COL_TRANS:
+                dictionary_rows = self._translation_rows
+            else:
+                dictionary_rows = self._steno_rows
+            rows = merge(*(dictionary_rows(dictionary, descending)
+                           for dictionary in self._dictionary_list),
+                         key=itemgetter(0), reverse=descending)
+        self._pending = map(itemgetter(1), rows)
+        self._entries = self._fetch(_FETCH_SIZE)
+
+    def _fetch(self, count):
+        """ Return the next <count> rows not loaded yet. """
+        items = []
+        for item in self._pending:
+            if self._shown and (item.dictionary.path, item.strokes) in self._shown:
+                continue
+            items.append(item)
+            if len(items) >= count:
+                break
+        else:
+            self._pending = None
+        return items
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._pending is not None
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self._pending is None:
+            return
+        items = self._fetch(_FETCH_SIZE)
+        if not items:
+            return
+        row = len(self._entries)
+        self.beginInsertRows(QModelIndex(), row, row + len(items) - 1)
+        self._entries.extend(items)
+        self.endInsertRows()
 
     @property
     def has_undo(self):
@@ -121,6 +218,7 @@ class DictionaryItemModel(QAbstractTableModel):
             return
         if new_item is None:
             # Undo deletion.
+            old_item.dictionary[old_item.strokes] = old_item.translation
             self.new_row(0, item=old_item, record=False)
             return
         # Undo update.
@@ -128,6 +226,7 @@ class DictionaryItemModel(QAbstractTableModel):
             del new_item.dictionary[new_item.strokes]
         except KeyError:
             pass
+        old_item.dictionary[old_item.strokes] = old_item.translation
         try:
             row = self._entries.index(new_item)
         except ValueError:
@@ -136,8 +235,8 @@ class DictionaryItemModel(QAbstractTableModel):
             # the result of the undo.
             self.new_row(0, item=old_item, record=False)
         else:
-            old_item.dictionary[old_item.strokes] = old_item.translation
             self._entries[row] = old_item
+            self._shown.add((old_item.dictionary.path, old_item.strokes))
             self.dataChanged.emit(self.index(row, _COL_STENO),
                                   self.index(row, _COL_TRANS))
 
@@ -187,21 +286,18 @@ class DictionaryItemModel(QAbstractTableModel):
         return f
 
     def filter(self, strokes_filter=None, translation_filter=None):
-        self.modelAboutToBeReset.emit()
-        self._update_entries(strokes_filter, translation_filter)
-        self.modelReset.emit()
+        self.beginResetModel()
+        self._strokes_filter = strokes_filter
+        self._translation_filter = translation_filter
+        self._update_entries()
+        self.endResetModel()
 
     def sort(self, column, order):
-        self.layoutAboutToBeChanged.emit()
-        if column == _COL_DICT:
-            key = attrgetter('dictionary_path')
-        else:
-            key = itemgetter(column)
-        self._entries.sort(key=key,
-                           reverse=(order == Qt.DescendingOrder))
+        self.beginResetModel()
         self._sort_column = column
         self._sort_order = order
-        self.layoutChanged.emit()
+        self._update_entries()
+        self.endResetModel()
 
     def setData(self, index, value, role=Qt.EditRole, record=True):
         assert role == Qt.EditRole
@@ -235,6 +331,7 @@ class DictionaryItemModel(QAbstractTableModel):
                 old_item = None
         new_item = DictionaryItem(strokes, translation, dictionary)
         self._entries[row] = new_item
+        self._shown.add((dictionary.path, strokes))
         dictionary[strokes] = translation
         if record:
             self._operations.append((old_item, new_item))
@@ -250,6 +347,7 @@ class DictionaryItemModel(QAbstractTableModel):
             item = DictionaryItem((), '', dictionary)
         self.beginInsertRows(QModelIndex(), row, row)
         self._entries.insert(row, item)
+        self._shown.add((item.dictionary.path, item.strokes))
         if record:
             self._operations.append((None, item))
         self.endInsertRows()
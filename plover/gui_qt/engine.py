@@ -27,6 +27,7 @@ class Engine(StenoEngine, QThread):
     signal_configure = pyqtSignal()
     signal_lookup = pyqtSignal()
     signal_quit = pyqtSignal()
+    signal_latency_updated = pyqtSignal(QVariant)
 
     def __init__(self, config, keyboard_emulation):
         StenoEngine.__init__(self, config, keyboard_emulation)
@@ -1,7 +1,8 @@
 
-from PyQt5.QtCore import QEvent, Qt
+from PyQt5.QtCore import QEvent, QVariant, Qt, pyqtSignal
 
 from plover.config import DEFAULT_SEARCH_WORD_LIMIT
+from plover.suggestions import SearchWorker
 from plover.translation import unescape_translation
 
 from plover.gui_qt.lookup_dialog_ui import Ui_LookupDialog
@@ -21,10 +22,25 @@ class LookupDialog(Tool, Ui_LookupDialog):
     ROLE = 'lookup'
     SHORTCUT = 'Ctrl+L'
 
+    # Search results, from the search worker thread.
+    search_done = pyqtSignal(int, QVariant)
+
     def __init__(self, engine):
         super().__init__(engine)
         self.setupUi(self)
         self._word_limit = DEFAULT_SEARCH_WORD_LIMIT
+        # Current search, and cursor for its next page of results.
+        self._translation = None
+        self._search = None
+        self._search_id = None
+        self._next_page = False
+        self._cursor = None
+        self.suggestions.end_reached.connect(self.on_suggestions_end_reached)
+        # Search in the background, so slow searches don't freeze the dialog.
+        self.search_done.connect(self.on_search_done)
+        self._search_worker = SearchWorker(engine, self.search_done.emit)
+        self._search_worker.start()
+        self.finished.connect(self._search_worker.stop)
         engine.signal_connect('config_changed', self.on_config_changed)
         self.on_config_changed(engine.config)
         self.pattern.installEventFilter(self)
@@ -53,11 +69,34 @@ class LookupDialog(Tool, Ui_LookupDialog):
         # Wherever a character is typed or a checkbox is changed, refresh the lookup results.
         # TODO: preserve the state of search mode checkboxes?
         translation = unescape_translation(pattern.strip())
-        suggestion_list = self._engine.get_suggestions(translation,
-                                                       count=self._word_limit,
-                                                       partial=self.partialCheck.isChecked(),
-                                                       regex=self.regexCheck.isChecked())
-        self._update_suggestions(suggestion_list)
+        self._search = dict(partial=self.partialCheck.isChecked(),
+                            regex=self.regexCheck.isChecked(),
+                            substring=self.substringCheck.isChecked(),
+                            fuzzy=self.fuzzyCheck.isChecked())
+        self._translation = translation
+        self._cursor = None
+        self._search_id = self._search_worker.find_page(translation, count=self._word_limit, **self._search)
+        self._next_page = False
+
+    def on_suggestions_end_reached(self):
+        # Lazily fetch the next page of results when scrolling to the end.
+        if self._cursor is None:
+            return
+        self._search_id = self._search_worker.find_page(self._translation, count=self._word_limit,
+                                                        cursor=self._cursor, **self._search)
+        self._next_page = True
+        # Don't request the same page again while waiting for it.
+        self._cursor = None
+
+    def on_search_done(self, search_id, result):
+        if search_id != self._search_id:
+            # Superseded search.
+            return
+        suggestion_list, self._cursor = result
+        if self._next_page:
+            self.suggestions.append(suggestion_list, keep_position=True)
+        else:
+            self._update_suggestions(suggestion_list)
 
     def on_search_mode_changed(self, state):
         self.on_lookup(self.pattern.text())
@@ -1,7 +1,5 @@
 
-import re
-
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QVariant, Qt, pyqtSignal
 from PyQt5.QtGui import (
     QCursor,
     QFont,
@@ -13,7 +11,7 @@ from PyQt5.QtWidgets import (
 )
 
 from plover.config import DEFAULT_SEARCH_WORD_LIMIT
-from plover.suggestions import Suggestion
+from plover.suggestions import WORD_RX, SearchWorker, Suggestion
 from plover.formatting import RetroFormatter
 
 from plover.gui_qt.suggestions_dialog_ui import Ui_SuggestionsDialog
@@ -34,7 +32,10 @@ class SuggestionsDialog(Tool, Ui_SuggestionsDialog):
     ROLE = 'suggestions'
     SHORTCUT = 'Ctrl+J'
 
-    WORD_RX = re.compile(r'(?:\w+|[^\w\s]+)\s*')
+    WORD_RX = WORD_RX
+
+    # Search results, from the search worker thread.
+    search_done = pyqtSignal(int, QVariant)
 
     STYLE_TRANSLATION, STYLE_STROKES = range(2)
 
@@ -49,6 +50,14 @@ class SuggestionsDialog(Tool, Ui_SuggestionsDialog):
         self.setupUi(self)
         self._last_suggestions = None
         self._word_limit = DEFAULT_SEARCH_WORD_LIMIT
+        # Search in the background, without delay (but skipping
+        # searches superseded by newer output before they start).
+        self._search_id = None
+        self._search_words = None
+        self.search_done.connect(self.on_search_done)
+        self._search_worker = SearchWorker(engine, self.search_done.emit, delay=0)
+        self._search_worker.start()
+        self.finished.connect(self._search_worker.stop)
         # Toolbar.
         self.layout().addWidget(ToolBar(
             self.action_ToggleOnTop,
@@ -106,19 +115,6 @@ class SuggestionsDialog(Tool, Ui_SuggestionsDialog):
         self.suggestions.append(suggestion_list)
         self.action_Clear.setEnabled(True)
 
-    @staticmethod
-    def tails(ls):
-        ''' Return all tail combinations (a la Haskell)
-
-            tails :: [x] -> [[x]]
-            >>> tails('abcd')
-            ['abcd', 'bcd', 'cd', d']
-
-        '''
-
-        for i in range(len(ls)):
-            yield ls[i:]
-
     def on_translation(self, old, new):
 
         # Check for new output.
@@ -134,10 +130,14 @@ class SuggestionsDialog(Tool, Ui_SuggestionsDialog):
             retro_formatter = RetroFormatter(last_translations)
             split_words = retro_formatter.last_words(self._word_limit, rx=self.WORD_RX)
 
-        suggestion_list = []
-        for phrase in self.tails(split_words):
-            phrase = ''.join(phrase)
-            suggestion_list.extend(self._engine.get_suggestions(phrase))
+        self._search_words = split_words
+        self._search_id = self._search_worker.find_phrases(split_words)
+
+    def on_search_done(self, search_id, suggestion_list):
+        if search_id != self._search_id:
+            # Superseded search.
+            return
+        split_words = self._search_words
 
         if not suggestion_list and split_words:
             suggestion_list = [Suggestion(split_words[-1], [])]
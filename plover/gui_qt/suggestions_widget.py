@@ -1,3 +1,4 @@
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtGui import (
     QFont,
     QTextCursor,
@@ -15,6 +16,9 @@ class SuggestionsWidget(QWidget, Ui_SuggestionsWidget):
 
     STYLE_TRANSLATION, STYLE_STROKES = range(2)
 
+    # Emitted when the view is scrolled to the end of the suggestions.
+    end_reached = pyqtSignal()
+
     # Anatomy of the text document:
     # - "root":
     #  - 0+ "suggestions" blocks
@@ -28,6 +32,12 @@ class SuggestionsWidget(QWidget, Ui_SuggestionsWidget):
         self._translation_char_format = QTextCharFormat()
         self._strokes_char_format = QTextCharFormat()
         self._strokes_char_format.font().setStyleHint(QFont.Monospace)
+        self.suggestions.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    def _on_scroll(self, value):
+        # Note: ignore the value being reset when the suggestions are cleared.
+        if value > 0 and value == self.suggestions.verticalScrollBar().maximum():
+            self.end_reached.emit()
 
     def set_stroke_limit(self, limit):
         self._stroke_limit = limit
@@ -6,12 +6,13 @@
 
 """Base classes for machine types. Do not use directly."""
 
-import binascii
 import threading
+import time
 
 import serial
 
 from plover import log
+from plover.machine.framing import FixedSize, FrameReader
 from plover.machine.keymap import Keymap
 from plover.misc import boolean
 
@@ -39,6 +40,7 @@ class StenotypeBase:
         self.keymap = Keymap(keys, keys)
         self.keymap.set_mappings(zip(keys, keys))
         self.stroke_subscribers = []
+        self.stroke_batch_subscribers = []
         self.state_subscribers = []
         self.state = STATE_STOPPED
 
@@ -54,16 +56,25 @@ class StenotypeBase:
         """Stop listening for output from the stenotype machine."""
         pass
 
-    def add_stroke_callback(self, callback):
+    def add_stroke_callback(self, callback, batch=False):
         """Subscribe to output from the stenotype machine.
 
-        Argument:
+        Arguments:
 
         callback -- The function to call whenever there is output from
         the stenotype machine and output is being captured.
 
+        batch -- If true, the callback is called with a list of strokes
+        (each a list of keys) instead of being called for each stroke:
+        so strokes delivered together by the machine (e.g. after a stall)
+        can be processed at once. The time the strokes were received at
+        (see `time.perf_counter`) is passed as second argument.
+
         """
-        self.stroke_subscribers.append(callback)
+        if batch:
+            self.stroke_batch_subscribers.append(callback)
+        else:
+            self.stroke_subscribers.append(callback)
 
     def remove_stroke_callback(self, callback):
         """Unsubscribe from output from the stenotype machine.
@@ -73,7 +84,10 @@ class StenotypeBase:
         callback -- A function that was previously subscribed.
 
         """
-        self.stroke_subscribers.remove(callback)
+        if callback in self.stroke_batch_subscribers:
+            self.stroke_batch_subscribers.remove(callback)
+        else:
+            self.stroke_subscribers.remove(callback)
 
     def add_state_callback(self, callback):
         self.state_subscribers.append(callback)
@@ -83,8 +97,18 @@ class StenotypeBase:
 
     def _notify(self, steno_keys):
         """Invoke the callback of each subscriber with the given argument."""
+        self._notify_strokes([steno_keys])
+
+    def _notify_strokes(self, strokes):
+        """Invoke the callback of each subscriber with a batch of strokes."""
+        if not strokes:
+            return
+        timestamp = time.perf_counter()
         for callback in self.stroke_subscribers:
-            callback(steno_keys)
+            for steno_keys in strokes:
+                callback(steno_keys)
+        for callback in self.stroke_batch_subscribers:
+            callback(strokes, timestamp)
 
     def set_suppression(self, enabled):
         '''Enable keyboard suppression.
@@ -177,6 +201,9 @@ class SerialStenotypeBase(ThreadedStenotypeBase):
 
     """
 
+    # Framing rule of the protocol (see `plover.machine.framing`).
+    FRAMING = None
+
     # Default serial parameters.
     SERIAL_PARAMS = {
         'port': None,
@@ -245,32 +272,40 @@ class SerialStenotypeBase(ThreadedStenotypeBase):
             for setting, default in cls.SERIAL_PARAMS.items()
         }
 
-    def _iter_packets(self, packet_size):
-        """Yield packets of <packets_size> bytes until the machine is stopped.
+    def _iter_frames(self, framing=None):
+        """Yield lists of frames read using <framing> (default: `FRAMING`),
+        until the machine is stopped.
+
+        Each list contains the frames completed by a single read (and may be
+        empty). Frames are `memoryview` objects, only valid until the next
+        iteration.
 
         N.B.: to workaround the fact that the Toshiba Bluetooth stack
         on Windows does not correctly handle the read timeout setting
         (returning immediately if some data is already available):
-        - the effective timeout is re-configured to <timeout/packet_size>
-        - multiple reads are  done (until a packet is complete)
-        - an incomplete packet will only be discarded if one of
+        - for fixed size frames, the effective timeout is re-configured
+          to <timeout/frame_size>
+        - multiple reads are done (until a frame is complete)
+        - an incomplete frame will only be discarded if one of
           those reads return no data (but not on short read)
         """
-        self.serial_port.timeout = max(
-            self.serial_params.get('timeout', 1.0) / packet_size,
-            0.01,
-        )
-        packet = b''
+        if framing is None:
+            framing = self.FRAMING
+        frame_size = getattr(framing, 'size', None)
+        if frame_size is not None:
+            self.serial_port.timeout = max(
+                self.serial_params.get('timeout', 1.0) / frame_size,
+                0.01,
+            )
+        reader = FrameReader(self.serial_port, framing)
         while not self.finished.isSet():
-            raw = self.serial_port.read(packet_size - len(packet))
-            if not raw:
-                if packet:
-                    log.error('discarding incomplete packet: %s',
-                              binascii.hexlify(packet))
-                packet = b''
-                continue
-            packet += raw
-            if len(packet) != packet_size:
-                continue
-            yield packet
-            packet = b''
+            yield reader.read_frames()
+
+    def _iter_packets(self, packet_size):
+        """Yield packets of <packets_size> bytes until the machine is stopped.
+
+        See `_iter_frames` for details.
+        """
+        for frames in self._iter_frames(FixedSize(packet_size)):
+            for frame in frames:
+                yield bytes(frame)
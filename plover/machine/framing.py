@@ -0,0 +1,182 @@
+"""Framing of serial stenotype protocols.
+
+A protocol declares its framing rule (fixed size frames, sync bit,
+terminator, ...), and a `FrameReader` uses it to split the data read
+from the serial port into frames.
+
+Data is read into a preallocated buffer (using `readinto`), and frames
+are returned as `memoryview` slices of that buffer: so no allocation is
+needed for each read. Unprocessed data is only moved back to the start
+of the buffer when the space left at the end runs low.
+"""
+
+import binascii
+
+from plover import log
+
+
+# What to do with an incomplete frame when a read times out:
+# - discard it
+TIMEOUT_DISCARD = 'discard'
+# - consider the frame complete
+TIMEOUT_FLUSH = 'flush'
+# - keep waiting for the rest of the frame
+TIMEOUT_KEEP = 'keep'
+
+
+class FixedSize:
+    """ Frames of <size> bytes. """
+
+    def __init__(self, size, timeout_policy=TIMEOUT_DISCARD):
+        self.size = size
+        self.timeout_policy = timeout_policy
+
+    def split(self, data, start, end):
+        """ Find the first frame in <data[start:end]>.
+
+        Return `(frame_start, frame_end)`: data before <frame_start> is
+        invalid (and will be discarded), <frame_end> is None if the frame
+        is not complete yet.
+        """
+        if end - start < self.size:
+            return start, None
+        return start, start + self.size
+
+
+class SyncBit(FixedSize):
+    """ Frames of <size> bytes, where only the first byte has the sync bit (<mask>) set.
+
+    On invalid data, the stream is resynchronized on the next byte with the
+    sync bit set (instead of discarding a whole frame).
+    """
+
+    def __init__(self, size, mask=0x80, timeout_policy=TIMEOUT_DISCARD):
+        super().__init__(size, timeout_policy)
+        self.mask = mask
+
+    def split(self, data, start, end):
+        size, mask = self.size, self.mask
+        while start < end:
+            if not data[start] & mask:
+                start += 1
+                continue
+            frame_end = start + 1
+            while frame_end < end and frame_end - start < size and not data[frame_end] & mask:
+                frame_end += 1
+            if frame_end - start == size:
+                return start, frame_end
+            if frame_end == end:
+                # Incomplete frame.
+                break
+            # Sync bit in the middle of the frame: resynchronize on it.
+            start = frame_end
+        return start, None
+
+
+class Terminator:
+    """ Frames ending with the <terminator> byte, at most <max_size> bytes long. """
+
+    def __init__(self, terminator, max_size=1024, timeout_policy=TIMEOUT_KEEP):
+        self.terminator = terminator
+        self.max_size = max_size
+        self.timeout_policy = timeout_policy
+
+    def split(self, data, start, end):
+        frame_end = data.find(self.terminator, start, min(end, start + self.max_size))
+        if frame_end >= 0:
+            return start, frame_end + len(self.terminator)
+        if end - start >= self.max_size:
+            # Too long: discard.
+            return end, None
+        return start, None
+
+
+class IncreasingRank:
+    """ Variable size frames of bytes with increasing ranks (as computed by
+        <rank>): a frame ends before a byte not ranked higher than the previous
+        one, or after a byte of <last_rank>. Since the end of a frame cannot
+        be known until the next one starts, incomplete frames are flushed on
+        read timeouts.
+    """
+
+    def __init__(self, rank, last_rank, timeout_policy=TIMEOUT_FLUSH):
+        self.rank = rank
+        self.last_rank = last_rank
+        self.timeout_policy = timeout_policy
+
+    def split(self, data, start, end):
+        rank, last_rank = self.rank, self.last_rank
+        previous_rank = None
+        for frame_end in range(start, end):
+            r = rank(data[frame_end])
+            if previous_rank is not None and r <= previous_rank:
+                return start, frame_end
+            if r == last_rank:
+                return start, frame_end + 1
+            previous_rank = r
+        return start, None
+
+
+class FrameReader:
+    """ Read frames from a serial port, according to a framing rule. """
+
+    def __init__(self, port, framing, buffer_size=4096):
+        self.port = port
+        self.framing = framing
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        # Unprocessed data: [start:end].
+        self._start = 0
+        self._end = 0
+
+    def _discard(self, count, message):
+        start = self._start
+        log.error('%s: %s', message, binascii.hexlify(self._view[start:start + count]))
+        self._start += count
+
+    def _make_room(self):
+        start, end = self._start, self._end
+        if start == end:
+            self._start = self._end = 0
+        elif len(self._buffer) - end < len(self._buffer) // 4:
+            if start == 0:
+                # The buffer is full of unprocessed data.
+                self._discard(end, 'discarding invalid data')
+                self._start = self._end = 0
+                return
+            # Move unprocessed data back to the start of the buffer.
+            self._buffer[:end - start] = self._buffer[start:end]
+            self._start, self._end = 0, end - start
+
+    def read_frames(self):
+        """ Read available data from the port, and return the list of complete frames.
+
+        Note: frames are only valid until the next call.
+        """
+        self._make_room()
+        end = self._end
+        count = max(1, self.port.inWaiting())
+        count = self.port.readinto(self._view[end:end + count])
+        frames = []
+        if not count:
+            # Timeout.
+            pending = self._end - self._start
+            if pending:
+                policy = self.framing.timeout_policy
+                if policy == TIMEOUT_DISCARD:
+                    self._discard(pending, 'discarding incomplete packet')
+                elif policy == TIMEOUT_FLUSH:
+                    frames.append(self._view[self._start:self._end])
+                    self._start = self._end
+            return frames
+        self._end += count
+        split = self.framing.split
+        while self._start < self._end:
+            start, end = split(self._buffer, self._start, self._end)
+            if start > self._start:
+                self._discard(start - self._start, 'discarding invalid data')
+            if end is None:
+                break
+            frames.append(self._view[start:end])
+            self._start = end
+        return frames
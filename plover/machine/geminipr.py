@@ -3,10 +3,8 @@
 
 """Thread-based monitoring of a Gemini PR stenotype machine."""
 
-import binascii
-
-from plover import log
 from plover.machine.base import SerialStenotypeBase
+from plover.machine.framing import SyncBit
 
 
 # In the Gemini PR protocol, each packet consists of exactly six bytes
@@ -26,6 +24,15 @@ STENO_KEY_CHART = ("Fn", "#1", "#2", "#3", "#4", "#5", "#6",
 BYTES_PER_STROKE = 6
 
 
+def _byte_keys(position):
+    ''' Return a function giving the keys pressed for
+        a byte value at <position> in the packet. '''
+    def value_to_keys(value):
+        return [STENO_KEY_CHART[position * 7 + j - 1]
+                for j in range(1, 8) if value & (0x80 >> j)]
+    return value_to_keys
+
+
 class GeminiPr(SerialStenotypeBase):
     """Standard stenotype interface for a Gemini PR machine.
     """
@@ -40,19 +47,33 @@ class GeminiPr(SerialStenotypeBase):
         res2
     '''
 
+    FRAMING = SyncBit(BYTES_PER_STROKE)
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.set_keymap(self.keymap)
+
+    def set_keymap(self, keymap):
+        super().set_keymap(keymap)
+        # For each byte of a packet: byte value to actions.
+        self._actions_tables = tuple(
+            keymap.build_lookup_table(_byte_keys(position))
+            for position in range(BYTES_PER_STROKE)
+        )
+
+    def _decode_packet(self, packet):
+        actions = ()
+        for table, b in zip(self._actions_tables, packet):
+            actions += table[b]
+        return list(actions)
+
     def run(self):
         """Overrides base class run method. Do not call directly."""
         self._ready()
-        for packet in self._iter_packets(BYTES_PER_STROKE):
-            if not (packet[0] & 0x80) or sum(b & 0x80 for b in packet[1:]):
-                log.error('discarding invalid packet: %s',
-                          binascii.hexlify(packet))
-                continue
-            steno_keys = []
-            for i, b in enumerate(packet):
-                for j in range(1, 8):
-                    if (b & (0x80 >> j)):
-                        steno_keys.append(STENO_KEY_CHART[i * 7 + j - 1])
-            steno_keys = self.keymap.keys_to_actions(steno_keys)
-            if steno_keys:
-                self._notify(steno_keys)
+        for packets in self._iter_frames():
+            strokes = []
+            for packet in packets:
+                steno_keys = self._decode_packet(packet)
+                if steno_keys:
+                    strokes.append(steno_keys)
+            self._notify_strokes(strokes)
@@ -38,22 +38,21 @@ class Keyboard(StenotypeBase):
     def _suppress(self):
         if self._keyboard_capture is None:
             return
-        suppressed_keys = self._bindings.keys() if self._is_suppressed else ()
+        suppressed_keys = self._suppressed_keys if self._is_suppressed else ()
         self._keyboard_capture.suppress_keyboard(suppressed_keys)
 
     def _update_bindings(self):
         self._arpeggiate_key = None
-        self._bindings = dict(self.keymap.get_bindings())
-        for key, mapping in list(self._bindings.items()):
-            if 'no-op' == mapping:
-                self._bindings[key] = None
-            elif 'arpeggiate' == mapping:
-                if self._arpeggiate:
-                    self._bindings[key] = None
-                    self._arpeggiate_key = key
-                else:
-                    # Don't suppress arpeggiate key if it's not used.
-                    del self._bindings[key]
+        self._suppressed_keys = set(self.keymap.get_bindings())
+        arpeggiate_keys = self.keymap.get_mappings().get('arpeggiate', ())
+        if self._arpeggiate:
+            if arpeggiate_keys:
+                self._arpeggiate_key = arpeggiate_keys[-1]
+        else:
+            # Don't suppress arpeggiate key if it's not used.
+            self._suppressed_keys.difference_update(arpeggiate_keys)
+        # Mask of the keys bound to steno actions.
+        self._steno_mask = ~self.keymap.get_mask('arpeggiate')
         self._suppress()
 
     def set_keymap(self, keymap):
@@ -112,8 +111,10 @@ class Keyboard(StenotypeBase):
         ):
             return
         self._last_stroke_key_down_count = self._stroke_key_down_count
-        steno_keys = {self._bindings.get(k) for k in self._stroke_keys}
-        steno_keys -= {None}
+        keymap = self.keymap
+        steno_keys = set(keymap.mask_to_actions(
+            keymap.keys_to_mask(self._stroke_keys) & self._steno_mask
+        ))
         if steno_keys:
             self._notify(steno_keys)
         self._stroke_keys.clear()
@@ -20,6 +20,14 @@ class Keymap:
         self._mappings = {}
         # key -> action
         self._bindings = {}
+        # Compiled keymap: each key is assigned a bit (in order),
+        # and the actions for a set of keys are looked up 8 keys
+        # at a time.
+        self._key_bits = {key: 1 << n for key, n in self._keys.items()}
+        # Mask of keys bound to an action (other than 'no-op').
+        self._bound_mask = 0
+        # For each group of 8 keys: 8 bits mask to actions.
+        self._tables = [((),) * 256] * (max(self._keys.values(), default=-1) // 8 + 1)
 
     def get_keys(self):
         return self._keys.keys()
@@ -78,6 +86,29 @@ class Keymap:
                 errors.append('key %s is bound multiple times: %s' % (key, str(action_list)))
         if len(errors) > 0:
             log.warning('Keymap is invalid, behavior undefined:\n\n- ' + '\n- '.join(errors))
+        self._compile()
+
+    def _compile(self, changed_keys=None):
+        '''Update the compiled keymap.
+
+        Only the lookup tables for <changed_keys> are rebuilt (all of
+        them if None).
+        '''
+        keys_by_bit = {n: key for key, n in self._keys.items()}
+        self._bound_mask = self.keys_to_mask(
+            key for key, action in self._bindings.items()
+            if action != 'no-op'
+        )
+        if changed_keys is None:
+            groups = range(len(self._tables))
+        else:
+            groups = {self._keys[key] // 8 for key in changed_keys}
+        for group in groups:
+            group_keys = [keys_by_bit.get(group * 8 + n) for n in range(8)]
+            self._tables[group] = self.build_lookup_table(
+                lambda value: [key for n, key in enumerate(group_keys)
+                               if value & (1 << n) and key is not None]
+            )
 
     def get_bindings(self):
         return self._bindings
@@ -88,14 +119,51 @@ class Keymap:
     def get_action(self, key, default=None):
         return self._bindings.get(key, default)
 
-    def keys_to_actions(self, key_list):
-        action_list = []
+    def keys_to_mask(self, key_list):
+        '''Return the mask for a list of keys.'''
+        key_bits = self._key_bits
+        mask = 0
         for key in key_list:
-            assert key in self._keys, "'%s' not in %s" % (key, self._keys)
-            action = self._bindings[key]
-            if 'no-op' != action:
-                action_list.append(action)
-        return action_list
+            assert key in key_bits, "'%s' not in %s" % (key, self._keys)
+            mask |= key_bits[key]
+        return mask
+
+    def get_mask(self, action):
+        '''Return the mask of the keys bound to an action.'''
+        return self.keys_to_mask(self._mappings.get(action, ()))
+
+    def mask_to_actions(self, mask):
+        '''Return the list of actions for a mask of keys (in keys order).'''
+        mask &= self._bound_mask
+        actions = ()
+        for table in self._tables:
+            if not mask:
+                break
+            actions += table[mask & 0xff]
+            mask >>= 8
+        return list(actions)
+
+    def keys_to_actions(self, key_list):
+        return self.mask_to_actions(self.keys_to_mask(key_list))
+
+    def build_lookup_table(self, value_to_keys, size=256):
+        '''Build a lookup table for decoding machine data.
+
+        The table maps each value in `range(size)` to the tuple of actions
+        for the keys returned by `value_to_keys(value)`. Keys bound to 'no-op'
+        (or not bound) are dropped, so decoding a packet is only a matter
+        of concatenating the entries of its bytes.
+        '''
+        table = []
+        for value in range(size):
+            actions = []
+            for key in value_to_keys(value):
+                assert key in self._keys, "'%s' not in %s" % (key, self._keys)
+                action = self._bindings.get(key, 'no-op')
+                if 'no-op' != action:
+                    actions.append(action)
+            table.append(tuple(actions))
+        return tuple(table)
 
     def keys(self):
         return self._mappings.keys()
@@ -114,8 +182,9 @@ class Keymap:
         if isinstance(key_list, str):
             key_list = (key_list,)
         # Delete previous bindings.
+        old_key_list = self._mappings.get(action, ())
         if action in self._mappings:
-            for old_key in self._mappings[action]:
+            for old_key in old_key_list:
                 if old_key in self._bindings:
                     del self._bindings[old_key]
         errors = []
@@ -132,6 +201,7 @@ class Keymap:
         self._mappings[action] = tuple(sorted(valid_key_list, key=self._keys.get))
         if len(errors) > 0:
             log.warning('Keymap is invalid, behavior undefined:\n\n- ' + '\n- '.join(errors))
+        self._compile(set(old_key_list) | set(valid_key_list))
 
     def __iter__(self):
         return iter(self._mappings)
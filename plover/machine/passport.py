@@ -5,7 +5,9 @@
 
 from itertools import zip_longest
 
+from plover import log
 from plover.machine.base import SerialStenotypeBase
+from plover.machine.framing import Terminator
 
 # Passport protocol is documented here:
 # http://www.eclipsecat.com/?q=system/files/Passport%20protocol_0.pdf
@@ -24,38 +26,31 @@ class Passport(SerialStenotypeBase):
     SERIAL_PARAMS = dict(SerialStenotypeBase.SERIAL_PARAMS)
     SERIAL_PARAMS.update(baudrate=38400)
 
-    def __init__(self, params):
-        super().__init__(params)
-        self.packet = []
-
-    def _read(self, b):
-        b = chr(b)
-        self.packet.append(b)
-        if b == '>':
-            self._handle_packet(''.join(self.packet))
-            del self.packet[:]
-
-    def _handle_packet(self, packet):
-        encoded = packet.split('/')[1]
-        steno_keys = []
-        for key, shadow in grouper(encoded, 2, 0):
-            shadow = int(shadow, base=16)
-            if shadow >= 8:
-                steno_keys.append(key)
-        steno_keys = self.keymap.keys_to_actions(steno_keys)
-        if steno_keys:
-            self._notify(steno_keys)
+    FRAMING = Terminator(b'>')
+
+    def _decode_packet(self, packet):
+        try:
+            encoded = str(packet, 'latin-1').split('/')[1]
+            steno_keys = []
+            for key, shadow in grouper(encoded, 2, '0'):
+                shadow = int(shadow, base=16)
+                if shadow >= 8:
+                    steno_keys.append(key)
+            return self.keymap.keys_to_actions(steno_keys)
+        except (AssertionError, IndexError, KeyError, ValueError):
+            log.error('discarding invalid packet: %s', bytes(packet))
+            return []
 
     def run(self):
         """Overrides base class run method. Do not call directly."""
         self._ready()
-
-        while not self.finished.isSet():
-            # Grab data from the serial port.
-            raw = self.serial_port.read(max(1, self.serial_port.inWaiting()))
-
-            for b in raw:
-                self._read(b)
+        for packets in self._iter_frames():
+            strokes = []
+            for packet in packets:
+                steno_keys = self._decode_packet(packet)
+                if steno_keys:
+                    strokes.append(steno_keys)
+            self._notify_strokes(strokes)
 
 
 def grouper(iterable, n, fillvalue=None):
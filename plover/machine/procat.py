@@ -7,6 +7,7 @@ import binascii
 
 from plover import log
 from plover.machine.base import SerialStenotypeBase
+from plover.machine.framing import FixedSize
 
 
 # ProCAT machines send 4 bytes per stroke, with the last byte only consisting of
@@ -32,19 +33,26 @@ class ProCAT(SerialStenotypeBase):
     '''
     KEYMAP_MACHINE_TYPE = 'TX Bolt'
 
+    # Note: the terminator cannot be used for resynchronizing,
+    # since steno bytes can have the same value.
+    FRAMING = FixedSize(BYTES_PER_STROKE)
+
     def run(self):
         """Overrides base class run method. Do not call directly."""
         self._ready()
-        for packet in self._iter_packets(BYTES_PER_STROKE):
-            if (packet[0] & 0x80) or packet[3] != 0xff:
-                log.error('discarding invalid packet: %s',
-                          binascii.hexlify(packet))
-                continue
-            steno_keys = self.keymap.keys_to_actions(
-                self.process_steno_packet(packet)
-            )
-            if steno_keys:
-                self._notify(steno_keys)
+        for packets in self._iter_frames():
+            strokes = []
+            for packet in packets:
+                if (packet[0] & 0x80) or packet[3] != 0xff:
+                    log.error('discarding invalid packet: %s',
+                              binascii.hexlify(packet))
+                    continue
+                steno_keys = self.keymap.keys_to_actions(
+                    self.process_steno_packet(packet)
+                )
+                if steno_keys:
+                    strokes.append(steno_keys)
+            self._notify_strokes(strokes)
 
     @staticmethod
     def process_steno_packet(raw):
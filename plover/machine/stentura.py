@@ -275,7 +275,22 @@ _STENO_KEY_CHART = ('^', '#', 'S-', 'T-', 'K-', 'P-',    # Byte #1
                     '-L', '-G', '-T', '-S', '-D', '-Z')  # Byte #4
 
 
-def _parse_stroke(a, b, c, d):
+def _byte_keys(position):
+    """Return a function giving the keys pressed for
+    a byte value at <position> in the stroke."""
+    def value_to_keys(value):
+        return [_STENO_KEY_CHART[position * 6 + i] for i in range(6)
+                if value & (1 << (5 - i))]
+    return value_to_keys
+
+# For each byte of a stroke: byte value to keys pressed.
+_KEYS_TABLES = tuple(
+    tuple(tuple(_byte_keys(position)(value)) for value in range(256))
+    for position in range(4)
+)
+
+
+def _parse_stroke(a, b, c, d, tables=_KEYS_TABLES):
     """Parse a stroke and return a list of keys pressed.
 
     Args:
@@ -283,22 +298,22 @@ def _parse_stroke(a, b, c, d):
     - b: The second byte.
     - c: The third byte.
     - d: The fourth byte.
+    - tables: The lookup tables to use for each byte (see _KEYS_TABLES).
 
     Returns: A sequence with all the keys pressed in the stroke.
              e.g. ['S-', 'A-', '-T']
 
     """
-    fullstroke = (((a & 0x3f) << 18) | ((b & 0x3f) << 12) |
-                  ((c & 0x3f) << 6) | d & 0x3f)
-    return [_STENO_KEY_CHART[i] for i in range(24)
-            if (fullstroke & (1 << (23 - i)))]
+    ta, tb, tc, td = tables
+    return list(ta[a] + tb[b] + tc[c] + td[d])
 
 
-def _parse_strokes(data):
+def _parse_strokes(data, tables=_KEYS_TABLES):
     """Parse strokes from a buffer and return a sequence of strokes.
 
     Args:
     - data: A byte buffer.
+    - tables: The lookup tables to use for each byte (see _KEYS_TABLES).
 
     Returns: A sequence of strokes. Each stroke is a sequence of pressed keys.
 
@@ -314,7 +329,7 @@ def _parse_strokes(data):
         if (b & 0b11000000) != 0b11000000:
             raise _ProtocolViolationException("Data is not stroke: 0x%X" % (b))
     for a, b, c, d in zip(*([iter(data)] * 4)):
-        strokes.append(_parse_stroke(a, b, c, d))
+        strokes.append(_parse_stroke(a, b, c, d, tables))
     return strokes
 
 # Actions
@@ -595,17 +610,20 @@ def _read(port, stop, seq, request_buf, response_buf, stroke_buf, block, byte):
             block += 1
             byte -= 512
 
-def _loop(port, stop, callback, ready_callback, timeout=1):
+def _loop(port, stop, callback, ready_callback, timeout=1, get_tables=lambda: _KEYS_TABLES):
     """Enter into a loop talking to the machine and returning strokes.
 
     Args:
     - port: The port to use.
     - stop: The event used to signal that it's time to stop.
-    - callback: A function that takes a list of pressed keys, called for each
-    stroke.
+    - callback: A function that takes a list of strokes (each a list of
+    pressed keys), called for each read.
     - ready_callback: A function that is called when the machine is ready.
     - timeout: Timeout to use when waiting for a response in seconds. Should be
     1 when talking to a real machine. (default: 1)
+    - get_tables: A function returning the lookup tables to use for parsing
+    strokes (see _KEYS_TABLES), called for each read, so the tables can be
+    changed while running.
 
     Raises:
     _ProtocolViolationException: If the protocol is violated.
@@ -637,9 +655,9 @@ def _loop(port, stop, callback, ready_callback, timeout=1):
     ready_callback()
     while True:
         block, byte, data = _read(port, stop, seq, request_buf, response_buf, stroke_buf, block, byte)
-        strokes = _parse_strokes(data)
-        for stroke in strokes:
-            callback(stroke)
+        strokes = _parse_strokes(data, get_tables())
+        if strokes:
+            callback(strokes)
 
 
 class Stentura(plover.machine.base.SerialStenotypeBase):
@@ -658,15 +676,26 @@ class Stentura(plover.machine.base.SerialStenotypeBase):
         ^
     '''
 
-    def _on_stroke(self, keys):
-        steno_keys = self.keymap.keys_to_actions(keys)
-        if steno_keys:
-            self._notify(steno_keys)
+    def __init__(self, params):
+        super().__init__(params)
+        self.set_keymap(self.keymap)
+
+    def set_keymap(self, keymap):
+        super().set_keymap(keymap)
+        # Parse strokes directly to actions.
+        self._actions_tables = tuple(
+            keymap.build_lookup_table(_byte_keys(position))
+            for position in range(4)
+        )
+
+    def _on_strokes(self, strokes):
+        self._notify_strokes([steno_keys for steno_keys in strokes if steno_keys])
 
     def run(self):
         """Overrides base class run method. Do not call directly."""
         try:
-            _loop(self.serial_port, self.finished, self._on_stroke, self._ready)
+            _loop(self.serial_port, self.finished, self._on_strokes, self._ready,
+                  get_tables=lambda: self._actions_tables)
         except _StopException:
             pass
         except Exception:
@@ -4,6 +4,7 @@
 "Thread-based monitoring of a stenotype machine using the TX Bolt protocol."
 
 import plover.machine.base
+from plover.machine.framing import IncreasingRank
 
 # In the TX Bolt protocol, there are four sets of keys grouped in
 # order from left to right. Each byte represents all the keys that
@@ -30,6 +31,13 @@ STENO_KEY_CHART = ("S-", "T-", "K-", "P-", "W-", "H-",  # 00
                    "-T", "-S", "-D", "-Z", "#")         # 11
 
 
+def _byte_keys(byte):
+    key_set = byte >> 6
+    return [STENO_KEY_CHART[(key_set * 6) + i]
+            for i in range(5 if key_set == 3 else 6)
+            if (byte >> i) & 1]
+
+
 class TxBolt(plover.machine.base.SerialStenotypeBase):
     """TX Bolt interface.
 
@@ -46,19 +54,24 @@ class TxBolt(plover.machine.base.SerialStenotypeBase):
               A- O-   -E -U
     '''
 
+    # A stroke ends when a lower (or the same) set is seen,
+    # or after the last possible set.
+    FRAMING = IncreasingRank(lambda byte: byte >> 6, 3)
+
     def __init__(self, params):
         super().__init__(params)
-        self._reset_stroke_state()
+        self.set_keymap(self.keymap)
 
-    def _reset_stroke_state(self):
-        self._pressed_keys = []
-        self._last_key_set = 0
+    def set_keymap(self, keymap):
+        super().set_keymap(keymap)
+        # Byte value to actions.
+        self._actions_table = keymap.build_lookup_table(_byte_keys)
 
-    def _finish_stroke(self):
-        steno_keys = self.keymap.keys_to_actions(self._pressed_keys)
-        if steno_keys:
-            self._notify(steno_keys)
-        self._reset_stroke_state()
+    def _decode_packet(self, packet):
+        actions = ()
+        for byte in packet:
+            actions += self._actions_table[byte]
+        return list(actions)
 
     def run(self):
         """Overrides base class run method. Do not call directly."""
@@ -66,25 +79,10 @@ class TxBolt(plover.machine.base.SerialStenotypeBase):
         settings['timeout'] = 0.1 # seconds
         self.serial_port.applySettingsDict(settings)
         self._ready()
-        while not self.finished.isSet():
-            # Grab data from the serial port, or wait for timeout if none available.
-            raw = self.serial_port.read(max(1, self.serial_port.inWaiting()))
-
-            if not raw:
-                # Timeout, finish the current stroke.
-                self._finish_stroke()
-                continue
-
-            for byte in raw:
-                key_set = byte >> 6
-                if key_set <= self._last_key_set:
-                    # Starting a new stroke, finish previous one.
-                    self._finish_stroke()
-                self._last_key_set = key_set
-                for i in range(5 if key_set == 3 else 6):
-                    if (byte >> i) & 1:
-                        key = STENO_KEY_CHART[(key_set * 6) + i]
-                        self._pressed_keys.append(key)
-                if key_set == 3:
-                    # Last possible set, the stroke is finished.
-                    self._finish_stroke()
+        for packets in self._iter_frames():
+            strokes = []
+            for packet in packets:
+                steno_keys = self._decode_packet(packet)
+                if steno_keys:
+                    strokes.append(steno_keys)
+            self._notify_strokes(strokes)
@@ -20,7 +20,7 @@ if sys.platform.startswith('darwin'):
 from plover.config import CONFIG_DIR, CONFIG_FILE, Config
 from plover.oslayer import processlock
 from plover.registry import registry
-from plover import log
+from plover import log, trace
 from plover import __name__ as __software_name__
 from plover import __version__
 
@@ -53,9 +53,16 @@ def main():
     parser.add_argument('-l', '--log-level', choices=['debug', 'info', 'warning', 'error'],
                         default=None, help='set log level')
     parser.add_argument('-g', '--gui', default=None, help='set gui')
+    parser.add_argument('--trace', metavar='FILE', nargs='?', const=trace.filename,
+                        default=None, help='trace engine activity, and write the '
+                        'trace (Chrome trace event format) to FILE on exit '
+                        '(default: %(const)s)')
     args = parser.parse_args(args=sys.argv[1:])
     if args.log_level is not None:
         log.set_level(args.log_level.upper())
+    if args.trace is not None:
+        trace.filename = args.trace
+        trace.enable()
     log.setup_platform_handler()
 
     log.info('Plover %s', __version__)
@@ -128,6 +135,11 @@ def main():
             code = gui.main(config)
             with open(config.target_file, 'wb') as f:
                 config.save(f)
+            if trace.is_enabled():
+                try:
+                    log.info('trace written to %s', trace.dump())
+                except OSError as e:
+                    log.error('writing trace failed: %s', e)
     except processlock.LockNotAcquiredException:
         gui.show_error('Error', 'Another instance of Plover is already running.')
         code = 1
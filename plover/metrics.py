@@ -0,0 +1,72 @@
+"""Rolling latency metrics for the strokes processing pipeline.
+
+Durations are recorded, in seconds, for each stage:
+
+- queue: from the machine notifying the stroke to the engine processing it
+- translate: translating the stroke (`Translator.translate_stroke`)
+- format: formatting the translations (`Formatter.format`), minus the output
+- output: keyboard emulation (sending backspaces, text, and key combinations)
+- total: from the machine notifying the stroke to the end of the output
+
+Translation and queue durations are per stroke, the others per batch of
+strokes processed together by the engine.
+"""
+
+from collections import deque, namedtuple
+import threading
+
+
+STAGES = ('queue', 'translate', 'format', 'output', 'total')
+
+# Default number of samples kept for each stage.
+WINDOW_SIZE = 1000
+
+LatencySummary = namedtuple('LatencySummary', 'count p50 p95 p99')
+
+
+def percentile(sorted_samples, percent):
+    # Nearest-rank method.
+    rank = max(0, -(-len(sorted_samples) * percent // 100) - 1)
+    return sorted_samples[rank]
+
+
+class LatencyMetrics:
+    """ Keep the latest durations of each stage.
+
+    Durations are recorded from the engine thread, and can be summarized
+    from any other thread: a dedicated lock is used for that, so reading
+    the metrics does not contend with strokes processing for the engine lock.
+    """
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._samples = {
+            stage: deque(maxlen=window_size)
+            for stage in STAGES
+        }
+
+    def record(self, stage, duration):
+        with self._lock:
+            self._samples[stage].append(duration)
+
+    def clear(self):
+        with self._lock:
+            for samples in self._samples.values():
+                samples.clear()
+
+    def summary(self):
+        """ Return a dictionary mapping each stage to a `LatencySummary`
+            (`None` if no duration was recorded for this stage). """
+        with self._lock:
+            samples_copy = {stage: list(samples) for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, samples in samples_copy.items():
+            if not samples:
+                summary[stage] = None
+                continue
+            samples = sorted(samples)
+            summary[stage] = LatencySummary(len(samples),
+                                            percentile(samples, 50),
+                                            percentile(samples, 95),
+                                            percentile(samples, 99))
+        return summary
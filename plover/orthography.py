@@ -3,9 +3,14 @@
 
 """Functions that implement some English orthographic rules."""
 
+from functools import lru_cache
+
 from plover import system
 
 
+# Maximum number of (word, suffix) results kept in cache.
+CACHE_SIZE = 4096
+
 def _add_candidates_from_rules(candidates, word, suffix):
     """ Use regular expressions to match orthography rules. """
     input = word + " ^ " + suffix
@@ -15,6 +20,7 @@ def _add_candidates_from_rules(candidates, word, suffix):
             candidates.append(m.expand(replacement))
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def _add_suffix(word, suffix):
     """ Try to find a valid way to join a suffix to a root word using
         simple concatenation or regular expressions. A dictionary of
@@ -50,6 +56,11 @@ def _add_suffix(word, suffix):
     return simple
 
 
+def clear_cache():
+    """ Reset cached results: must be called when the system changes. """
+    _add_suffix.cache_clear()
+
+
 def add_suffix(word, suffix):
     """Add a suffix to a word by applying the rules above
     
@@ -306,6 +306,10 @@ class KeyboardEmulation:
 
     def __init__(self):
         self._layout = KeyboardLayout()
+        # Compiled key combinations (for the layout
+        # generation below): combo string to key events.
+        self._key_combo_cache = {}
+        self._key_combo_cache_generation = None
 
     @staticmethod
     def send_backspaces(number_of_backspaces):
@@ -405,6 +409,17 @@ class KeyboardEmulation:
                 and release the Tab key, and then release the left Alt key.
 
         """
+        if self._key_combo_cache_generation != self._layout.generation:
+            self._key_combo_cache.clear()
+            self._key_combo_cache_generation = self._layout.generation
+        key_events = self._key_combo_cache.get(combo_string)
+        if key_events is None:
+            key_events = self._compile_key_combination(combo_string)
+            self._key_combo_cache[combo_string] = key_events
+        # Send events...
+        self._send_sequence(key_events)
+
+    def _compile_key_combination(self, combo_string):
         def name_to_code(name):
             # Static key codes
             code = KEYNAME_TO_KEYCODE.get(name)
@@ -421,9 +436,7 @@ class KeyboardEmulation:
                 code, mods = self._layout.char_to_key_sequence(char)[0]
             return code
         # Parse and validate combo.
-        key_events = parse_key_combo(combo_string, name_to_code)
-        # Send events...
-        self._send_sequence(key_events)
+        return parse_key_combo(combo_string, name_to_code)
 
     @staticmethod
     def _modifier_to_keycodes(modifier):
@@ -115,6 +115,8 @@ def get_printable_string(s):
 
 class KeyboardLayout:
     def __init__(self, watch_layout=True):
+        # Incremented on each layout update.
+        self.generation = 0
         self._char_to_key_sequence = None
         self._key_sequence_to_char = None
         self._modifier_masks = None
@@ -154,6 +156,7 @@ class KeyboardLayout:
         self._key_sequence_to_char = key_sequence_to_char
         self._modifier_masks = modifier_masks
         self._deadkey_symbol_to_key_sequence = self._deadkeys_by_symbols()
+        self.generation += 1
 
     def deadkey_symbol_to_key_sequence(self, symbol):
         return self._deadkey_symbol_to_key_sequence.get(symbol, DEFAULT_SEQUENCE)
@@ -361,6 +361,9 @@ class KeyboardEmulation:
 
     def __init__(self):
         self.keyboard_layout = KeyboardLayout()
+        # Compiled key combinations (for the current
+        # keyboard layout): combo string to key events.
+        self._key_combo_cache = {}
 
     # Sends input types to buffer
     @staticmethod
@@ -421,6 +424,7 @@ class KeyboardEmulation:
         layout_id = KeyboardLayout.current_layout_id()
         if layout_id != self.keyboard_layout.layout_id:
             self.keyboard_layout = KeyboardLayout(layout_id)
+            self._key_combo_cache.clear()
 
     def _key_unicode(self, char):
         pairs = to_surrogate_pair(char)
@@ -462,7 +466,10 @@ class KeyboardEmulation:
         # Make sure keyboard layout is up-to-date.
         self._refresh_keyboard_layout()
         # Parse and validate combo.
-        key_events = parse_key_combo(combo_string, self.keyboard_layout.keyname_to_vk.get)
+        key_events = self._key_combo_cache.get(combo_string)
+        if key_events is None:
+            key_events = parse_key_combo(combo_string, self.keyboard_layout.keyname_to_vk.get)
+            self._key_combo_cache[combo_string] = key_events
         # Send events...
         for keycode, pressed in key_events:
             self._key_event(keycode, pressed)
@@ -21,6 +21,7 @@ http://tronche.com/gui/x/xlib/input/keyboard-encoding.html
 
 """
 
+from contextlib import contextmanager
 import errno
 import os
 import string
@@ -1139,6 +1140,9 @@ class KeyboardEmulation:
     def __init__(self):
         """Prepare to emulate keyboard events."""
         self._display = display.Display()
+        # Queued key events: (event type, keycode).
+        self._events = []
+        self._batch_depth = 0
         self._update_keymap()
 
     def _update_keymap(self):
@@ -1147,6 +1151,8 @@ class KeyboardEmulation:
         '''
         self._keymap = {}
         self._custom_mappings_queue = []
+        # Compiled key combinations: combo string to key events.
+        self._key_combo_cache = {}
         # Analyse X11 keymap.
         keycode = self._display.display.info.min_keycode
         keycode_count = self._display.display.info.max_keycode - keycode + 1
@@ -1209,10 +1215,10 @@ class KeyboardEmulation:
         number_of_backspace -- The number of backspaces to emulate.
 
         """
+        mapping = self._backspace_mapping
         for x in range(number_of_backspaces):
-            self._send_keycode(self._backspace_mapping.keycode,
-                               self._backspace_mapping.modifiers)
-        self._display.sync()
+            self._queue_keycode(mapping.keycode, mapping.modifiers)
+        self._flush_events()
 
     def send_string(self, s):
         """Emulate the given string.
@@ -1224,14 +1230,20 @@ class KeyboardEmulation:
         s -- The string to emulate.
 
         """
-        for char in s:
-            keysym = uchr_to_keysym(char)
+        keysyms = [uchr_to_keysym(char) for char in s]
+        self._map_keysyms(keysyms)
+        # Modifiers are only toggled when they change
+        # between consecutive characters.
+        modifiers = 0
+        for keysym in keysyms:
             mapping = self._get_mapping(keysym)
             if mapping is None:
                 continue
-            self._send_keycode(mapping.keycode,
-                               mapping.modifiers)
-        self._display.sync()
+            modifiers = self._queue_modifiers(modifiers, mapping.modifiers)
+            self._events.append((X.KeyPress, mapping.keycode))
+            self._events.append((X.KeyRelease, mapping.keycode))
+        self._queue_modifiers(modifiers, 0)
+        self._flush_events()
 
     def send_key_combination(self, combo_string):
         """Emulate a sequence of key combinations.
@@ -1255,18 +1267,76 @@ class KeyboardEmulation:
         and release the Tab key, and then release the left Alt key.
 
         """
-        # Parse and validate combo.
-        key_events = [
-            (keycode, X.KeyPress if pressed else X.KeyRelease) for keycode, pressed
-            in parse_key_combo(combo_string, self._get_keycode_from_keystring)
-        ]
+        key_events = self._key_combo_cache.get(combo_string)
+        if key_events is None:
+            key_events = self._compile_key_combination(combo_string)
         # Emulate the key combination by sending key events.
-        for keycode, event_type in key_events:
-            xtest.fake_input(self._display, event_type, keycode)
+        self._events.extend(key_events)
+        self._flush_events()
+
+    def _compile_key_combination(self, combo_string):
+        """Parse and validate a key combination, return its key events.
+
+        The result is cached, unless it relies on custom mappings
+        (which can be reassigned at any time).
+        """
+        uses_custom_mappings = False
+        def keystring_to_keycode(keystring):
+            nonlocal uses_custom_mappings
+            mapping = self._get_mapping_from_keystring(keystring)
+            if mapping is None:
+                return None
+            if mapping.custom_mapping is not None:
+                uses_custom_mappings = True
+            return mapping.keycode
+        key_events = tuple(
+            (X.KeyPress if pressed else X.KeyRelease, keycode) for keycode, pressed
+            in parse_key_combo(combo_string, keystring_to_keycode)
+        )
+        if not uses_custom_mappings:
+            self._key_combo_cache[combo_string] = key_events
+        return key_events
+
+    @contextmanager
+    def batch(self):
+        """Group the key events of all emulation calls.
+
+        Events are only sent on exit, followed by a single display sync.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            self._flush_events()
+
+    def _flush_events(self):
+        """Send queued key events, unless batching."""
+        if self._batch_depth:
+            return
+        self._send_events()
         self._display.sync()
 
-    def _send_keycode(self, keycode, modifiers=0):
-        """Emulate a key press and release.
+    def _send_events(self):
+        for event_type, keycode in self._events:
+            xtest.fake_input(self._display, event_type, keycode)
+        self._events.clear()
+
+    def _queue_modifiers(self, current_modifiers, modifiers):
+        """Queue the key events to go from the <current_modifiers> mask to <modifiers>.
+
+        Return the new modifiers mask.
+        """
+        for n in reversed(range(8)):
+            if current_modifiers & ~modifiers & (1 << n):
+                self._events.append((X.KeyRelease, self.modifier_mapping[n][0]))
+        for n in range(8):
+            if modifiers & ~current_modifiers & (1 << n):
+                self._events.append((X.KeyPress, self.modifier_mapping[n][0]))
+        return modifiers
+
+    def _queue_keycode(self, keycode, modifiers=0):
+        """Queue the events for a key press and release.
 
         Arguments:
 
@@ -1277,33 +1347,20 @@ class KeyboardEmulation:
         Control, and Alt.
 
         """
-        modifiers_list = [
-            self.modifier_mapping[n][0]
-            for n in range(8)
-            if (modifiers & (1 << n))
-        ]
-        # Press modifiers.
-        for mod_keycode in modifiers_list:
-            xtest.fake_input(self._display, X.KeyPress, mod_keycode)
-        # Press and release the base key.
-        xtest.fake_input(self._display, X.KeyPress, keycode)
-        xtest.fake_input(self._display, X.KeyRelease, keycode)
-        # Release modifiers.
-        for mod_keycode in reversed(modifiers_list):
-            xtest.fake_input(self._display, X.KeyRelease, mod_keycode)
-
-    def _get_keycode_from_keystring(self, keystring):
-        '''Find the physical key <keystring> is mapped to.
+        self._queue_modifiers(0, modifiers)
+        self._events.append((X.KeyPress, keycode))
+        self._events.append((X.KeyRelease, keycode))
+        self._queue_modifiers(modifiers, 0)
+
+    def _get_mapping_from_keystring(self, keystring):
+        '''Find the mapping of the physical key for <keystring>.
 
         Return None of if keystring is not mapped.
         '''
         keysym = KEY_TO_KEYSYM.get(keystring)
         if keysym is None:
             return None
-        mapping = self._get_mapping(keysym, automatically_map=False)
-        if mapping is None:
-            return None
-        return mapping.keycode
+        return self._get_mapping(keysym, automatically_map=False)
 
     def _get_mapping(self, keysym, automatically_map=True):
         """Return a keycode and modifier mask pair that result in the keysym.
@@ -1328,21 +1385,12 @@ class KeyboardEmulation:
             if 0 == len(self._custom_mappings_queue):
                 # Nope...
                 return None
-            mapping = self._custom_mappings_queue.pop(0)
-            previous_keysym = mapping.keysym
-            keysym_index = mapping.custom_mapping.index(previous_keysym)
-            # Update X11 keymap.
-            mapping.custom_mapping[keysym_index] = keysym
+            mapping = self._custom_mappings_queue[0]
+            # Update X11 keymap: queued events using the
+            # previous mapping must be sent first.
+            self._send_events()
+            self._assign_custom_mapping(mapping, keysym)
             self._display.change_keyboard_mapping(mapping.keycode, [mapping.custom_mapping])
-            # Update our keymap.
-            if previous_keysym in self._keymap:
-                del self._keymap[previous_keysym]
-            mapping.keysym = keysym
-            self._keymap[keysym] = mapping
-            log.debug('new mapping: %s', mapping)
-            # Move custom mapping back at the end of
-            # the queue so we don't use it too soon.
-            self._custom_mappings_queue.append(mapping)
         elif mapping.custom_mapping is not None:
             # Same as above; prevent mapping
             # from being reused to soon.
@@ -1350,3 +1398,56 @@ class KeyboardEmulation:
             self._custom_mappings_queue.append(mapping)
         return mapping
 
+    def _assign_custom_mapping(self, mapping, keysym):
+        """Assign <keysym> to the custom <mapping>.
+
+        Only our keymap is updated, not the X11 keymap.
+        """
+        previous_keysym = mapping.keysym
+        keysym_index = mapping.custom_mapping.index(previous_keysym)
+        mapping.custom_mapping[keysym_index] = keysym
+        # Update our keymap.
+        if previous_keysym in self._keymap:
+            del self._keymap[previous_keysym]
+        mapping.keysym = keysym
+        self._keymap[keysym] = mapping
+        log.debug('new mapping: %s', mapping)
+        # Move custom mapping back at the end of
+        # the queue so we don't use it too soon.
+        self._custom_mappings_queue.remove(mapping)
+        self._custom_mappings_queue.append(mapping)
+
+    def _map_keysyms(self, keysyms):
+        """Map all unmapped <keysyms> ahead of time, when possible.
+
+        Custom mappings still needed for <keysyms> are not reused, and the
+        X11 keymap is updated with one request per block of consecutive
+        keycodes (instead of one per keysym). Keysyms that cannot be mapped
+        this way are left for `_get_mapping` to handle.
+        """
+        missing = []
+        for keysym in keysyms:
+            if keysym not in self._keymap and keysym not in missing:
+                missing.append(keysym)
+        if not missing:
+            return
+        needed = set(keysyms)
+        available = [
+            mapping for mapping in self._custom_mappings_queue
+            if mapping.keysym not in needed
+        ]
+        changed = {}
+        for keysym, mapping in zip(missing, available):
+            self._assign_custom_mapping(mapping, keysym)
+            changed[mapping.keycode] = mapping.custom_mapping
+        if not changed:
+            return
+        # Queued events using the previous mappings must be sent first.
+        self._send_events()
+        keycodes = sorted(changed)
+        start = 0
+        for n, keycode in enumerate(keycodes):
+            if n + 1 == len(keycodes) or keycodes[n + 1] != keycode + 1:
+                block = keycodes[start:n + 1]
+                self._display.change_keyboard_mapping(block[0], [changed[k] for k in block])
+                start = n + 1
@@ -4,13 +4,23 @@
 """ StenoDictionary class and related functions.
     A steno dictionary maps sequences of steno strokes to translations. """
 
+import collections
+import heapq
 import os
 import shutil
 
-from plover.dictionary.base import ReverseStenoDict
+from plover.dictionary.base import ReverseStenoDict, StenoKeyIndex
 from plover.resource import ASSET_SCHEME, resource_filename, resource_timestamp
 
 
+# Methods reading the entries of a StenoDictionary: snapshots copy the entries and the reverse dictionary,
+# so they can't be used by subclasses overriding these methods (see StenoDictionary.supports_snapshot).
+_ENTRIES_READING_METHODS = (
+    '__contains__', '__getitem__', '__iter__', '__len__', 'get', 'items', 'keys', 'values',
+    '_set_reverse', 'reverse_lookup', 'casereverse_lookup', 'prefix_key_items', 'stroke_key_items',
+)
+
+
 class StenoDictionary(dict):
     """ A steno dictionary.
 
@@ -26,26 +36,64 @@ class StenoDictionary(dict):
         instances: If True, the dictionary may not be modified, nor may it be written to the path on disk.
     enabled -- If True, dictionary is included in lookups by a StenoDictionaryCollection
     path -- File path where dictionary contents are stored on disk
+    generation -- Incremented each time the contents or enabled state of the dictionary change.
+
+    A read-only copy can be obtained with snapshot(), for reading from other threads without locking.
+    Only the classes with supports_snapshot set can be copied: it is unset automatically for the subclasses
+    overriding the methods reading the entries (for example to compute them), whose instances are not copied.
+
+    Queries on the keys themselves (outlines starting with a prefix, or containing some strokes) use an index
+    of the keys (see plover.dictionary.base.StenoKeyIndex), built on first use and then kept up to date.
 
     """
 
     # False if class supports creation.
     readonly = False
 
+    # True if snapshot() can copy the entries of instances of the class.
+    supports_snapshot = True
+
+    # Class default, so subclasses can set enabled before calling __init__.
+    generation = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Subclasses overriding the methods reading the entries
+        # don't support snapshots, unless they say otherwise.
+        if 'supports_snapshot' not in vars(cls) and any(
+            getattr(cls, name) is not getattr(StenoDictionary, name)
+            for name in _ENTRIES_READING_METHODS
+        ):
+            cls.supports_snapshot = False
+
     def __init__(self):
         super().__init__()
+        self.generation = 0
         self._longest_key_length = 0
         self._longest_listener_callbacks = set()
-        # Reverse dictionary matches translations to keys by exact match or by "similarity" if required.
-        self.reverse = ReverseStenoDict()
         self.timestamp = 0
         self.readonly = False
         self.enabled = True
         self.path = None
+        # Latest snapshot (see snapshot()).
+        self._snapshot = None
+        # Index of the keys, built on demand (see prefix_key_items/stroke_key_items).
+        self._key_index = None
+        # Reverse dictionary matches translations to keys by exact match or by "similarity" if required.
+        self._set_reverse(ReverseStenoDict())
+
+    def _set_reverse(self, reverse):
+        self.reverse = reverse
         # The special search methods are simple pass-throughs to the reverse dictionary
         self.similar_reverse_lookup = self.reverse.get_similar_keys
         self.partial_reverse_lookup = self.reverse.partial_match_values
         self.regex_reverse_lookup = self.reverse.regex_match_values
+        self.substring_reverse_lookup = self.reverse.substring_match_values
+        self.fuzzy_reverse_lookup = self.reverse.fuzzy_match_values
+        self.partial_reverse_items = self.reverse.partial_match_items
+        self.regex_reverse_items = self.reverse.regex_match_items
+        self.substring_reverse_items = self.reverse.substring_match_items
+        self.phrase_reverse_lookup = self.reverse.phrase_match_values
 
     def __str__(self):
         return '%s(%r)' % (self.__class__.__name__, self.path)
@@ -53,6 +101,15 @@ class StenoDictionary(dict):
     def __repr__(self):
         return str(self)
 
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled):
+        self._enabled = enabled
+        self.generation += 1
+
     @classmethod
     def create(cls, resource):
         assert not resource.startswith(ASSET_SCHEME)
@@ -98,7 +155,9 @@ class StenoDictionary(dict):
         """ Empty the dictionary without altering its file-based attributes. """
         super().clear()
         self.reverse.clear()
+        self._key_index = None
         self._longest_key = 0
+        self.generation += 1
 
     def __setitem__(self, key, value):
         assert not self.readonly
@@ -108,13 +167,19 @@ class StenoDictionary(dict):
             self.reverse.remove_key(self[key], key)
         else:
             self._longest_key = max(self._longest_key, len(key))
+            if self._key_index is not None:
+                self._key_index.add(key)
         super().__setitem__(key, value)
         self.reverse.append_key(value, key)
+        self.generation += 1
 
     def __delitem__(self, key):
         assert not self.readonly
         value = super().pop(key)
         self.reverse.remove_key(value, key)
+        if self._key_index is not None:
+            self._key_index.remove(key)
+        self.generation += 1
         # If the key deleted was the longest, we have no idea what the new longest is, so we must recalculate it.
         if len(key) == self.longest_key:
             self._calculate_longest_key()
@@ -128,12 +193,52 @@ class StenoDictionary(dict):
             # Fast path for when the dicts start out empty.
             super().update(*args, **kwargs)
             self.reverse.match_forward(self)
+            self._key_index = None
             self._calculate_longest_key()
+            self.generation += 1
         else:
             # If items already exist, update dicts one item at a time to be safe.
             for (k, v) in dict(*args, **kwargs).items():
                 self[k] = v
 
+    def snapshot(self):
+        """ Return a read-only copy of the dictionary, for reading it without locking while it may be modified
+            from another thread. The copy is reused as long as the dictionary is not modified (see generation).
+            If the class does not support snapshots (see supports_snapshot), the dictionary itself is returned. """
+        if not self.supports_snapshot:
+            return self
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.generation != self.generation:
+            snapshot = StenoDictionary()
+            dict.update(snapshot, self)
+            snapshot._set_reverse(self.reverse.copy())
+            snapshot._longest_key_length = self._longest_key_length
+            snapshot.timestamp = self.timestamp
+            snapshot.readonly = True
+            snapshot.enabled = self.enabled
+            snapshot.path = self.path
+            snapshot.generation = self.generation
+            snapshot._snapshot = snapshot
+            self._snapshot = snapshot
+        return snapshot
+
+    def _get_key_index(self):
+        key_index = self._key_index
+        if key_index is None:
+            key_index = self._key_index = StenoKeyIndex(self)
+        return key_index
+
+    def prefix_key_items(self, prefix, after=None, reverse=False):
+        """ Return an iterator over the (outline, key) items of the keys with an outline (strokes joined
+            with "/") starting with <prefix>, in outline order (reversed if <reverse> is True), starting
+            after the key <after> in this order if given. """
+        return self._get_key_index().prefix_items(prefix, after, reverse)
+
+    def stroke_key_items(self, strokes, after=None):
+        """ Return a list of the (outline, key) items of the keys containing all the given <strokes>,
+            in outline order, starting after the key <after> if given. """
+        return self._get_key_index().stroke_items(strokes, after)
+
     def reverse_lookup(self, value):
         """
         Return a list of keys that can exactly produce the given value.
@@ -187,9 +292,32 @@ class StenoDictionaryCollection:
         self.filters = []
         self.longest_key = 0
         self.longest_key_callbacks = set()
+        self._generation = 0
         self.set_dicts(dicts)
 
+    @property
+    def generation(self):
+        """ Change token: a new value when the list of dictionaries, their contents, their enabled
+            state, or the filters change. Useful for invalidating caches. Only compare it for equality.
+
+            Note: reading it does not modify the collection, so it can be used from any thread. """
+        return (self._generation, tuple(d.generation for d in self.dicts))
+
+    def snapshot(self):
+        """ Return a read-only copy of the collection, with snapshots of its dictionaries (see
+            `StenoDictionary.snapshot`: only the dictionaries modified since the last snapshot are copied, and
+            the dictionaries not supporting snapshots are shared as is),
+            for lookups and searches without locking while the collection may be modified from another thread. """
+        snapshot = StenoDictionaryCollection()
+        # Note: don't use set_dicts, the snapshots of unmodified dictionaries
+        # are shared, and must not keep references to older collections.
+        snapshot.dicts = [d.snapshot() for d in self.dicts]
+        snapshot.filters = list(self.filters)
+        snapshot.longest_key = self.longest_key
+        return snapshot
+
     def set_dicts(self, dicts):
+        self._generation += 1
         for d in self.dicts:
             d.remove_longest_key_listener(self._longest_key_listener)
         self.dicts = dicts[:]
@@ -258,6 +386,26 @@ class StenoDictionaryCollection:
                         break
         return results
 
+    def _merged_reverse_lookup(self, items_list, max_count=None):
+        """
+        Same as `_multi_reverse_lookup`, but for iterators over the (simkey, translation) items from each
+        dictionary, in the dictionaries sort order (see `plover.dictionary.base.SimilarSearchDict`): they
+        are lazily merged, and only consumed until <max_count> valid results have been found.
+        """
+        results = []
+        old_v = None
+        reverse_lookup = self.reverse_lookup
+        results_append = results.append
+        for (sk, v) in heapq.merge(*items_list):
+            if v != old_v:
+                old_v = v
+                keys = reverse_lookup(v)
+                if keys:
+                    results_append((v, keys))
+                    if max_count is not None and len(results) >= max_count:
+                        break
+        return results
+
     def find_similar(self, value):
         """
         Return a list of similar (or equal) translations to the given value across all enabled dictionaries,
@@ -266,24 +414,118 @@ class StenoDictionaryCollection:
         translations = [t for d in self.dicts if d.enabled for t in d.similar_reverse_lookup(value)]
         return self._multi_reverse_lookup(translations)
 
-    def find_partial(self, pattern, count=None):
+    def find_partial(self, pattern, count=None, after=None):
         """
         Return a list of translations that are similar, equal to, or supersets of the given value across all
         enabled dictionaries, each paired in a tuple with a set of keys that will produce it given the current
         dictionary precedence. After translations that compare similar, the next ones in the sort order
         will usually be supersets. ("test" could return entries for "test", "tested", "testing")
+        If after is given, only return the translations that come after it in the sort order (to resume a search
+        from the last translation returned).
         """
-        translations = [t for d in self.dicts if d.enabled for t in d.partial_reverse_lookup(pattern, count)]
-        return self._multi_reverse_lookup(translations, count)
+        items_list = [d.partial_reverse_items(pattern, after) for d in self.dicts if d.enabled]
+        return self._merged_reverse_lookup(items_list, count)
 
-    def find_regex(self, pattern, count=None):
+    def find_regex(self, pattern, count=None, after=None):
         """
         Return a list of translations that match the given regular expression across all enabled dictionaries,
         each paired in a tuple with a set of keys that will produce it given the current dictionary precedence.
-        If count is given, only return up to that many total matches.
+        If count is given, only return up to that many total matches. If after is given, only return the matches
+        that come after it in the sort order.
+        """
+        items_list = [d.regex_reverse_items(pattern, after) for d in self.dicts if d.enabled]
+        return self._merged_reverse_lookup(items_list, count)
+
+    def find_similar_phrases(self, words):
+        """
+        Return lists of translations similar to each phrase made of the last words of <words> (as split by
+        `plover.dictionary.base.WORD_RX`) across all enabled dictionaries, in a single pass over the words.
+        The result is a list of (start, results) tuples for the phrases <words[start:]> with matches, longest first,
+        with <results> in the same format as `find_similar`.
+        """
+        translations = collections.defaultdict(list)
+        for d in self.dicts:
+            if d.enabled:
+                for start, phrase_translations in d.phrase_reverse_lookup(words):
+                    translations[start].extend(phrase_translations)
+        results = []
+        for start in sorted(translations):
+            phrase_results = self._multi_reverse_lookup(translations[start])
+            if phrase_results:
+                results.append((start, phrase_results))
+        return results
+
+    def find_substring(self, value, count=None, after=None):
+        """
+        Return a list of translations that contain the given value (case-insensitive) across all enabled dictionaries,
+        each paired in a tuple with a set of keys that will produce it given the current dictionary precedence.
+        If count is given, only return up to that many total matches. If after is given, only return the matches
+        that come after it in the sort order.
+        """
+        items_list = [d.substring_reverse_items(value, after) for d in self.dicts if d.enabled]
+        return self._merged_reverse_lookup(items_list, count)
+
+    def find_fuzzy(self, value, count=None, max_distance=None):
+        """
+        Return a list of translations that are within a few edits (insertions, deletions or substitutions of
+        characters, see `plover.dictionary.base.ReverseStenoDict.fuzzy_match_values`) of the given value, after
+        stripping case and certain exterior symbols, across all enabled dictionaries, each paired in a tuple with
+        a set of keys that will produce it given the current dictionary precedence. The closest translations
+        are returned first. If count is given, only return up to that many total matches.
+        """
+        translations = collections.defaultdict(list)
+        for d in self.dicts:
+            if d.enabled:
+                for distance, t in d.fuzzy_reverse_lookup(value, count, max_distance):
+                    translations[distance].append(t)
+        results = []
+        for distance in sorted(translations):
+            results.extend(self._multi_reverse_lookup(translations[distance],
+                                                      None if count is None else count - len(results)))
+            if count is not None and len(results) >= count:
+                break
+        return results
+
+    def _merged_key_lookup(self, items_list, max_count=None):
+        """
+        Merge iterators over the (outline, key) items from each dictionary (see `StenoDictionary.prefix_key_items`),
+        in outline order, and return a list of (key, translation) tuples for the keys with a translation under the
+        current dictionary precedence and filters (see lookup). If max_count is given, only return up to that many.
+        """
+        results = []
+        old_k = None
+        lookup = self.lookup
+        results_append = results.append
+        for (outline, k) in heapq.merge(*items_list):
+            if k != old_k:
+                old_k = k
+                v = lookup(k)
+                if v is not None:
+                    results_append((k, v))
+                    if max_count is not None and len(results) >= max_count:
+                        break
+        return results
+
+    def find_outlines(self, prefix, count=None, after=None):
+        """
+        Return a list of the entries with an outline (strokes joined with "/") starting with the given prefix
+        across all enabled dictionaries, as (key, translation) tuples sorted by outline. ("KPA/" could return
+        entries for ("KPA", "TEFT") and ("KPA", "TEFT", "-D"); "KPA" would also return ("KPAEUR",))
+        If count is given, only return up to that many entries. If after is given, only return the entries
+        that come after this key in the sort order (to resume a search from the last entry returned).
+        """
+        items_list = [d.prefix_key_items(prefix, after) for d in self.dicts if d.enabled]
+        return self._merged_key_lookup(items_list, count)
+
+    def find_stroke_outlines(self, strokes, count=None, after=None):
+        """
+        Return a list of the entries with a key containing all of the given strokes across all enabled
+        dictionaries, as (key, translation) tuples sorted by outline. ("-FRB" could return entries for
+        ("-FRB",) and ("KAR", "-FRB")) If count is given, only return up to that many entries. If after
+        is given, only return the entries that come after this key in the sort order.
         """
-        translations = [t for d in self.dicts if d.enabled for t in d.regex_reverse_lookup(pattern, count)]
-        return self._multi_reverse_lookup(translations, count)
+        items_list = [d.stroke_key_items(strokes, after) for d in self.dicts if d.enabled]
+        return self._merged_key_lookup(items_list, count)
 
     def casereverse_lookup(self, value):
         """ Find translations that are case-insensitive equal to the given value across all enabled dictionaries.
@@ -332,9 +574,11 @@ class StenoDictionaryCollection:
 
     def add_filter(self, f):
         self.filters.append(f)
+        self._generation += 1
 
     def remove_filter(self, f):
         self.filters.remove(f)
+        self._generation += 1
 
     def add_longest_key_listener(self, callback):
         self.longest_key_callbacks.add(callback)
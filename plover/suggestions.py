@@ -1,23 +1,118 @@
 import collections
 import re
+import threading
+import time
 
+from plover import log
+
+from plover.dictionary.base import WORD_RX
 from plover.steno import sort_steno_strokes
 
 
 Suggestion = collections.namedtuple('Suggestion', 'text steno_list')
 
+# Opaque token used to get the next page of a paged search (see `Suggestions.find_page`).
+SearchCursor = collections.namedtuple('SearchCursor', 'search position')
+
 # Hard limit on results returned by search (to avoid slowdown on overly broad searches such as regex .*)
 MATCH_LIMIT = 100
 
+# Maximum number of searches kept in the cache.
+CACHE_SIZE = 256
+
+# Delay (in seconds) without new searches before a search worker starts the latest one.
+SEARCH_DEBOUNCE_DELAY = 0.15
+
+# Number of suggestions looked up at a time by search workers.
+SEARCH_CHUNK_SIZE = 20
+
 
 class Suggestions:
     def __init__(self, dictionary):
         self.dictionary = dictionary
+        # Search arguments -> suggestions, in least recently used order.
+        # Invalidated when the dictionary generation changes.
+        self._cache = collections.OrderedDict()
+        self._cache_generation = None
+        # Searches can be done from several threads.
+        self._cache_lock = threading.Lock()
 
-    def find(self, translation, count=MATCH_LIMIT, partial=False, regex=False):
+    def find(self, translation, count=MATCH_LIMIT, partial=False, regex=False, substring=False, fuzzy=False):
         """ Find translations that are equal or similar (different case, prefixes, suffixes, etc.) to the given one.
-            Special search types such as partial words and regular expressions are also available.
+            Special search types such as partial words, substrings, regular expressions and fuzzy matching
+            (tolerating a few typos, closest matches first) are also available.
             Return a list of suggestion tuples with these translations along with the strokes that can produce them. """
+        return _copy_suggestions(self._cached(self._find, translation, count, partial, regex, substring, fuzzy))
+
+    def find_page(self, translation, count=MATCH_LIMIT, cursor=None,
+                  partial=False, regex=False, substring=False, fuzzy=False):
+        """ Paged version of `find`: return a tuple with a list of at most <count> suggestions, and a cursor to
+            pass back with the same search arguments to get the next page (None if there are no more results).
+            Partial, regex and substring searches resume from the last translation of the previous page in the
+            dictionaries sort order, so getting the next page does not redo the search, and the number of results
+            is not limited by `MATCH_LIMIT`. Other searches are ranked, and are paged through the full results. """
+        search = (translation, partial, regex, substring, fuzzy)
+        if cursor is not None and cursor.search != search:
+            raise ValueError('cursor is for another search: %r' % (cursor.search,))
+        position = None if cursor is None else cursor.position
+        # Don't bother looking for suggestions on empty strings or whitespace.
+        if not translation or translation.isspace():
+            return [], None
+        next_cursor = None
+        if regex or partial or substring:
+            if regex:
+                find_fn = self.dictionary.find_regex
+            elif partial:
+                find_fn = self.dictionary.find_partial
+            else:
+                find_fn = self.dictionary.find_substring
+            # Look for one more result, to know if there's a next page.
+            try:
+                items = find_fn(translation, count + 1, after=position)
+            except re.error as e:
+                return [Suggestion("Invalid regular expression", [(e.msg,)])], None
+            if len(items) > count:
+                del items[count:]
+                next_cursor = SearchCursor(search, items[-1][0])
+        else:
+            offset = position or 0
+            items = self._cached(self._find_ranked, translation, fuzzy)
+            if len(items) > offset + count:
+                next_cursor = SearchCursor(search, offset + count)
+            items = items[offset:offset + count]
+        return _make_suggestions(translation, items), next_cursor
+
+    def find_phrases(self, words):
+        """ Find translations that are similar to each phrase made of the last words of <words> (for example
+            the last words output, as split by `WORD_RX`), with a single pass over the words. This is equivalent
+            to calling `find` on each of those phrases, longest first, and concatenating the results. """
+        return _copy_suggestions(self._cached(self._find_phrases, tuple(words)))
+
+    def _cached(self, find_fn, *args):
+        # Note: the cached results are returned as is, and must not be modified.
+        generation = getattr(self.dictionary, 'generation', None)
+        if generation is None:
+            # No way to detect changes: don't cache.
+            return find_fn(*args)
+        key = (find_fn.__name__,) + args
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                self._cache.clear()
+                self._cache_generation = generation
+            suggestions = self._cache.get(key)
+            if suggestions is not None:
+                self._cache.move_to_end(key)
+                return suggestions
+        # Note: search without holding the lock.
+        suggestions = find_fn(*args)
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self._cache[key] = suggestions
+                if len(self._cache) > CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return suggestions
+
+    def _find(self, translation, count, partial, regex, substring, fuzzy):
         suggestions = []
         # Don't bother looking for suggestions on empty strings or whitespace.
         if translation and not translation.isspace():
@@ -30,14 +125,141 @@ class Suggestions:
                     return [Suggestion("Invalid regular expression", [(e.msg,)])]
             elif partial:
                 items = self.dictionary.find_partial(translation, max_matches)
+            elif substring:
+                items = self.dictionary.find_substring(translation, max_matches)
+            elif fuzzy:
+                items = self.dictionary.find_fuzzy(translation, max_matches)
             else:
                 items = self.dictionary.find_similar(translation)[:max_matches]
-            # Package the lookup results into namedtuples for display.
-            for (t, kl) in items:
-                s = Suggestion(t, sort_steno_strokes(kl))
-                # If we got an exact match, put it at the top of the list, otherwise append the results in order.
-                if t == translation:
-                    suggestions.insert(0, s)
-                else:
-                    suggestions.append(s)
+            suggestions = _make_suggestions(translation, items)
         return suggestions
+
+    def _find_ranked(self, translation, fuzzy):
+        if fuzzy:
+            return self.dictionary.find_fuzzy(translation)
+        return self.dictionary.find_similar(translation)
+
+    def _find_phrases(self, words):
+        suggestions = []
+        for start, items in self.dictionary.find_similar_phrases(words):
+            suggestions.extend(_make_suggestions(''.join(words[start:]), items[:MATCH_LIMIT]))
+        return suggestions
+
+
+def _copy_suggestions(suggestions):
+    """ Copy cached suggestions, so callers can modify them. """
+    return [Suggestion(s.text, list(s.steno_list)) for s in suggestions]
+
+
+def _make_suggestions(translation, items):
+    """ Package the lookup results for <translation> into namedtuples for display. """
+    suggestions = []
+    for (t, kl) in items:
+        s = Suggestion(t, sort_steno_strokes(kl))
+        # If we got an exact match, put it at the top of the list, otherwise append the results in order.
+        if t == translation:
+            suggestions.insert(0, s)
+        else:
+            suggestions.append(s)
+    return suggestions
+
+
+class SearchWorker(threading.Thread):
+    """ Run searches from a dedicated thread, and deliver their results to a callback.
+
+    Only the latest search matters: submitting a new one supersedes the pending or running one,
+    which is cancelled. Searches are debounced: a search only starts once no new one has been
+    submitted for <delay> seconds, so searches superseded while the user is still typing are never run.
+
+    Paged searches are run in chunks of <chunk_size> suggestions (see `Suggestions.find_page`),
+    so a cancelled search is abandoned at the next chunk. All the chunks of a search are looked
+    up in the same snapshot of the dictionaries (see `StenoEngine.get_suggestions_snapshot`),
+    so changes to the dictionaries during the search don't affect its results.
+
+    The callback is called from the worker thread with the search identifier (as returned when
+    submitting it) and its results (as returned by `Suggestions.find_page` or `Suggestions.find_phrases`).
+    """
+
+    def __init__(self, engine, callback, delay=SEARCH_DEBOUNCE_DELAY, chunk_size=SEARCH_CHUNK_SIZE):
+        super().__init__(name='search', daemon=True)
+        self.engine = engine
+        self.callback = callback
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self._condition = threading.Condition()
+        # Latest search not started yet: (identifier, submission time, function, arguments).
+        self._pending = None
+        self._last_id = 0
+        self._stopped = False
+
+    def _submit(self, fn, *args):
+        with self._condition:
+            self._last_id += 1
+            self._pending = (self._last_id, time.perf_counter(), fn, args)
+            self._condition.notify()
+            return self._last_id
+
+    def find_page(self, translation, count=MATCH_LIMIT, cursor=None, **kwargs):
+        """ Submit a paged search (same arguments as `Suggestions.find_page`), and return its identifier. """
+        return self._submit(self._find_page, translation, count, cursor, kwargs)
+
+    def find_phrases(self, words):
+        """ Submit a phrases search (see `Suggestions.find_phrases`), and return its identifier. """
+        return self._submit(self._find_phrases, words)
+
+    def cancel(self):
+        """ Cancel the pending or running search, if any. """
+        self._submit(None)
+
+    def is_cancelled(self, search_id):
+        return search_id != self._last_id
+
+    def stop(self):
+        """ Stop the worker (cancelling any search). """
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._last_id += 1
+            self._condition.notify()
+
+    def _find_page(self, search_id, translation, count, cursor, kwargs):
+        snapshot = self.engine.get_suggestions_snapshot()
+        suggestions = []
+        while True:
+            chunk_size = min(self.chunk_size, count - len(suggestions))
+            page, cursor = snapshot.find_page(translation, count=chunk_size, cursor=cursor, **kwargs)
+            suggestions.extend(page)
+            if cursor is None or len(suggestions) >= count:
+                break
+            if self.is_cancelled(search_id):
+                return None
+        # Like for a single page: put an exact match at the top.
+        suggestions.sort(key=lambda s: s.text != translation)
+        return suggestions, cursor
+
+    def _find_phrases(self, search_id, words):
+        return self.engine.get_phrase_suggestions(words)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    if self._pending is not None:
+                        delay = self._pending[1] + self.delay - time.perf_counter()
+                        if delay <= 0:
+                            break
+                    else:
+                        delay = None
+                    self._condition.wait(delay)
+                search_id, submitted, fn, args = self._pending
+                self._pending = None
+            if fn is None:
+                continue
+            try:
+                result = fn(search_id, *args)
+                if result is not None and not self.is_cancelled(search_id):
+                    self.callback(search_id, result)
+            except Exception:
+                log.error('search %r failed', args, exc_info=True)
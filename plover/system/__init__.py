@@ -1,29 +1,28 @@
 import collections
+import errno
 from itertools import count
 import os
 import re
 
 from plover.oslayer.config import CONFIG_DIR, ASSETS_DIR
 from plover.registry import registry
+from plover.wordlist import Wordlist
 
 
 def _load_wordlist(filename):
     if filename is None:
-        return {}
+        return Wordlist()
     for dir in (CONFIG_DIR, ASSETS_DIR):
         path = os.path.realpath(os.path.join(dir, filename))
         if os.path.exists(path):
             break
-    # Split the file on all whitespace, leaving a list of alternating
-    # fields: [word, rank, word, rank,...]. Then make an iterator and
-    # include it twice in a zip so that it gets polled twice each iteration.
-    # This will shift out pairs of (word: rank) to the dict, and since the
-    # rank is a single ASCII digit, getting the ordinal is the cheapest way
-    # to convert to a small numeric type that preserves ordering.
-    with open(path, encoding='utf-8') as f:
-        fields = f.read().split()
-    i = iter(fields)
-    return dict(zip(i, map(ord, i)))
+    else:
+        # Fail now, when setting up the system, not on first use.
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), filename)
+    # The wordlist is only loaded (from its compiled
+    # cache when possible) on first orthography use.
+    cache_path = os.path.join(CONFIG_DIR, filename + '.cache')
+    return Wordlist(path, cache_path)
 
 def _key_order(keys, numbers):
     """ Make an ordinal mapping of steno keys starting from 0.
@@ -60,5 +59,8 @@ def setup(system_name):
         system_symbols[symbol] = init(mod)
     system_symbols['NAME'] = system_name
     globals().update(system_symbols)
+    # Cached orthography results depend on the system.
+    from plover import orthography
+    orthography.clear_cache()
 
 NAME = None
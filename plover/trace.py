@@ -0,0 +1,144 @@
+"""Low-overhead tracing of Plover's activity.
+
+When enabled, spans (named durations) are recorded in a ring buffer,
+that can be dumped using the Chrome trace event format, for viewing
+with `chrome://tracing` or https://ui.perfetto.dev.
+
+Tracing can be enabled from the command line (`--trace`), or toggled
+with the `{PLOVER:TRACE}` command: the trace is written when tracing is
+stopped, or on exit.
+"""
+
+from collections import deque
+from functools import wraps
+import json
+import os
+import threading
+import time
+
+from plover.oslayer.config import CONFIG_DIR
+
+
+# Maximum number of spans kept: only the latest are written.
+BUFFER_SIZE = 100000
+
+# Where the trace is written.
+filename = os.path.join(CONFIG_DIR, 'trace.json')
+
+_enabled = False
+# Recorded spans: (name, start, end, thread identifier, arguments).
+_spans = deque(maxlen=BUFFER_SIZE)
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def clear():
+    _spans.clear()
+
+
+class _Span:
+
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _spans.append((self.name, self.start, time.perf_counter(),
+                       threading.get_ident(), self.args))
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """ Return a context manager recording a span, with optional arguments. """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name):
+    """ Decorator recording a span for each call of the decorated function. """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _spans.append((name, start, time.perf_counter(),
+                               threading.get_ident(), None))
+        return wrapper
+    return decorator
+
+
+def trace_events():
+    """ Return the recorded spans as a list of Chrome trace events. """
+    pid = os.getpid()
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    events = []
+    thread_ids = set()
+    for name, start, end, tid, args in list(_spans):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        events.append(event)
+        thread_ids.add(tid)
+    for tid in sorted(thread_ids):
+        if tid in thread_names:
+            events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': pid,
+                'tid': tid,
+                'args': {'name': thread_names[tid]},
+            })
+    return events
+
+
+def dump(fname=None):
+    """ Write the trace to <fname> (default: `filename`), and return its path. """
+    if fname is None:
+        fname = filename
+    with open(fname, 'w', encoding='utf-8') as fp:
+        json.dump({
+            'traceEvents': trace_events(),
+            'displayTimeUnit': 'ms',
+        }, fp)
+    return fname
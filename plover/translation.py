@@ -22,6 +22,7 @@ import re
 from plover.steno import Stroke
 from plover.steno_dictionary import StenoDictionaryCollection
 from plover.registry import registry
+from plover.trace import traced
 from plover import system
 
 
@@ -102,6 +103,9 @@ class Translation(list):
     formatting -- Information stored on the translation by the formatter for
     sticky state (e.g. capitalize next stroke) and to hold undo info.
 
+    text_tail -- A snapshot, taken by the formatter, of the last characters
+    of the output text after this translation was formatted.
+
     """
 
     def __init__(self, outline, translation):
@@ -120,6 +124,7 @@ class Translation(list):
         self.english = translation
         self.replaced = []
         self.formatting = []
+        self.text_tail = None
         self.is_retrospective_command = False
 
     def __str__(self):
@@ -277,6 +282,7 @@ class Translator:
         """Reset the sate of the translator."""
         self._state = _State()
 
+    @traced('Translator.translate_stroke')
     def translate_stroke(self, stroke):
         """Process a stroke.
 
@@ -320,6 +326,7 @@ class Translator:
         self._state.translations.extend(translations)
         self._to_do += len(translations)
 
+    @traced('Translator._find_translation')
     def _find_translation(self, stroke, normal=True, suffixes=(), prefixes=()):
         # Figure out how much of the translation buffer can be involved in this stroke and
         # build the stroke list for translation. The longest key with an entry in the
@@ -0,0 +1,203 @@
+"""Compact, lazily loaded wordlist.
+
+The wordlist text file, made of `word rank` pairs, is compiled into
+a binary cache file, memory-mapped on first use. The cache layout is:
+
+- header: magic, format version, sizes of the other sections
+- signature: identify the source file the cache was compiled from
+- offsets: (uint32) offset of each word in the words section, plus end offset
+- table: (uint32) open addressing hash table of word indexes (plus one, so 0 is empty)
+- ranks: (uint8) rank of each word
+- words: UTF-8 encoded words, sorted and concatenated
+
+Note: integers are stored in native byte order, the cache is only meant to be
+used on the machine where it was created.
+"""
+
+from array import array
+from collections.abc import Mapping
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from plover import log
+
+
+_MAGIC = b'PLOVERWL'
+_VERSION = 1
+# Magic, version, signature size, count, table size, words size.
+_HEADER = struct.Struct('=8sIIIII')
+
+
+def _source_signature(filename):
+    stat = os.stat(filename)
+    return ('%s\0%u\0%u\0%s' % (os.path.realpath(filename), stat.st_mtime_ns,
+                                stat.st_size, sys.byteorder)).encode('utf-8')
+
+
+def compile_wordlist(filename):
+    """ Compile the wordlist text file <filename>, return the cache contents. """
+    # Split the file on all whitespace, leaving a list of alternating
+    # fields: [word, rank, word, rank,...]. Then make an iterator and
+    # include it twice in a zip so that it gets polled twice each iteration.
+    # This will shift out pairs of (word: rank) to the dict, and since the
+    # rank is a single ASCII digit, getting the ordinal is the cheapest way
+    # to convert to a small numeric type that preserves ordering.
+    with open(filename, encoding='utf-8') as f:
+        fields = f.read().split()
+    i = iter(fields)
+    ranks = dict(zip(i, map(ord, i)))
+    words = sorted(ranks)
+    encoded_words = [w.encode('utf-8') for w in words]
+    offsets = array('I', [0])
+    offset = 0
+    for w in encoded_words:
+        offset += len(w)
+        offsets.append(offset)
+    # Keep the hash table load factor under 50%.
+    table_size = 8
+    while table_size < 2 * len(words):
+        table_size *= 2
+    mask = table_size - 1
+    table = array('I', [0]) * table_size
+    for n, w in enumerate(encoded_words, 1):
+        h = zlib.crc32(w) & mask
+        while table[h]:
+            h = (h + 1) & mask
+        table[h] = n
+    signature = _source_signature(filename)
+    # Pad the signature so the integer arrays are aligned.
+    signature += b'\0' * (-len(signature) % 4)
+    return b''.join((
+        _HEADER.pack(_MAGIC, _VERSION, len(signature), len(words), table_size, offset),
+        signature,
+        offsets.tobytes(),
+        table.tobytes(),
+        bytes(ranks[w] for w in words),
+    ) + tuple(encoded_words))
+
+
+class Wordlist(Mapping):
+    """ Read-only mapping of words to their rank.
+
+    The wordlist is only loaded on first access: from the cache file if it's
+    up to date with the source file, otherwise the source is compiled (and
+    the cache file updated).
+    """
+
+    def __init__(self, filename=None, cache_filename=None):
+        self.filename = filename
+        self.cache_filename = cache_filename
+        self._loaded = False
+        self._count = 0
+        self._mask = 0
+        self._offsets = self._table = self._ranks = self._words = ()
+
+    def __str__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.filename)
+
+    __repr__ = __str__
+
+    def _load_cache(self):
+        with open(self.cache_filename, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, signature_size = _HEADER.unpack_from(data)[:3]
+        if (magic, version) == (_MAGIC, _VERSION):
+            signature = bytes(data[_HEADER.size:_HEADER.size + signature_size])
+            if signature.rstrip(b'\0') == _source_signature(self.filename):
+                return data
+        data.close()
+        return None
+
+    def _save_cache(self, data):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_filename)), exist_ok=True)
+        tmp = self.cache_filename + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, self.cache_filename)
+
+    def _load(self):
+        if self.filename is None:
+            self._loaded = True
+            return
+        data = None
+        if self.cache_filename is not None:
+            try:
+                data = self._load_cache()
+            except FileNotFoundError:
+                # First use: nothing worth reporting.
+                log.debug('no wordlist cache: %s', self.cache_filename)
+            except (OSError, ValueError, struct.error) as e:
+                log.info('invalid wordlist cache `%s`: %s', self.cache_filename, str(e))
+            else:
+                if data is None:
+                    log.info('outdated wordlist cache: %s', self.cache_filename)
+        if data is None:
+            data = compile_wordlist(self.filename)
+            if self.cache_filename is not None:
+                try:
+                    self._save_cache(data)
+                except OSError as e:
+                    log.warning('saving wordlist cache `%s` failed: %s',
+                                self.cache_filename, str(e))
+        magic, version, signature_size, count, table_size, words_size = \
+            _HEADER.unpack_from(data)
+        view = memoryview(data)
+        offset = _HEADER.size + signature_size
+        sections = []
+        for size in (4 * (count + 1), 4 * table_size, count, words_size):
+            sections.append(view[offset:offset + size])
+            offset += size
+        offsets, table, ranks, words = sections
+        self._offsets = offsets.cast('I')
+        self._table = table.cast('I')
+        self._ranks = ranks
+        self._words = words
+        self._mask = table_size - 1
+        self._count = count
+        # Only now: if loading failed, it is tried again on next use.
+        self._loaded = True
+
+    def _index(self, word):
+        """ Return the index of <word>, or -1 if it's not in the list. """
+        if not self._loaded:
+            self._load()
+        if not self._count:
+            return -1
+        try:
+            key = word.encode('utf-8')
+        except (AttributeError, UnicodeEncodeError):
+            return -1
+        offsets, table, words, mask = self._offsets, self._table, self._words, self._mask
+        h = zlib.crc32(key) & mask
+        while True:
+            n = table[h]
+            if not n:
+                return -1
+            if words[offsets[n - 1]:offsets[n]] == key:
+                return n - 1
+            h = (h + 1) & mask
+
+    def __contains__(self, word):
+        return self._index(word) >= 0
+
+    def __getitem__(self, word):
+        n = self._index(word)
+        if n < 0:
+            raise KeyError(word)
+        return self._ranks[n]
+
+    def __len__(self):
+        if not self._loaded:
+            self._load()
+        return self._count
+
+    def __iter__(self):
+        """ Iterate over the words, in sorted order. """
+        if not self._loaded:
+            self._load()
+        offsets, words = self._offsets, self._words
+        for n in range(self._count):
+            yield str(words[offsets[n]:offsets[n + 1]], 'utf-8')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+'''Micro-benchmarks for performance sensitive parts of Plover.
+
+Usage: python -m plover_build_utils.benchmark [BENCHMARK...]
+'''
+
+import argparse
+import random
+import timeit
+
+from plover import system
+from plover.config import DEFAULT_SYSTEM_NAME
+from plover.registry import registry
+
+
+def _report(name, count, seconds):
+    print('%-40s %10u calls %10.3f us/call' % (name, count, seconds * 1e6 / count))
+
+
+def bench_orthography(args):
+    '''Suffix strokes over a sample of the orthography wordlist.'''
+    from plover import orthography
+    suffixes = ('s', 'ed', 'ing', 'ly', 'er', 'ist', 'able', 'ry', 'cy', 'en', 'ful')
+    words = sorted(system.ORTHOGRAPHY_WORDS)
+    random.seed(args.seed)
+    corpus = [(word, suffix)
+              for word in random.sample(words, min(args.words, len(words)))
+              for suffix in suffixes]
+    add_suffix = orthography._add_suffix
+    # Uncached: rules matching and wordlist filtering on every call.
+    uncached_add_suffix = add_suffix.__wrapped__
+    seconds = min(timeit.repeat(lambda: [uncached_add_suffix(w, s) for w, s in corpus],
+                                repeat=args.repeat, number=1))
+    _report('orthography (uncached)', len(corpus), seconds)
+    # Cached: steady state, with a working set fitting in the cache.
+    working_set = corpus[:orthography.CACHE_SIZE]
+    for w, s in working_set:
+        add_suffix(w, s)
+    seconds = min(timeit.repeat(lambda: [add_suffix(w, s) for w, s in working_set],
+                                repeat=args.repeat, number=1))
+    _report('orthography (cached)', len(working_set), seconds)
+    print(add_suffix.cache_info())
+
+
+BENCHMARKS = {
+    name[6:]: fn
+    for name, fn in globals().items()
+    if name.startswith('bench_')
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run micro-benchmarks.')
+    parser.add_argument('-s', '--system', default=DEFAULT_SYSTEM_NAME,
+                        help='steno system to use')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of times each benchmark is repeated')
+    parser.add_argument('-w', '--words', type=int, default=2000,
+                        help='size of the words corpus sample')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed used for sampling')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='benchmarks to run (default: all): %s' % ', '.join(sorted(BENCHMARKS)))
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('invalid benchmark: %s' % name)
+    registry.update()
+    system.setup(args.system)
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
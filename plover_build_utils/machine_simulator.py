@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+
+'''Simulate serial stenotype machines, for testing without hardware.
+
+A pty pair is opened: the machine plugin is pointed at the slave side,
+and the simulator speaks the machine protocol on the master side (for
+Stentura, this includes answering the OPEN/READC requests).
+
+Strokes are replayed from a file (one stroke per line, in steno notation,
+multiple strokes can be separated with `/`), or randomly generated, at
+a configurable rate and jitter.
+
+Usage:
+
+- python -m plover_build_utils.machine_simulator serve MACHINE [STROKES_FILE]
+
+  Simulate a machine, printing the port to configure in Plover.
+
+- python -m plover_build_utils.machine_simulator bench [MACHINE...]
+
+  Measure throughput (all strokes sent at once), stroke latency (from
+  the simulator sending a stroke to the plugin notifying it), and
+  recovery from packet loss (with `--loss`), for each machine plugin.
+'''
+
+import argparse
+import os
+import random
+import select
+import struct
+import threading
+import time
+
+from plover import system
+from plover.config import DEFAULT_SYSTEM_NAME
+from plover.machine import geminipr, procat, stentura, txbolt
+from plover.metrics import percentile
+from plover.registry import registry
+from plover.steno import Stroke
+
+from plover_build_utils.testing import steno_to_stroke
+
+
+def encode_gemini_pr(keys):
+    packet = bytearray(geminipr.BYTES_PER_STROKE)
+    packet[0] = 0x80
+    for key in keys:
+        n = geminipr.STENO_KEY_CHART.index(key)
+        packet[n // 7] |= 0x40 >> (n % 7)
+    return bytes(packet)
+
+
+def encode_tx_bolt(keys):
+    key_sets = {}
+    for key in keys:
+        n = txbolt.STENO_KEY_CHART.index(key)
+        key_set = n // 6
+        key_sets[key_set] = key_sets.get(key_set, key_set << 6) | (1 << (n % 6))
+    if not key_sets:
+        return b''
+    packet = bytes(key_sets[key_set] for key_set in sorted(key_sets))
+    if packet[0] >> 6:
+        # Make sure the stroke is not merged with the previous one.
+        packet = b'\0' + packet
+    return packet
+
+
+def encode_passport(keys):
+    return b'<0/' + b''.join(key.encode() + b'f' for key in keys) + b'/0>'
+
+
+def encode_procat(keys):
+    packet = bytearray(procat.BYTES_PER_STROKE)
+    packet[3] = 0xff
+    for key in keys:
+        n = procat.STENO_KEY_CHART.index(key)
+        packet[n // 8] |= 0x80 >> (n % 8)
+    return bytes(packet)
+
+
+def encode_stentura(keys):
+    packet = bytearray(b'\xc0' * 4)
+    for key in keys:
+        n = stentura._STENO_KEY_CHART.index(key)
+        packet[n // 6] |= 1 << (5 - n % 6)
+    return bytes(packet)
+
+
+ENCODERS = {
+    'Gemini PR': encode_gemini_pr,
+    'Passport': encode_passport,
+    'ProCAT': encode_procat,
+    'Stentura': encode_stentura,
+    'TX Bolt': encode_tx_bolt,
+}
+
+
+def machine_keys(steno, machine):
+    ''' Return the keys of <machine> to press for the <steno> stroke,
+        according to the current system default keymap. '''
+    machine_class = registry.get_plugin('machine', machine).obj
+    mappings = system.KEYMAPS.get(machine)
+    if mappings is None:
+        mappings = system.KEYMAPS[machine_class.KEYMAP_MACHINE_TYPE]
+    numbers = {v: k for k, v in system.NUMBERS.items()}
+    keys = []
+    for steno_key in steno_to_stroke(steno).steno_keys:
+        if steno_key in numbers:
+            steno_key = numbers[steno_key]
+            keys.append(mappings[system.NUMBER_KEY])
+        keys.append(mappings[steno_key])
+    return sorted({k if isinstance(k, str) else k[0] for k in keys})
+
+
+def load_strokes(filename):
+    ''' Load a stroke stream: return a list of steno strokes. '''
+    strokes = []
+    with open(filename, encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                strokes.extend(line.split('/'))
+    return strokes
+
+
+def random_strokes(count, seed=None):
+    ''' Generate <count> random steno strokes. '''
+    rnd = random.Random(seed)
+    keys = [k for k in system.KEYS if k != system.NUMBER_KEY]
+    return [Stroke(rnd.sample(keys, rnd.randint(1, 6))).rtfcre
+            for __ in range(count)]
+
+
+def _make_stentura_response(seq, action, p1=0, data=b''):
+    length = 14 + (len(data) + 2 if data else 0)
+    response = bytearray(length)
+    struct.pack_into('<2B5H', response, 0, 1, seq, length, action, 0, p1, 0)
+    struct.pack_into('<H', response, 12, stentura._crc(response, 1, 11))
+    if data:
+        response[14:14 + len(data)] = data
+        struct.pack_into('<H', response, length - 2, stentura._crc(data))
+    return bytes(response)
+
+
+class MachineSimulator:
+    ''' Simulate a <machine> on the master side of a pty.
+
+    Strokes (lists of machine keys) passed to `send` are typed at <rate>
+    strokes per second (0: as fast as possible), with each interval
+    randomly varied by up to <jitter> (a fraction of the interval).
+
+    With <loss>, a fraction of the packets is corrupted (a byte is
+    dropped) or, for Stentura, a fraction of the responses are lost.
+    '''
+
+    def __init__(self, machine, rate=10.0, jitter=0.0, loss=0.0,
+                 hold_off=0.5, seed=None):
+        self.machine = machine
+        self.rate = rate
+        self.jitter = jitter
+        self.loss = loss
+        self.hold_off = hold_off
+        self._encode = ENCODERS[machine]
+        self._random = random.Random(seed)
+        self._master = self._slave = None
+        self.port = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._typists = []
+        # Time each stroke was typed.
+        self.times = []
+        # Stentura realtime file.
+        self._realtime = bytearray()
+        self._realtime_cond = threading.Condition()
+
+    def open(self):
+        ''' Open the pty pair, and return the name of the port to use. '''
+        import tty
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        if self.machine == 'Stentura':
+            self._start_thread(self._serve_stentura)
+        return self.port
+
+    def close(self):
+        self._stop.set()
+        with self._realtime_cond:
+            self._realtime_cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def send(self, strokes):
+        ''' Start typing <strokes>, in the background. '''
+        self._typists.append(self._start_thread(self._type_strokes, list(strokes)))
+
+    def wait(self):
+        ''' Wait until all the strokes have been typed. '''
+        for thread in self._typists:
+            thread.join()
+        self._typists = []
+
+    def _type_strokes(self, strokes):
+        interval = 1.0 / self.rate if self.rate else 0.0
+        deadline = time.perf_counter()
+        for keys in strokes:
+            if interval:
+                deadline += interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+                delay = deadline - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    return
+            elif self._stop.is_set():
+                return
+            self._type(self._encode(keys))
+
+    def _type(self, packet):
+        if self.machine == 'Stentura':
+            with self._realtime_cond:
+                self.times.append(time.perf_counter())
+                self._realtime.extend(packet)
+                self._realtime_cond.notify_all()
+            return
+        if self.loss and self._random.random() < self.loss:
+            n = self._random.randrange(len(packet))
+            packet = packet[:n] + packet[n + 1:]
+        self.times.append(time.perf_counter())
+        while packet:
+            packet = packet[os.write(self._master, packet):]
+
+    def _read_request(self, buf):
+        ''' Read a complete request into <buf>, return its size (0 if stopped). '''
+        while True:
+            if len(buf) >= 4:
+                length = struct.unpack_from('<H', buf, 2)[0]
+                if len(buf) >= length:
+                    return length
+            ready = select.select([self._master], [], [], 0.1)[0]
+            if self._stop.is_set():
+                return 0
+            if ready:
+                buf.extend(os.read(self._master, 1024))
+
+    def _serve_stentura(self):
+        buf = bytearray()
+        position = 0
+        last_seq, last_response = None, None
+        while True:
+            length = self._read_request(buf)
+            if not length:
+                return
+            request, buf[:] = bytes(buf[:length]), buf[length:]
+            seq, __, action, __, __, p3 = struct.unpack_from('<B5H', request, 1)
+            if seq == last_seq:
+                # Retry: send the same response again.
+                response = last_response
+            elif action == stentura._READC:
+                with self._realtime_cond:
+                    if position == len(self._realtime) and self.hold_off:
+                        self._realtime_cond.wait(self.hold_off)
+                    data = bytes(self._realtime[position:position + min(p3, 512)])
+                position += len(data)
+                response = _make_stentura_response(seq, action, len(data), data)
+            else:
+                response = _make_stentura_response(seq, action)
+            last_seq, last_response = seq, response
+            if self.loss and self._random.random() < self.loss:
+                continue
+            while response:
+                response = response[os.write(self._master, response):]
+
+
+def _create_machine(name, port, serial_timeout=None):
+    machine_class = registry.get_plugin('machine', name).obj
+    params = {k: v[0] for k, v in machine_class.get_option_info().items()}
+    params['port'] = port
+    if serial_timeout is not None:
+        params['timeout'] = serial_timeout
+    return machine_class(params)
+
+
+# How many sent strokes ahead a received stroke is looked for (see `_match_strokes`).
+MATCH_WINDOW = 64
+
+
+def _match_strokes(sent, received, window=MATCH_WINDOW):
+    ''' Match <received> strokes to <sent> strokes, return the list of
+        matching indexes pairs.
+
+        Strokes are received in order, but some can be lost or corrupted:
+        each received stroke is matched to the next identical sent stroke,
+        looking at most <window> strokes ahead (so a corrupted stroke does
+        not make the rest of the replay unmatched, and matching is linear
+        in the number of strokes).
+    '''
+    pairs = []
+    i = 0
+    for j, keys in enumerate(received):
+        for k in range(i, min(i + window, len(sent))):
+            if sent[k] == keys:
+                pairs.append((k, j))
+                i = k + 1
+                break
+    return pairs
+
+
+def replay(name, strokes, rate=10.0, jitter=0.0, loss=0.0, hold_off=0.5,
+           seed=None, timeout=2.0, serial_timeout=None):
+    ''' Replay <strokes> (steno) on a simulated <name> machine plugin.
+
+    The machine read timeout can be overridden with <serial_timeout>
+    (in seconds): a short one makes stopping the machine faster.
+
+    Return a tuple `(duration, received, latencies)`: with <received> the
+    number of strokes correctly received (in order), and <latencies>
+    the sorted latencies (in seconds) for those strokes.
+    '''
+    sent = [machine_keys(steno, name) for steno in strokes]
+    received = []
+    received_times = []
+    done = threading.Event()
+    def on_strokes(batch, timestamp):
+        for keys in batch:
+            received.append(sorted(keys))
+            received_times.append(timestamp)
+        if len(received) >= len(sent):
+            done.set()
+    ready = threading.Event()
+    def on_state(state):
+        if state != 'initializing':
+            ready.set()
+    with MachineSimulator(name, rate=rate, jitter=jitter, loss=loss,
+                          hold_off=hold_off, seed=seed) as simulator:
+        machine = _create_machine(name, simulator.port, serial_timeout)
+        machine.add_stroke_callback(on_strokes, batch=True)
+        machine.add_state_callback(on_state)
+        machine.start_capture()
+        try:
+            ready.wait(timeout + 1)
+            start = time.perf_counter()
+            simulator.send(sent)
+            simulator.wait()
+            done.wait(timeout)
+            duration = time.perf_counter() - start
+        finally:
+            machine.stop_capture()
+    latencies = [received_times[r] - simulator.times[s]
+                 for s, r in _match_strokes(sent, received)]
+    return duration, len(latencies), sorted(latencies)
+
+
+def bench(args):
+    machines = args.machines or sorted(ENCODERS)
+    strokes = load_strokes(args.strokes) if args.strokes else random_strokes(args.count, args.seed)
+    print('%-10s %-10s %8s %8s %14s %8s %8s %8s' % (
+        'machine', 'mode', 'strokes', 'received', 'strokes/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    modes = [('burst', 0.0, 0.0), ('%g/s' % args.rate, args.rate, 0.0)]
+    if args.loss:
+        modes.append(('loss', args.rate, args.loss))
+    for name in machines:
+        for mode, rate, loss in modes:
+            duration, received, latencies = replay(
+                name, strokes, rate=rate, jitter=args.jitter, loss=loss,
+                hold_off=args.hold_off, seed=args.seed)
+            if latencies:
+                p50, p95, p99 = (percentile(latencies, p) * 1e3 for p in (50, 95, 99))
+            else:
+                p50 = p95 = p99 = float('nan')
+            print('%-10s %-10s %8u %8u %14.1f %8.2f %8.2f %8.2f' % (
+                name, mode, len(strokes), received, received / duration,
+                p50, p95, p99))
+
+
+def serve(args):
+    if args.strokes:
+        strokes = load_strokes(args.strokes)
+    else:
+        strokes = random_strokes(args.count, args.seed)
+    with MachineSimulator(args.machine, rate=args.rate, jitter=args.jitter,
+                          loss=args.loss, hold_off=args.hold_off,
+                          seed=args.seed) as simulator:
+        print('simulating %s on: %s' % (args.machine, simulator.port))
+        input('press enter to start typing...')
+        simulator.send(machine_keys(steno, args.machine) for steno in strokes)
+        simulator.wait()
+        input('done, press enter to exit...')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate serial stenotype machines.')
+    parser.add_argument('-s', '--system', default=DEFAULT_SYSTEM_NAME,
+                        help='steno system to use')
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='strokes per second (0: as fast as possible)')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random variation of the interval between strokes (fraction)')
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='fraction of packets lost or corrupted')
+    parser.add_argument('--hold-off', type=float, default=0.5,
+                        help='Stentura: maximum delay before answering an empty read (seconds)')
+    parser.add_argument('-c', '--count', type=int, default=100,
+                        help='number of random strokes to use (if no strokes file is given)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed used for random strokes and jitter')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    serve_parser = subparsers.add_parser('serve', help='simulate a machine')
+    serve_parser.add_argument('machine', choices=sorted(ENCODERS))
+    serve_parser.add_argument('strokes', nargs='?', help='strokes file to replay')
+    serve_parser.set_defaults(func=serve)
+    bench_parser = subparsers.add_parser('bench', help='benchmark machine plugins')
+    bench_parser.add_argument('--strokes', help='strokes file to replay')
+    bench_parser.add_argument('machines', nargs='*', metavar='MACHINE',
+                              help='machines to benchmark (default: all): %s'
+                              % ', '.join(sorted(ENCODERS)))
+    bench_parser.set_defaults(func=bench)
+    args = parser.parse_args()
+    registry.update()
+    system.setup(args.system)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -99,3 +99,54 @@ def test_searchdict_values():
     assert d["tuple"][0][0] == "UNWRAP ME!"
     d["recurse me!"] = d
     assert d["recurse me!"]["recurse me!"]["recurse me!"] is d
+
+
+def test_searchdict_prefix_items():
+    d = SimilarSearchDict(str.lower, {w: None for w in ("Chair", "chair", "chairs", "char", "air", "")})
+    assert [k for (sk, k) in d.prefix_items("cha")] == ["Chair", "chair", "chairs", "char"]
+    assert [k for (sk, k) in d.prefix_items("cha", reverse=True)] == ["char", "chairs", "chair", "Chair"]
+    # Resuming after a key, in either order (even if the key is not in the dictionary).
+    assert [k for (sk, k) in d.prefix_items("cha", after="chair")] == ["chairs", "char"]
+    assert [k for (sk, k) in d.prefix_items("cha", after="chair", reverse=True)] == ["Chair"]
+    assert [k for (sk, k) in d.prefix_items("cha", after="chairz", reverse=True)] == ["chairs", "chair", "Chair"]
+    assert [k for (sk, k) in d.prefix_items("", after="chairs")] == ["char"]
+    assert [k for (sk, k) in d.prefix_items("", after="air", reverse=True)] == [""]
+    assert d.prefix_items("cha", after="char") == []
+    assert d.prefix_items("x", reverse=True) == []
+
+
+def test_searchdict_fuzzy():
+    # Keys within the edit distance under the similarity function (here: case-insensitive), closest first.
+    words = ["chair", "Chair", "chairs", "char", "chain", "cheap", "hair", "stair", "chairman", "air", ""]
+    d = SimilarSearchDict(str.lower, {w: None for w in words})
+    assert d.fuzzy_search("chiar", 0) == []
+    assert d.fuzzy_search("CHAIR", 0) == [(0, "Chair"), (0, "chair")]
+    assert d.fuzzy_search("chair", 1) == [(0, "Chair"), (0, "chair"), (1, "chain"), (1, "chairs"),
+                                          (1, "char"), (1, "hair")]
+    # Transposed characters count as one edit.
+    assert d.fuzzy_search("chiar", 1) == [(1, "Chair"), (1, "chair"), (1, "char")]
+    assert d.fuzzy_search("chiar", 2) == [(1, "Chair"), (1, "chair"), (1, "char"), (2, "chain"), (2, "chairs"),
+                                          (2, "cheap"), (2, "hair")]
+    assert d.fuzzy_search("ai", 1) == [(1, "air")]
+    assert d.fuzzy_search("", 1) == [(0, "")]
+    # Results are the same as computing the distance to each key.
+    def distance(a, b):
+        rows = [list(range(len(b) + 1))]
+        for i, ca in enumerate(a, 1):
+            row = [i]
+            for j, cb in enumerate(b, 1):
+                row.append(min(rows[-1][j] + 1, row[j - 1] + 1, rows[-1][j - 1] + (ca != cb)))
+                if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                    row[j] = min(row[j], rows[-2][j - 2] + 1)
+            rows.append(row)
+        return rows[-1][-1]
+    for query in ("chair", "hairs", "stairman", "x", "chiar", "hcair", "cahirs"):
+        for max_distance in range(4):
+            expected = sorted(((distance(query, w.lower()), w) for w in words
+                               if distance(query, w.lower()) <= max_distance),
+                              key=lambda t: (t[0], t[1].lower(), t[1]))
+            assert d.fuzzy_search(query, max_distance) == expected
+    # The search follows changes to the dictionary.
+    del d["char"]
+    d["chairs!"] = None
+    assert d.fuzzy_search("chairs", 1) == [(0, "chairs"), (1, "Chair"), (1, "chair"), (1, "chairs!")]
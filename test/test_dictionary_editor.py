@@ -0,0 +1,213 @@
+"""Unit tests for the dictionary editor model."""
+
+import pytest
+
+dictionary_editor = pytest.importorskip('plover.gui_qt.dictionary_editor')
+
+from PyQt5.QtCore import QModelIndex, Qt
+
+from plover.steno_dictionary import StenoDictionary
+
+
+_COL_STENO = dictionary_editor._COL_STENO
+_COL_TRANS = dictionary_editor._COL_TRANS
+_COL_DICT = dictionary_editor._COL_DICT
+
+
+def make_dictionary(path, entries):
+    d = StenoDictionary()
+    d.update(entries)
+    d.path = path
+    return d
+
+
+@pytest.fixture
+def dictionaries():
+    d1 = make_dictionary('/dictionaries/d1.json', {
+        ('A',): 'a',
+        ('TEFT',): 'test',
+        ('TEFT', '-D'): 'tested',
+    })
+    d2 = make_dictionary('/dictionaries/d2.json', {
+        ('PWAEUZ',): 'bees',
+        ('T*EFT',): 'Test',
+    })
+    return [d1, d2]
+
+
+def rows(model, fetch=True):
+    """ Return the (strokes, translation, dictionary path) rows, after loading all of them if <fetch>. """
+    parent = QModelIndex()
+    while fetch and model.canFetchMore(parent):
+        model.fetchMore(parent)
+    return [
+        (model.data(model.index(row, _COL_STENO), Qt.DisplayRole),
+         model.data(model.index(row, _COL_TRANS), Qt.DisplayRole),
+         model._entries[row].dictionary_path)
+        for row in range(model.rowCount(parent))
+    ]
+
+
+D1, D2 = '/dictionaries/d1.json', '/dictionaries/d2.json'
+
+
+def test_sort(dictionaries, monkeypatch):
+    # Small chunks: the sorted orders are walked in several steps.
+    monkeypatch.setattr(dictionary_editor, '_FETCH_SIZE', 2)
+    model = dictionary_editor.DictionaryItemModel(dictionaries, _COL_STENO, Qt.AscendingOrder)
+    assert rows(model) == [
+        ('A', 'a', D1),
+        ('PWAEUZ', 'bees', D2),
+        ('T*EFT', 'Test', D2),
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+    ]
+    model.sort(_COL_STENO, Qt.DescendingOrder)
+    assert rows(model) == [
+        ('TEFT/-D', 'tested', D1),
+        ('TEFT', 'test', D1),
+        ('T*EFT', 'Test', D2),
+        ('PWAEUZ', 'bees', D2),
+        ('A', 'a', D1),
+    ]
+    # Translations are sorted case-insensitively.
+    model.sort(_COL_TRANS, Qt.AscendingOrder)
+    assert rows(model) == [
+        ('A', 'a', D1),
+        ('PWAEUZ', 'bees', D2),
+        ('T*EFT', 'Test', D2),
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+    ]
+    model.sort(_COL_TRANS, Qt.DescendingOrder)
+    assert rows(model) == [
+        ('TEFT/-D', 'tested', D1),
+        ('TEFT', 'test', D1),
+        ('T*EFT', 'Test', D2),
+        ('PWAEUZ', 'bees', D2),
+        ('A', 'a', D1),
+    ]
+    # Dictionaries are sorted by path, and their entries by strokes.
+    model.sort(_COL_DICT, Qt.AscendingOrder)
+    assert rows(model) == [
+        ('A', 'a', D1),
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+        ('PWAEUZ', 'bees', D2),
+        ('T*EFT', 'Test', D2),
+    ]
+    model.sort(_COL_DICT, Qt.DescendingOrder)
+    assert rows(model) == [
+        ('PWAEUZ', 'bees', D2),
+        ('T*EFT', 'Test', D2),
+        ('A', 'a', D1),
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+    ]
+
+
+def test_filter(dictionaries):
+    model = dictionary_editor.DictionaryItemModel(dictionaries, _COL_STENO, Qt.AscendingOrder)
+    model.filter(strokes_filter='TEFT')
+    assert rows(model) == [
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+    ]
+    # The translation filter is case-sensitive.
+    model.filter(translation_filter='T')
+    assert rows(model) == [
+        ('T*EFT', 'Test', D2),
+    ]
+    model.filter(strokes_filter='T', translation_filter='test')
+    assert rows(model) == [
+        ('TEFT', 'test', D1),
+        ('TEFT/-D', 'tested', D1),
+    ]
+    # Same filters, when sorting on translations.
+    model.sort(_COL_TRANS, Qt.DescendingOrder)
+    assert rows(model) == [
+        ('TEFT/-D', 'tested', D1),
+        ('TEFT', 'test', D1),
+    ]
+    model.filter(translation_filter='b')
+    assert rows(model) == [
+        ('PWAEUZ', 'bees', D2),
+    ]
+    model.filter()
+    assert len(rows(model)) == 5
+
+
+def test_edit_undo(dictionaries):
+    d1, d2 = dictionaries
+    model = dictionary_editor.DictionaryItemModel(dictionaries, _COL_STENO, Qt.AscendingOrder)
+    assert not model.has_undo
+    # Change strokes.
+    assert model.setData(model.index(0, _COL_STENO), 'AEU')
+    assert rows(model)[0] == ('AEU', 'a', D1)
+    assert ('A',) not in d1
+    assert d1[('AEU',)] == 'a'
+    # Change translation.
+    assert model.setData(model.index(1, _COL_TRANS), 'bee')
+    assert rows(model)[1] == ('PWAEUZ', 'bee', D2)
+    assert d2[('PWAEUZ',)] == 'bee'
+    # Unchanged.
+    assert not model.setData(model.index(1, _COL_TRANS), 'bee')
+    # Delete.
+    model.remove_rows([2, 3])
+    assert rows(model) == [
+        ('AEU', 'a', D1),
+        ('PWAEUZ', 'bee', D2),
+        ('TEFT/-D', 'tested', D1),
+    ]
+    assert ('T*EFT',) not in d2
+    assert ('TEFT',) not in d1
+    assert model.modified == [d1, d2]
+    # Undo, in reverse order.
+    model.undo()
+    assert d2[('T*EFT',)] == 'Test'
+    assert d1[('TEFT',)] == 'test'
+    assert len(rows(model)) == 5
+    model.undo()
+    assert d2[('PWAEUZ',)] == 'bees'
+    model.undo()
+    assert ('AEU',) not in d1
+    assert d1[('A',)] == 'a'
+    assert ('A', 'a', D1) in rows(model)
+    assert not model.has_undo
+    # Undoing a change to a filtered-out row shows it again.
+    model.filter(strokes_filter='A')
+    assert model.setData(model.index(0, _COL_TRANS), 'an')
+    model.filter(strokes_filter='T')
+    model.undo()
+    assert d1[('A',)] == 'a'
+    assert rows(model)[0] == ('A', 'a', D1)
+
+
+def test_fetch_more(dictionaries, monkeypatch):
+    monkeypatch.setattr(dictionary_editor, '_FETCH_SIZE', 2)
+    d1, d2 = dictionaries
+    model = dictionary_editor.DictionaryItemModel(dictionaries, _COL_STENO, Qt.AscendingOrder)
+    # Rows are loaded on demand.
+    assert rows(model, fetch=False) == [
+        ('A', 'a', D1),
+        ('PWAEUZ', 'bees', D2),
+    ]
+    assert model.canFetchMore(QModelIndex())
+    # Edit a loaded row into an entry not loaded yet, and add a new row
+    # for another one: they are not loaded again with the next rows.
+    model.setData(model.index(0, _COL_STENO), 'TEFT/-D')
+    assert d1[('TEFT', '-D')] == 'a'
+    model.new_row(1)
+    model.setData(model.index(1, _COL_STENO), 'T*EFT')
+    model.setData(model.index(1, _COL_TRANS), 'TEST')
+    assert d2[('T*EFT',)] == 'TEST'
+    # Entries added since are loaded if they come after the loaded rows.
+    d1[('TEFT', '-G')] = 'testing'
+    assert rows(model) == [
+        ('TEFT/-D', 'a', D1),
+        ('T*EFT', 'TEST', D2),
+        ('PWAEUZ', 'bees', D2),
+        ('TEFT', 'test', D1),
+        ('TEFT/-G', 'testing', D1),
+    ]
+    assert not model.canFetchMore(QModelIndex())
@@ -1,16 +1,23 @@
 from functools import partial
+import json
 import os
 import tempfile
+import threading
 
 import pytest
 
-from plover import system
+from plover import system, trace
 from plover.config import Config, DictionaryConfig
-from plover.engine import ErroredDictionary, StenoEngine
+from plover.engine import (
+    ErroredDictionary,
+    HOOK_DISPATCH_COALESCE,
+    HOOK_DISPATCH_DROP,
+    StenoEngine,
+)
 from plover.machine.base import StenotypeBase
 from plover.machine.keymap import Keymap
 from plover.registry import Registry
-from plover.steno_dictionary import StenoDictionaryCollection
+from plover.steno_dictionary import StenoDictionary, StenoDictionaryCollection
 
 from .utils import make_dict
 
@@ -229,3 +236,208 @@ def test_loading_dictionaries(engine):
             (valid_dict_1, False, False),
             (invalid_dict_2, True, True),
         ]])
+
+def test_strokes_batch(engine):
+    engine.start()
+    engine.output = True
+    d = StenoDictionary()
+    d[('S',)] = 'is'
+    d[('S', 'T')] = 'this is'
+    d[('-T',)] = 'the'
+    engine.dictionaries.set_dicts([d])
+    engine.events.clear()
+    # Strokes notified one at a time.
+    FakeMachine.instance._notify(['S-'])
+    FakeMachine.instance._notify(['T-'])
+    assert [e for e in engine.events if e[0].startswith('send_')] == [
+        ('send_string', (' is',), {}),
+        ('send_backspaces', (2,), {}),
+        ('send_string', ('this is',), {}),
+    ]
+    engine.events.clear()
+    # The same strokes, as a batch: no intermediate correction.
+    FakeMachine.instance._notify_strokes([['S-'], ['T-'], ['-T']])
+    assert [e[0] for e in engine.events] == [
+        'translated', 'send_string', 'stroked', 'stroked', 'stroked',
+    ]
+    assert engine.events[1] == ('send_string', (' this is the',), {})
+
+def test_strokes_batch_engine_command(engine):
+    engine.start()
+    engine.output = True
+    d = StenoDictionary()
+    d[('S',)] = 'is'
+    d[('S', 'T')] = 'this is'
+    d[('-T',)] = 'the'
+    d[('PW',)] = '{PLOVER:SUSPEND}'
+    d[('R',)] = '{PLOVER:RESUME}'
+    engine.dictionaries.set_dicts([d])
+    engine.events.clear()
+    # The batch is split after the command: the next strokes are not output...
+    FakeMachine.instance._notify_strokes([['P-', 'W-'], ['S-']])
+    assert not engine.output
+    assert [e for e in engine.events if e[0].startswith('send_')] == []
+    assert [e for e in engine.events if e[0] == 'output_changed'] == [('output_changed', (False,), {})]
+    engine.events.clear()
+    # ...and not corrected after resuming.
+    FakeMachine.instance._notify_strokes([['R-'], ['T-'], ['-T']])
+    assert engine.output
+    assert [e for e in engine.events if e[0].startswith('send_')] == [
+        ('send_string', (' T the',), {}),
+    ]
+
+@pytest.mark.parametrize('dispatch, expected', (
+    (HOOK_DISPATCH_DROP, [(1,), (2,)]),
+    (HOOK_DISPATCH_COALESCE, [(1,), (4,)]),
+))
+def test_async_hooks(engine, dispatch, expected):
+    with pytest.raises(ValueError):
+        engine.hook_connect('send_string', print, dispatch=dispatch)
+    blocked = threading.Event()
+    release = threading.Event()
+    events = []
+    def slow_callback(*args):
+        blocked.set()
+        release.wait()
+        events.append(args)
+    engine.hook_connect('stroked', slow_callback, dispatch=dispatch, queue_size=1)
+    # The callback blocks on the first event, the next ones overflow the queue.
+    engine._trigger_hook('stroked', 1)
+    assert blocked.wait(2)
+    for n in (2, 3, 4):
+        engine._trigger_hook('stroked', n)
+    assert engine.hook_overflows() == {('stroked', slow_callback): 2}
+    # Stopping the worker delivers pending events.
+    worker = engine._hook_workers[('stroked', slow_callback)]
+    engine.hook_disconnect('stroked', slow_callback)
+    release.set()
+    worker.join(2)
+    assert not worker.is_alive()
+    assert events == expected
+    assert engine.hook_overflows() == {}
+
+def test_latency_metrics(engine, monkeypatch):
+    monkeypatch.setattr(engine, 'LATENCY_UPDATE_INTERVAL', 2)
+    engine.start()
+    engine.output = True
+    engine.events.clear()
+    FakeMachine.instance._notify(['S-'])
+    assert 'latency_updated' not in [e[0] for e in engine.events]
+    FakeMachine.instance._notify(['T-'])
+    assert engine.events[-1][0] == 'latency_updated'
+    summary = engine.events[-1][1][0]
+    assert summary == engine.latency_summary()
+    assert summary['queue'].count == 2
+    assert summary['translate'].count == 2
+    assert summary['format'].count == 2
+    assert summary['output'].count == 2
+    assert summary['total'].count == 2
+    assert summary['total'].p99 >= summary['output'].p99
+    # Reading the metrics does not wait for the engine lock.
+    locked = threading.Event()
+    unlock = threading.Event()
+    def lock_engine():
+        with engine:
+            locked.set()
+            unlock.wait()
+    thread = threading.Thread(target=lock_engine)
+    thread.start()
+    try:
+        locked.wait()
+        assert engine.latency_summary() == summary
+    finally:
+        unlock.set()
+        thread.join()
+
+def test_trace_command(engine, monkeypatch, tmpdir):
+    filename = str(tmpdir.join('trace.json'))
+    monkeypatch.setattr(trace, 'filename', filename)
+    engine.start()
+    engine.output = True
+    d = StenoDictionary()
+    d[('S',)] = 'is'
+    d[('T',)] = '{PLOVER:TRACE}'
+    engine.dictionaries.set_dicts([d])
+    try:
+        FakeMachine.instance._notify(['T-'])
+        assert trace.is_enabled()
+        FakeMachine.instance._notify(['S-'])
+        FakeMachine.instance._notify(['T-'])
+        assert not trace.is_enabled()
+    finally:
+        trace.disable()
+    with open(filename, encoding='utf-8') as fp:
+        names = {e['name'] for e in json.load(fp)['traceEvents']}
+    assert {
+        'Translator.translate_stroke',
+        'Translator._find_translation',
+        'Formatter.format',
+        'OutputHelper.flush',
+        'send_string',
+    } <= names
+
+
+def test_trace_command_error(engine, monkeypatch, tmpdir):
+    # Failing to write the trace is logged, and does not stop the engine.
+    monkeypatch.setattr(trace, 'filename', str(tmpdir.join('missing', 'trace.json')))
+    engine.start()
+    engine.output = True
+    d = StenoDictionary()
+    d[('S',)] = 'is'
+    d[('T',)] = '{PLOVER:TRACE}'
+    engine.dictionaries.set_dicts([d])
+    try:
+        FakeMachine.instance._notify(['T-'])
+        assert trace.is_enabled()
+        FakeMachine.instance._notify(['T-'])
+        assert not trace.is_enabled()
+    finally:
+        trace.disable()
+    engine.events.clear()
+    FakeMachine.instance._notify(['S-'])
+    assert ('send_string', (' is',), {}) in engine.events
+
+def test_lookup_snapshot(engine):
+    d1 = StenoDictionary()
+    d1[('TEFT',)] = 'test'
+    d2 = StenoDictionary()
+    d2[('TEFT',)] = 'overridden'
+    d2[('-G',)] = '{^ing}'
+    engine.dictionaries.set_dicts([d1, d2])
+    assert engine.lookup(('TEFT',)) == 'test'
+    # Lookups and searches don't need the engine lock...
+    locked = threading.Event()
+    unlock = threading.Event()
+    def lock_engine():
+        with engine:
+            locked.set()
+            unlock.wait()
+    thread = threading.Thread(target=lock_engine)
+    thread.start()
+    try:
+        locked.wait()
+        assert engine.lookup(('TEFT',)) == 'test'
+        assert engine.raw_lookup(('-G',)) == '{^ing}'
+        assert engine.reverse_lookup('test') == {('TEFT',)}
+        assert engine.casereverse_lookup('TEST') == ['test']
+        assert [s.text for s in engine.get_suggestions('ing')] == ['{^ing}']
+        assert engine.get_suggestions_page('test', partial=True)[0] == engine.get_suggestions('test', partial=True)
+        assert [s.text for s in engine.get_phrase_suggestions(['test'])] == ['test']
+    finally:
+        unlock.set()
+        thread.join()
+    # ...but changes are still taken into account.
+    snapshot = engine._get_snapshot()
+    suggestions = engine.get_suggestions_snapshot()
+    d1[('TEFT', '-G')] = 'testing'
+    assert engine.lookup(('TEFT', '-G')) == 'testing'
+    # A suggestions snapshot is not affected by changes.
+    assert [s.text for s in suggestions.find('test', partial=True)] == ['test']
+    assert [s.text for s in engine.get_suggestions_snapshot().find('test', partial=True)] == ['test', 'testing']
+    assert engine._get_snapshot() is not snapshot
+    # Only the modified dictionary was copied.
+    assert engine._get_snapshot().dictionaries.dicts[1] is snapshot.dictionaries.dicts[1]
+    d1.enabled = False
+    assert engine.lookup(('TEFT',)) == 'overridden'
+    engine.add_dictionary_filter(lambda key, value: value == 'overridden')
+    assert engine.lookup(('TEFT',)) is None
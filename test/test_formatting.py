@@ -501,6 +501,21 @@ def test_translation_to_actions(translation, last_action, expected):
     assert formatting._translation_to_actions(translation, ctx) == expected
 
 
+def test_parsed_translations_cache():
+    formatting._parse_translation.cache_clear()
+    for n in range(3):
+        ctx = formatting._Context([], action())
+        assert formatting._translation_to_actions('{^}{-|}foo{^ing}', ctx) == [
+            action(prev_attach=True, next_attach=True, orthography=False, text='', word=''),
+            action(prev_attach=True, next_attach=True, orthography=False, word='',
+                   next_case=formatting.CASE_CAP_FIRST_WORD),
+            action(prev_attach=True, text='Foo', trailing_space=' ', word='foo'),
+            action(prev_attach=True, text='ing', trailing_space=' ', word='fooing'),
+        ]
+    cache_info = formatting._parse_translation.cache_info()
+    assert (cache_info.hits, cache_info.misses) == (2, 1)
+
+
 RAW_TO_ACTIONS_TESTS = (
 
     lambda:
@@ -1201,3 +1216,23 @@ class TestRetroFormatter:
         for t in translation_list:
             self.format(t)
         assert self.retro_formatter.last_text(count) == text
+
+    def test_text_tail(self):
+        for t in ('Luca', '{-|}', 'mela'):
+            self.format(t)
+        text_tail = self.translations[-1].text_tail
+        assert (text_tail.text, text_tail.truncated) == ('Luca Mela', False)
+        # The mirror covers output from translations no longer in the history.
+        retro_formatter = formatting.RetroFormatter(self.translations[-1:])
+        assert retro_formatter.last_words(2) == ['Luca ', 'Mela']
+
+    def test_text_tail_truncation(self):
+        words = ['word%u' % n for n in range(500)]
+        for w in words:
+            self.format(w)
+        text_tail = self.translations[-1].text_tail
+        assert text_tail.truncated
+        assert len(text_tail.text) <= text_tail.MAX_SIZE
+        assert text_tail.text.startswith('word')
+        assert self.retro_formatter.last_words(3, strip=True) == words[-3:]
+        assert self.retro_formatter.last_text(9) == 'd498 word499'[-9:]
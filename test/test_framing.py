@@ -0,0 +1,84 @@
+"""Unit tests for framing.py."""
+
+import pytest
+
+from plover.machine.framing import (
+    FixedSize,
+    FrameReader,
+    IncreasingRank,
+    SyncBit,
+    Terminator,
+)
+
+from . import parametrize
+
+
+class MockPort:
+
+    def __init__(self, reads):
+        # Data returned by each read (an empty
+        # bytes object is used for a timeout).
+        self.reads = list(reads)
+
+    def inWaiting(self):
+        return len(self.reads[0]) if self.reads else 0
+
+    def readinto(self, buffer):
+        data = self.reads.pop(0)
+        size = min(len(buffer), len(data))
+        buffer[:size] = data[:size]
+        if size < len(data):
+            self.reads.insert(0, data[size:])
+        return size
+
+
+FRAMING_TESTS = (
+    # Fixed size frames.
+    lambda: (FixedSize(2),
+             (b'abc', b'd', b'ef', b'g', b''),
+             [[b'ab'], [b'cd'], [b'ef'], [], []]),
+    # Sync bit: resynchronize on the next sync bit.
+    lambda: (SyncBit(3),
+             (b'\x01\x81\x02\x03\x82\x04', b'\x83\x05\x06\x84\x07', b'', b'\x85\x08\x09'),
+             [[b'\x81\x02\x03'], [b'\x83\x05\x06'], [], [b'\x85\x08\x09']]),
+    # Terminator: incomplete frames are kept on timeout.
+    lambda: (Terminator(b'>'),
+             (b'<a>', b'<b', b'', b'c><d><', b'e>'),
+             [[b'<a>'], [], [], [b'<bc>', b'<d>'], [b'<e>']]),
+    # Increasing rank: incomplete frames are flushed on timeout.
+    lambda: (IncreasingRank(lambda b: b >> 6, 3),
+             (b'\x01\x41\x81\xc1\x02\x42', b'\x03', b'\x43', b''),
+             [[b'\x01\x41\x81\xc1'], [b'\x02\x42'], [], [b'\x03\x43']]),
+)
+
+@parametrize(FRAMING_TESTS)
+def test_framing(framing, reads, expected):
+    reader = FrameReader(MockPort(reads), framing)
+    for frames in expected:
+        assert [bytes(f) for f in reader.read_frames()] == frames
+
+
+def test_frames_are_views():
+    reader = FrameReader(MockPort([b'abcd']), FixedSize(2))
+    frames = reader.read_frames()
+    assert all(isinstance(f, memoryview) for f in frames)
+    assert frames[0].obj is frames[1].obj
+
+
+@pytest.mark.parametrize('buffer_size', (8, 9, 16))
+def test_buffer_reuse(buffer_size):
+    data = bytes(range(0x80, 0x80 + 60))
+    reads = [data[n:n + 5] for n in range(0, len(data), 5)]
+    port = MockPort(reads)
+    reader = FrameReader(port, FixedSize(3), buffer_size=buffer_size)
+    frames = []
+    while port.reads:
+        frames.extend(bytes(f) for f in reader.read_frames())
+    assert b''.join(frames) == data
+
+
+def test_discard_incomplete_frame():
+    reader = FrameReader(MockPort([b'abc', b'', b'def']), FixedSize(2))
+    assert [bytes(f) for f in reader.read_frames()] == [b'ab']
+    assert reader.read_frames() == []
+    assert [bytes(f) for f in reader.read_frames()] == [b'de']
@@ -86,3 +86,40 @@ def test_keymap_setitem():
     # Assert on invalid action.
     with pytest.raises(AssertionError):
         k['a9'] = 'k0'
+
+def test_keymap_build_lookup_table():
+    k = new_keymap()
+    k.set_bindings(BINDINGS_DICT)
+    def value_to_keys(value):
+        return ['k%u' % n for n in range(8) if value & (1 << n)]
+    table = k.build_lookup_table(value_to_keys)
+    assert len(table) == 256
+    for value, actions in enumerate(table):
+        keys = [key for key in value_to_keys(value) if key in BINDINGS_DICT]
+        assert list(actions) == k.keys_to_actions(keys)
+
+def test_keymap_keys_to_actions():
+    k = Keymap(('k%u' % n for n in range(20)),
+               ('a%u' % n for n in range(4)))
+    k.set_mappings({
+        'a0': ('k0', 'k9'),
+        'a1': 'k1',
+        'a2': 'k17',
+        'no-op': ('k2', 'k18'),
+    })
+    assert k.keys_to_actions([]) == []
+    # Actions are in keys order, keys bound to no-op (or not bound) are dropped.
+    assert k.keys_to_actions(['k17', 'k2', 'k1', 'k5']) == ['a1', 'a2']
+    assert k.keys_to_actions(['k9', 'k0']) == ['a0', 'a0']
+    mask = k.keys_to_mask(['k1', 'k17', 'k18'])
+    assert mask == (1 << 1) | (1 << 17) | (1 << 18)
+    assert k.mask_to_actions(mask) == ['a1', 'a2']
+    assert k.get_mask('a0') == (1 << 0) | (1 << 9)
+    assert k.get_mask('a3') == 0
+    # Updating a mapping updates the compiled keymap.
+    k['a3'] = 'k5'
+    assert k.keys_to_actions(['k17', 'k2', 'k1', 'k5']) == ['a1', 'a3', 'a2']
+    k['a2'] = ()
+    assert k.keys_to_actions(['k17', 'k2', 'k1', 'k5']) == ['a1', 'a3']
+    with pytest.raises(AssertionError):
+        k.keys_to_actions(['k20'])
@@ -0,0 +1,42 @@
+"""Unit tests for machine_simulator.py."""
+
+import os
+
+import pytest
+
+from plover_build_utils import machine_simulator
+
+
+STROKES = ('KAT', 'TPH-FPL', '-T', '#', '1-9', 'STKPWHRAO*EUFRPBLGTSDZ', 'A')
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='no pty support')
+@pytest.mark.parametrize('machine', sorted(machine_simulator.ENCODERS))
+def test_replay(machine):
+    duration, received, latencies = machine_simulator.replay(
+        machine, STROKES, rate=0, hold_off=0.05, serial_timeout=0.1)
+    assert received == len(STROKES)
+    assert len(latencies) == len(STROKES)
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='no pty support')
+@pytest.mark.parametrize('machine', ('Gemini PR', 'Passport', 'TX Bolt'))
+def test_replay_loss(machine):
+    # Corrupted packets are discarded, without stopping the machine.
+    strokes = STROKES * 3
+    duration, received, latencies = machine_simulator.replay(
+        machine, strokes, rate=100, loss=0.3, seed=42, timeout=0.3, serial_timeout=0.1)
+    assert len(strokes) // 2 <= received < len(strokes)
+
+
+def test_match_strokes():
+    sent = [['S-'], ['T-'], ['K-'], ['P-'], ['W-']]
+    # Lost and corrupted strokes.
+    received = [['S-'], ['K-'], ['H-'], ['W-']]
+    assert machine_simulator._match_strokes(sent, received) == [(0, 0), (2, 1), (4, 3)]
+    # Only matched in a window of the next sent strokes.
+    assert machine_simulator._match_strokes(sent, [['W-'], ['T-']], window=2) == [(1, 1)]
+    # Linear: a long replay is fast to match.
+    sent = [['S-'], ['T-']] * 50000
+    received = sent[::3]
+    assert len(machine_simulator._match_strokes(sent, received)) == len(received)
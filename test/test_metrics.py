@@ -0,0 +1,18 @@
+"""Unit tests for metrics.py."""
+
+from plover.metrics import STAGES, LatencyMetrics, LatencySummary
+
+
+def test_latency_metrics():
+    metrics = LatencyMetrics(window_size=100)
+    assert metrics.summary() == {stage: None for stage in STAGES}
+    # Only the last 100 samples are kept.
+    for n in range(200, 0, -1):
+        metrics.record('translate', n)
+    metrics.record('queue', 3)
+    summary = metrics.summary()
+    assert summary['translate'] == LatencySummary(100, 50, 95, 99)
+    assert summary['queue'] == LatencySummary(1, 3, 3, 3)
+    assert summary['total'] is None
+    metrics.clear()
+    assert metrics.summary() == {stage: None for stage in STAGES}
@@ -1,6 +1,7 @@
 # Copyright (c) 2013 Hesky Fisher
 # See LICENSE.txt for details.
 
+from plover import orthography, system
 from plover.orthography import add_suffix
 
 from . import parametrize
@@ -109,3 +110,15 @@ ADD_SUFFIX_TESTS = (
 @parametrize(ADD_SUFFIX_TESTS)
 def test_add_suffix(word, suffix, expected):
     assert add_suffix(word, suffix) == expected
+
+
+def test_add_suffix_cache():
+    orthography.clear_cache()
+    for n in range(3):
+        assert add_suffix('artistic', 'ly') == 'artistically'
+    cache_info = orthography._add_suffix.cache_info()
+    assert (cache_info.hits, cache_info.misses) == (2, 1)
+    # The cache is reset when the system changes.
+    system.setup(system.NAME)
+    assert orthography._add_suffix.cache_info().currsize == 0
+
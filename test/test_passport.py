@@ -30,6 +30,18 @@ class MockSerial:
             self.event.set()
         return data
 
+    def readinto(self, buffer):
+        if not self.data:
+            return 0
+        data = self.data.pop(0)
+        size = min(len(buffer), len(data))
+        buffer[:size] = data[:size]
+        if size < len(data):
+            self.data.insert(0, data[size:])
+        elif not self.data:
+            self.event.set()
+        return size
+
     def close(self):
         pass
 
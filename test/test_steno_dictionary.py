@@ -185,6 +185,50 @@ def test_dictionary_collection_longest_key():
     assert dc.longest_key == 0
 
 
+def test_dictionary_enabled_before_init():
+    class Dictionary(StenoDictionary):
+        def __init__(self):
+            self.enabled = False
+            super().__init__()
+    d = Dictionary()
+    assert d.enabled
+    d.enabled = False
+    assert not d.enabled
+
+
+def test_dictionary_collection_generation():
+    d1 = StenoDictionary()
+    d2 = StenoDictionary()
+    dc = StenoDictionaryCollection([d1])
+    generations = [dc.generation]
+    def check_changed():
+        generation = dc.generation
+        assert generation not in generations
+        generations.append(generation)
+        # Stable until the next change, and
+        # reading it does not modify the collection.
+        state = dict(vars(dc))
+        assert dc.generation == generation
+        assert vars(dc) == state
+    check_changed_steps = (
+        lambda: d1.__setitem__(('S',), 'a'),
+        lambda: d1.update({('T',): 'b'}),
+        lambda: d1.__delitem__(('S',)),
+        lambda: setattr(d1, 'enabled', False),
+        lambda: dc.set_dicts([d2, d1]),
+        lambda: d2.update({('S',): 'a'}),
+        lambda: dc.add_filter(lambda key, value: False),
+        lambda: d1.clear(),
+    )
+    for step in check_changed_steps:
+        step()
+        check_changed()
+    # Unrelated dictionaries don't matter.
+    d3 = StenoDictionary()
+    d3[('S',)] = 'a'
+    assert dc.generation == generations[-1]
+
+
 def test_casereverse_del():
     d = StenoDictionary()
     d[('S-G',)] = 'something'
@@ -297,6 +341,240 @@ def test_search():
     with pytest.raises(re.error):
         print(dc.find_regex('beautiful...an open group(', count=1))
 
+    # Without a literal prefix, the literal parts of the pattern are used to narrow the search (trigram index),
+    # but the results are the same.
+    assert dc.find_regex('.*ful', count=5) == [('Beautiful',   {('PWAOUFL',)}),
+                                               ('beautiful',   {('WAOUFL',)}),
+                                               ('beautifully', {('PWAOUFL', 'HREU')})]
+    assert dc.find_regex('.(eau)+TI', count=5) == []
+    assert dc.find_regex('.(eau)+ti(?:ful)?ly', count=5) == [('beautifully', {('PWAOUFL', 'HREU')})]
+    assert dc.find_regex('.*(ful|ness)$', count=5) == [('Beautiful',   {('PWAOUFL',)}),
+                                                       ('beautiful',   {('WAOUFL',)}),
+                                                       ('ugliness',    {('UG', 'HREU', '-PBS')})]
+    assert dc.find_regex('.*ful(ly)?$', count=1) == [('Beautiful',   {('PWAOUFL',)})]
+    assert dc.find_regex('.*xyz', count=5) == []
+    # The index is updated when the dictionary changes.
+    d1[('PWAOUFL', 'TPHES')] = 'beautifulness'
+    assert dc.find_regex('.*ness', count=5) == [('beautifulness', {('PWAOUFL', 'TPHES')}),
+                                                ('ugliness',      {('UG', 'HREU', '-PBS')})]
+    del d1[('UG', 'HREU', '-PBS')]
+    assert dc.find_regex('.*ness', count=5) == [('beautifulness', {('PWAOUFL', 'TPHES')})]
+
+    # Substring search is case-insensitive, and return up to count entries in order.
+    assert dc.find_substring('UTIF', count=3) == [('Beautiful',   {('PWAOUFL',)}),
+                                                  ('beautiful',   {('WAOUFL',)}),
+                                                  ('beautifully', {('PWAOUFL', 'HREU')})]
+    assert dc.find_substring('fulne') == [('beautifulness', {('PWAOUFL', 'TPHES')})]
+    # Short substrings don't use the index.
+    assert dc.find_substring('ly') == [('beautifully', {('PWAOUFL', 'HREU')}),
+                                       ('ugly', {('ULG',)})]
+    assert dc.find_substring('ugliness') == []
+
+    # Fuzzy search tolerates a few typos (by default, one for each 3 characters, up to 2), closest matches first.
+    assert dc.find_fuzzy('beatiful') == [('Beautiful', {('PWAOUFL',)}),
+                                         ('beautiful', {('WAOUFL',)})]
+    assert dc.find_fuzzy('beautifuly') == [('Beautiful',   {('PWAOUFL',)}),
+                                           ('beautiful',   {('WAOUFL',)}),
+                                           ('beautifully', {('PWAOUFL', 'HREU')})]
+    assert dc.find_fuzzy('beautifullt', count=2) == [('beautifully', {('PWAOUFL', 'HREU')}),
+                                                     ('Beautiful',   {('PWAOUFL',)})]
+    # Transposed characters count as one edit.
+    assert dc.find_fuzzy('ulgy') == [('ugly', {('ULG',)})]
+    assert dc.find_fuzzy('ulgi') == []
+    assert dc.find_fuzzy('ulgi', max_distance=2) == [('ugly', {('ULG',)})]
+
+
+def test_search_merge():
+    # Results from several dictionaries are merged in sort order, skipping duplicates and overridden entries,
+    # and searching stops as soon as enough results have been found.
+    d1 = StenoDictionary()
+    d1.update({(s,): 'test%02u' % n for n, s in enumerate(('T-', 'T-T', 'T-S', 'T-Z', 'T-D'))})
+    d1[('TEFT',)] = 'test'
+    d2 = StenoDictionary()
+    d2.update({(s,): 'test%02u' % n for n, s in enumerate(('TEFT', 'TEFTS', 'TEFTD', 'TEFTZ'), 1)})
+    d2[('T*EFT',)] = '{^test}'
+    dc = StenoDictionaryCollection([d1, d2])
+    lookups = []
+    def reverse_lookup(value):
+        lookups.append(value)
+        return StenoDictionaryCollection.reverse_lookup(dc, value)
+    dc.reverse_lookup = reverse_lookup
+    assert dc.find_partial('test', count=4) == [('test',    {('TEFT',)}),
+                                                ('{^test}', {('T*EFT',)}),
+                                                ('test00',  {('T-',)}),
+                                                ('test01',  {('T-T',)})]
+    assert lookups == ['test', '{^test}', 'test00', 'test01']
+    lookups.clear()
+    # 'test01' from the second dictionary is overridden by the first dictionary.
+    assert dc.find_regex('test0[1-5]', count=4) == [('test01', {('T-T',)}),
+                                                    ('test02', {('T-S',), ('TEFTS',)}),
+                                                    ('test03', {('T-Z',), ('TEFTD',)}),
+                                                    ('test04', {('T-D',), ('TEFTZ',)})]
+    assert lookups == ['test01', 'test02', 'test03', 'test04']
+    assert dc.find_substring('ST0', count=2) == [('test00', {('T-',)}),
+                                                 ('test01', {('T-T',)})]
+    # Disabled dictionaries are ignored (and no longer override the others).
+    d1.enabled = False
+    assert dc.find_partial('test0') == [('test01', {('TEFT',)}),
+                                        ('test02', {('TEFTS',)}),
+                                        ('test03', {('TEFTD',)}),
+                                        ('test04', {('TEFTZ',)})]
+
+def test_dictionary_snapshot():
+    d1 = StenoDictionary()
+    d1[('TEFT',)] = 'test'
+    d1[('TEFT', '-G')] = 'testing'
+    d1.path = 'd1'
+    d2 = StenoDictionary()
+    d2[('T*EFT',)] = 'Test'
+    dc = StenoDictionaryCollection([d1, d2])
+    dc.add_filter(lambda key, value: value == 'testing')
+    s1 = dc.snapshot()
+    # The snapshot is a read-only copy...
+    assert [(d.path, d.readonly, dict(d)) for d in s1.dicts] == [
+        ('d1', True, {('TEFT',): 'test', ('TEFT', '-G'): 'testing'}),
+        (None, True, {('T*EFT',): 'Test'}),
+    ]
+    assert s1.longest_key == 2
+    assert s1.lookup(('TEFT', '-G')) is None
+    assert s1.find_partial('test') == [('Test', {('T*EFT',)}), ('test', {('TEFT',)}), ('testing', {('TEFT', '-G')})]
+    # ...unaffected by changes.
+    d1[('TEFTS',)] = 'test'
+    del d1[('TEFT', '-G')]
+    d1.enabled = False
+    assert s1.lookup(('TEFTS',)) is None
+    assert s1.raw_lookup(('TEFT', '-G')) == 'testing'
+    assert s1.dicts[0].reverse_lookup('test') == [('TEFT',)]
+    assert s1.find_partial('test') == [('Test', {('T*EFT',)}), ('test', {('TEFT',)}), ('testing', {('TEFT', '-G')})]
+    assert dc.find_partial('test') == [('Test', {('T*EFT',)})]
+    # Only the dictionaries changed since the last snapshot are copied.
+    s2 = dc.snapshot()
+    assert s2.dicts[0] is not s1.dicts[0]
+    assert s2.dicts[1] is s1.dicts[1]
+    assert s2.find_partial('test') == [('Test', {('T*EFT',)})]
+    d1.enabled = True
+    assert dc.snapshot().find_partial('test') == [('Test', {('T*EFT',)}), ('test', {('TEFT',), ('TEFTS',)})]
+    # Search indexes are shared with the copy.
+    d2[('TEFT', '-D')] = 'tested'
+    assert d2.substring_reverse_lookup('est') == ['Test', 'tested']
+    s3 = d2.snapshot()
+    assert s3.reverse._trigram_index is d2.reverse._trigram_index
+    d2[('TEFTS',)] = 'tests'
+    assert d2.substring_reverse_lookup('est') == ['Test', 'tested', 'tests']
+    assert s3.substring_reverse_lookup('est') == ['Test', 'tested']
+
+
+class ComputedDictionary(StenoDictionary):
+    """ Dictionary computing its entries (like Python dictionaries): translate numbers. """
+
+    readonly = True
+
+    def __contains__(self, key):
+        return len(key) == 1 and key[0].isdigit()
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return '{&%s}' % key[0]
+
+    def reverse_lookup(self, value):
+        if value.startswith('{&') and value[2:-1].isdigit():
+            return [(value[2:-1],)]
+        return []
+
+
+def test_dictionary_snapshot_unsupported():
+    class SnapshotDictionary(ComputedDictionary):
+        supports_snapshot = True
+    class FileDictionary(StenoDictionary):
+        def _load(self, filename):
+            pass
+    assert StenoDictionary.supports_snapshot
+    assert FileDictionary.supports_snapshot
+    assert not ComputedDictionary.supports_snapshot
+    assert SnapshotDictionary.supports_snapshot
+    d1 = StenoDictionary()
+    d1[('TEFT',)] = 'test'
+    d2 = ComputedDictionary()
+    dc = StenoDictionaryCollection([d1, d2])
+    s = dc.snapshot()
+    # Dictionaries not supporting snapshots are shared as is.
+    assert s.dicts[0] is not d1
+    assert s.dicts[1] is d2
+    for c in (dc, s):
+        assert c.lookup(('TEFT',)) == 'test'
+        assert c.lookup(('12',)) == '{&12}'
+        assert c.reverse_lookup('{&12}') == {('12',)}
+
+def test_outlines_search():
+    d1 = StenoDictionary()
+    d1.update({
+        ('KPA', 'TEFT'): 'Test',
+        ('KPA', 'TEFT', '-D'): 'Tested',
+        ('KPAEUR',): 'compare',
+        ('KAR', '-FRB'): 'carve',
+    })
+    d2 = StenoDictionary()
+    d2[('KPA', 'TEFT')] = 'TEST'
+    d2[('-FRB',)] = 'rv'
+    dc = StenoDictionaryCollection([d1, d2])
+    # Prefix of the outline, the first dictionary has precedence.
+    assert dc.find_outlines('KPA/') == [
+        (('KPA', 'TEFT'), 'Test'),
+        (('KPA', 'TEFT', '-D'), 'Tested'),
+    ]
+    assert dc.find_outlines('KPA') == [
+        (('KPA', 'TEFT'), 'Test'),
+        (('KPA', 'TEFT', '-D'), 'Tested'),
+        (('KPAEUR',), 'compare'),
+    ]
+    assert dc.find_outlines('KPA', count=1) == [(('KPA', 'TEFT'), 'Test')]
+    assert dc.find_outlines('KPA', after=('KPA', 'TEFT')) == [
+        (('KPA', 'TEFT', '-D'), 'Tested'),
+        (('KPAEUR',), 'compare'),
+    ]
+    assert dc.find_outlines('TEFT') == []
+    assert len(dc.find_outlines('')) == 5
+    # Strokes used.
+    assert dc.find_stroke_outlines(['-FRB']) == [(('-FRB',), 'rv'), (('KAR', '-FRB'), 'carve')]
+    assert dc.find_stroke_outlines(['TEFT', 'KPA']) == [
+        (('KPA', 'TEFT'), 'Test'),
+        (('KPA', 'TEFT', '-D'), 'Tested'),
+    ]
+    assert dc.find_stroke_outlines(['TEFT'], after=('KPA', 'TEFT')) == [(('KPA', 'TEFT', '-D'), 'Tested')]
+    assert dc.find_stroke_outlines(['TEFT', 'KAR']) == []
+    assert dc.find_stroke_outlines(['STPH']) == []
+    # Filters and disabled dictionaries.
+    d1.enabled = False
+    assert dc.find_outlines('KPA') == [(('KPA', 'TEFT'), 'TEST')]
+    d1.enabled = True
+    dc.add_filter(lambda key, value: value == 'carve')
+    assert dc.find_stroke_outlines(['-FRB']) == [(('-FRB',), 'rv')]
+    # The index is kept up to date.
+    d1[('KPA', 'TEFTS')] = 'Tests'
+    d1[('KPA', 'TEFT', '-D')] = 'TESTED'
+    del d1[('KPA', 'TEFT')]
+    assert dc.find_outlines('KPA/') == [
+        (('KPA', 'TEFT'), 'TEST'),
+        (('KPA', 'TEFT', '-D'), 'TESTED'),
+        (('KPA', 'TEFTS'), 'Tests'),
+    ]
+    assert d1.stroke_key_items(['TEFT']) == [('KPA/TEFT/-D', ('KPA', 'TEFT', '-D'))]
+    assert d1.stroke_key_items(['TEFTS']) == [('KPA/TEFTS', ('KPA', 'TEFTS'))]
+    del d1[('KAR', '-FRB')]
+    assert d1.stroke_key_items(['-FRB']) == []
+    d1.clear()
+    assert list(d1.prefix_key_items('')) == []
+    d1.update({('KPA',): 'compare'})
+    assert list(d1.prefix_key_items('KP')) == [('KPA', ('KPA',))]
+    # Resuming after a key, in either order.
+    d1.update({('KPA', 'TEFT'): 'Test', ('KPA', '-S'): 'Is', ('TEFT',): 'test'})
+    assert list(d1.prefix_key_items('KPA', reverse=True)) == [
+        ('KPA/TEFT', ('KPA', 'TEFT')), ('KPA/-S', ('KPA', '-S')), ('KPA', ('KPA',)),
+    ]
+    assert list(d1.prefix_key_items('KPA', after=('KPA', '-S'))) == [('KPA/TEFT', ('KPA', 'TEFT'))]
+    assert list(d1.prefix_key_items('', after=('KPA', '-S'), reverse=True)) == [('KPA', ('KPA',))]
+    assert list(d1.prefix_key_items('', after=('KPA', 'TEFT'))) == [('TEFT', ('TEFT',))]
 
 def test_dictionary_enabled():
     dc = StenoDictionaryCollection()
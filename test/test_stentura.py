@@ -8,7 +8,9 @@ import threading
 
 import pytest
 
+from plover import system
 from plover.machine import stentura
+from plover.machine.keymap import Keymap
 
 
 def make_response(seq, action, error=0, p1=0, p2=0, data=None, length=None):
@@ -524,8 +526,8 @@ def test_loop():
     for test in tests:
         read_data = []
 
-        def callback(data):
-            read_data.append(data)
+        def callback(strokes):
+            read_data.extend(strokes)
 
         port = test[0]
         expected = test[1]
@@ -543,3 +545,19 @@ def test_loop():
         assert ready_called[0]
 
 # TODO: add a test on the machine itself with mocks
+
+def test_set_keymap_while_running(monkeypatch):
+    machine = stentura.Stentura({})
+    tables = []
+    def _loop(port, stop, callback, ready_callback, timeout=1, get_tables=None):
+        tables.append(get_tables())
+        # Keymap update while the machine is running.
+        keymap = Keymap(stentura.Stentura.get_keys(), system.KEYS + stentura.Stentura.get_actions())
+        keymap.set_mappings({'S-': 'T-', 'T-': 'S-'})
+        machine.set_keymap(keymap)
+        tables.append(get_tables())
+    monkeypatch.setattr(stentura, '_loop', _loop)
+    machine.run()
+    assert len(tables) == 2
+    assert tables[0] != tables[1]
+    assert tables[1] is machine._actions_tables
@@ -0,0 +1,270 @@
+"""Unit tests for suggestions.py."""
+
+import queue
+import threading
+import time
+
+import pytest
+
+from plover import suggestions
+from plover.steno_dictionary import StenoDictionary, StenoDictionaryCollection
+from plover.suggestions import WORD_RX, SearchWorker, Suggestion, Suggestions
+
+
+def test_suggestions_cache(monkeypatch):
+    d = StenoDictionary()
+    d.update({
+        ('TEFT',): 'test',
+        ('TEFTD',): 'tested',
+        ('T*EFT',): 'Test',
+    })
+    dc = StenoDictionaryCollection([d])
+    s = Suggestions(dc)
+    searches = []
+    find = s._find
+    def counting_find(*args):
+        searches.append(args[0])
+        return find(*args)
+    monkeypatch.setattr(s, '_find', counting_find)
+    expected = [
+        Suggestion('test', [('TEFT',)]),
+        Suggestion('Test', [('T*EFT',)]),
+    ]
+    assert s.find('test') == expected
+    assert s.find('test') == expected
+    assert searches == ['test']
+    # Different search modes are cached separately.
+    assert [x.text for x in s.find('test', partial=True)] == ['test', 'Test', 'tested']
+    assert searches == ['test', 'test']
+    # Callers can't alter the cache.
+    s.find('test').clear()
+    s.find('test')[0].steno_list.append(('TEFTS',))
+    assert s.find('test') == expected
+    assert searches == ['test', 'test']
+    # Dictionary changes invalidate the cache.
+    d[('TEFT', '-G')] = 'testing'
+    assert [x.text for x in s.find('test', partial=True)] == ['test', 'Test', 'tested', 'testing']
+    d.enabled = False
+    assert s.find('test') == []
+    assert searches == ['test', 'test', 'test', 'test']
+    # Least recently used entries are evicted.
+    d.enabled = True
+    monkeypatch.setattr(suggestions, 'CACHE_SIZE', 2)
+    del searches[:]
+    for translation in ('test', 'tested', 'test', 'Test', 'test', 'tested'):
+        s.find(translation)
+    assert searches == ['test', 'tested', 'Test', 'tested']
+
+
+def test_find_phrases():
+    d1 = StenoDictionary()
+    d1.update({
+        ('TEFT',): 'test',
+        ('TEFTD',): 'tested',
+        ('TH-S',): 'this',
+        ('TH-S/S-Z',): 'this is',
+        ('TH*S/S-Z',): 'This is',
+        ('THS/S-Z/-T',): 'this is a test',
+        ('THS/S-Z/TEFT',): 'this is test',
+        ('S-Z/TEFT',): '{^}is test',
+        ('S-Z/-T/TEFT',): 'is a test',
+        ('S-Z/-T/TEFT/KPA*',): 'is a test{-|}',
+        ('A/TEFT',): 'a  test',
+        ('TEFT/-G',): 'test, ',
+        ('TEFT/KW-BG',): 'test,',
+        ('KAT',): 'cat',
+        ('-T/KAT',): 'a cat',
+        ('PW-FP',): '{^}',
+    })
+    d2 = StenoDictionary()
+    d2.update({
+        ('S-Z/-T/TEFT',): 'is the test',
+        ('-T/TEFT',): 'a test',
+    })
+    dc = StenoDictionaryCollection([d2, d1])
+    s = Suggestions(dc)
+    for text in (
+        'this is a test',
+        'This is a test ',
+        'this is a  test',
+        'is test',
+        'test',
+        'test, ',
+        'this is, a test',
+        # Words made only of characters stripped by the similarity function.
+        'is test -',
+        'a cat }',
+        'test {',
+        '-is test',
+        '- is - test -',
+        '} {',
+        '',
+    ):
+        words = WORD_RX.findall(text)
+        expected = []
+        for start in range(len(words)):
+            expected.extend(s.find(''.join(words[start:])))
+        assert s.find_phrases(words) == expected, text
+    # Dictionary changes are taken into account.
+    words = WORD_RX.findall('this is a test')
+    del d1[('THS/S-Z/-T',)]
+    d2[('TH-S/S/A/T',)] = 'THIS IS A TEST'
+    # Note: 'is a test' is overridden by 'is the test'.
+    assert [x.text for x in s.find_phrases(words)] == [
+        'THIS IS A TEST', 'is a test{-|}', 'a test', 'test',
+    ]
+
+
+def test_find_page():
+    d1 = StenoDictionary()
+    d1.update({('T-/%u' % n,): 'test%02u' % n for n in range(20)})
+    d1[('TEFT',)] = 'test'
+    d2 = StenoDictionary()
+    d2.update({('T*/%u' % n,): 'Test%02u' % n for n in range(0, 20, 2)})
+    dc = StenoDictionaryCollection([d1, d2])
+    s = Suggestions(dc)
+    for kwargs in (
+        dict(partial=True),
+        dict(regex=True),
+        dict(substring=True),
+        dict(),
+        dict(fuzzy=True),
+    ):
+        for translation in ('test', 'Test', 'test1', 'test.[13]', 'x'):
+            # Paging gives the same results as a single search, without limit.
+            expected = s.find(translation, count=1000, **kwargs)
+            if len(expected) == suggestions.MATCH_LIMIT:
+                continue
+            for page_size in (1, 3, 100):
+                results = []
+                page, cursor = s.find_page(translation, count=page_size, **kwargs)
+                while True:
+                    assert len(page) <= page_size
+                    results.extend(page)
+                    if cursor is None:
+                        break
+                    page, cursor = s.find_page(translation, count=page_size, cursor=cursor, **kwargs)
+                assert sorted(results) == sorted(expected), (translation, kwargs, page_size)
+    # Pages are not limited by MATCH_LIMIT.
+    d1.update({('T-/%u' % n,): 'test%03u' % n for n in range(200)})
+    page, cursor = s.find_page('test', count=150, partial=True)
+    assert len(page) == 150
+    assert page[-1].text == 'test140'
+    page, next_cursor = s.find_page('test', count=150, partial=True, cursor=cursor)
+    assert [x.text for x in page[:2]] == ['test141', 'test142']
+    assert next_cursor is None
+    # Cursors can't be used with another search.
+    with pytest.raises(ValueError):
+        s.find_page('test', partial=False, cursor=cursor)
+    # Invalid regular expressions.
+    assert s.find_page('test[', regex=True) == ([Suggestion('Invalid regular expression',
+                                                            [('unterminated character set',)])], None)
+    assert s.find_page(' ') == ([], None)
+
+
+class FakeEngine:
+
+    def __init__(self, dictionaries):
+        self.dictionaries = dictionaries
+        self.searches = []
+        # Cleared to block searches.
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def get_suggestions_snapshot(self):
+        return FakeSuggestionsSnapshot(self, Suggestions(self.dictionaries.snapshot()))
+
+    def get_phrase_suggestions(self, words):
+        self.searches.append(words)
+        return Suggestions(self.dictionaries).find_phrases(words)
+
+
+class FakeSuggestionsSnapshot:
+
+    def __init__(self, engine, suggestions):
+        self.engine = engine
+        self.suggestions = suggestions
+
+    def find_page(self, translation, **kwargs):
+        self.engine.searches.append(translation)
+        self.engine.unblocked.wait()
+        return self.suggestions.find_page(translation, **kwargs)
+
+
+def test_search_worker():
+    d = StenoDictionary()
+    d.update({('T-/%u' % n,): 'test%02u' % n for n in range(50)})
+    d[('TEFT',)] = 'test'
+    dc = StenoDictionaryCollection([d])
+    s = Suggestions(dc)
+    engine = FakeEngine(dc)
+    results = queue.Queue()
+    worker = SearchWorker(engine, lambda *args: results.put(args), delay=0.1, chunk_size=4)
+    worker.start()
+    try:
+        # Searches are debounced: only the latest one is run.
+        for translation in ('t', 'te', 'tes', 'test'):
+            last_id = worker.find_page(translation, count=10, partial=True)
+        search_id, (suggestions_page, cursor) = results.get(timeout=5)
+        assert search_id == last_id
+        assert (suggestions_page, cursor) == s.find_page('test', count=10, partial=True)
+        # Note: the page is looked up in chunks.
+        assert engine.searches == ['test'] * 3
+        # Getting the next page.
+        worker.find_page('test', count=10, cursor=cursor, partial=True)
+        assert results.get(timeout=5)[1] == s.find_page('test', count=10, cursor=cursor, partial=True)
+        # A running search is cancelled by a new one.
+        del engine.searches[:]
+        engine.unblocked.clear()
+        worker.find_page('test', count=10, partial=True)
+        while not engine.searches:
+            time.sleep(0.01)
+        last_id = worker.find_page('test0', count=10, partial=True)
+        engine.unblocked.set()
+        search_id, (suggestions_page, cursor) = results.get(timeout=5)
+        assert search_id == last_id
+        assert [x.text for x in suggestions_page] == ['test%02u' % n for n in range(10)]
+        assert engine.searches == ['test', 'test0', 'test0', 'test0']
+        # Phrases.
+        worker.find_phrases(['a ', 'test'])
+        assert results.get(timeout=5)[1] == s.find_phrases(['a ', 'test'])
+        # Cancelling.
+        worker.find_phrases(['test'])
+        worker.cancel()
+        time.sleep(0.2)
+        assert results.empty()
+    finally:
+        worker.stop()
+        worker.join(timeout=5)
+    assert not worker.is_alive()
+
+
+def test_search_worker_snapshot():
+    d = StenoDictionary()
+    d.update({
+        ('TEFT',): 'test',
+        ('T*EFT',): 'Test',
+        ('TEFT/-S',): 'tests',
+        ('TEGT',): 'text',
+    })
+    dc = StenoDictionaryCollection([d])
+    expected = Suggestions(dc.snapshot()).find_page('test', count=3, fuzzy=True)
+    assert [x.text for x in expected[0]] == ['test', 'Test', 'tests']
+    engine = FakeEngine(dc)
+    results = queue.Queue()
+    worker = SearchWorker(engine, lambda *args: results.put(args), delay=0, chunk_size=1)
+    worker.start()
+    try:
+        # Changes to the dictionaries during a search don't affect its results:
+        # all the chunks are looked up in the same snapshot of the dictionaries.
+        engine.unblocked.clear()
+        worker.find_page('test', count=3, fuzzy=True)
+        while not engine.searches:
+            time.sleep(0.01)
+        d[('T*EFT', '-S')] = 'TEST'
+        engine.unblocked.set()
+        assert results.get(timeout=5)[1] == expected
+        assert engine.searches == ['test'] * 3
+    finally:
+        worker.stop()
+        worker.join(timeout=5)
@@ -0,0 +1,62 @@
+"""Unit tests for trace.py."""
+
+import json
+import threading
+
+import pytest
+
+from plover import trace
+
+
+@pytest.fixture
+def tracing():
+    trace.clear()
+    trace.enable()
+    try:
+        yield
+    finally:
+        trace.disable()
+        trace.clear()
+
+
+@trace.traced('traced_function')
+def traced_function(a, b=0):
+    return a + b
+
+
+def test_disabled():
+    trace.clear()
+    assert not trace.is_enabled()
+    with trace.span('span'):
+        pass
+    assert traced_function(1, b=2) == 3
+    assert trace.trace_events() == []
+
+
+def test_trace(tracing, tmpdir):
+    with trace.span('outer', arg=42):
+        assert traced_function(1, b=2) == 3
+    inner, outer, thread_name = trace.trace_events()
+    assert inner['name'] == 'traced_function'
+    assert 'args' not in inner
+    assert outer['name'] == 'outer'
+    assert outer['args'] == {'arg': 42}
+    for event in (inner, outer):
+        assert event['ph'] == 'X'
+        assert event['tid'] == threading.get_ident()
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    assert thread_name['ph'] == 'M'
+    assert thread_name['args'] == {'name': threading.current_thread().name}
+    filename = str(tmpdir.join('trace.json'))
+    assert trace.dump(filename) == filename
+    with open(filename, encoding='utf-8') as fp:
+        assert json.load(fp)['traceEvents'] == trace.trace_events()
+
+
+def test_ring_buffer(tracing, monkeypatch):
+    monkeypatch.setattr(trace, '_spans', trace.deque(maxlen=2))
+    for n in range(3):
+        with trace.span('span', n=n):
+            pass
+    assert [e['args']['n'] for e in trace.trace_events() if e['ph'] == 'X'] == [1, 2]
@@ -0,0 +1,91 @@
+"""Unit tests for wordlist.py."""
+
+import os
+
+import pytest
+
+from plover import system, wordlist
+from plover.wordlist import Wordlist
+
+
+WORDS = {
+    'the': 1,
+    'orthography': 7,
+    'café': 5,
+    'naïve': 6,
+    'zebra': 4,
+}
+
+
+def write_wordlist(tmpdir, words):
+    source = tmpdir.join('words.txt')
+    source.write_text('\n'.join('%s %u' % (w, r) for w, r in words.items()),
+                      encoding='utf-8')
+    return str(source), str(tmpdir.join('words.txt.cache'))
+
+
+def test_empty_wordlist():
+    words = Wordlist()
+    assert 'the' not in words
+    assert len(words) == 0
+    assert list(words) == []
+
+
+def test_wordlist(tmpdir):
+    source, cache = write_wordlist(tmpdir, WORDS)
+    words = Wordlist(source, cache)
+    # Nothing is loaded before first use.
+    assert not os.path.exists(cache)
+    for w, r in WORDS.items():
+        assert w in words
+        assert words[w] == ord(str(r))
+    assert 'The' not in words
+    assert 'caf' not in words
+    assert words.get('zebras') is None
+    assert len(words) == len(WORDS)
+    assert list(words) == sorted(WORDS)
+    assert os.path.exists(cache)
+
+
+def test_wordlist_cache(tmpdir, monkeypatch):
+    source, cache = write_wordlist(tmpdir, WORDS)
+    assert 'the' in Wordlist(source, cache)
+    def compile_wordlist(filename):
+        raise AssertionError('wordlist should be loaded from cache')
+    # Up to date cache: no compilation.
+    with monkeypatch.context() as m:
+        m.setattr(wordlist, 'compile_wordlist', compile_wordlist)
+        assert dict(Wordlist(source, cache)) == dict(Wordlist(source, cache))
+        assert Wordlist(source, cache)['orthography'] == ord('7')
+    # Outdated cache.
+    source, cache = write_wordlist(tmpdir, {'other': 2, 'words': 3})
+    os.utime(source, (0, 0))
+    words = Wordlist(source, cache)
+    assert 'the' not in words
+    assert words['words'] == ord('3')
+
+
+def test_wordlist_load_error(tmpdir):
+    source, cache = write_wordlist(tmpdir, WORDS)
+    os.rename(source, source + '.bak')
+    words = Wordlist(source, cache)
+    # A failed load is not silently ignored, and is tried again.
+    for n in range(2):
+        with pytest.raises(FileNotFoundError):
+            'the' in words
+    os.rename(source + '.bak', source)
+    assert words['the'] == ord('1')
+
+
+def test_wordlist_cache_directory(tmpdir):
+    source, cache = write_wordlist(tmpdir, WORDS)
+    cache = str(tmpdir.join('config', 'words.txt.cache'))
+    assert 'the' in Wordlist(source, cache)
+    assert os.path.exists(cache)
+
+
+def test_system_missing_wordlist(monkeypatch):
+    monkeypatch.setattr(system, 'CONFIG_DIR', '/nonexistent')
+    monkeypatch.setattr(system, 'ASSETS_DIR', '/nonexistent')
+    with pytest.raises(FileNotFoundError):
+        system._load_wordlist('words.txt')
@@ -0,0 +1,204 @@
+"""Unit tests for the X11 keyboard emulation, against a mock display."""
+
+from types import SimpleNamespace
+
+import pytest
+
+xkeyboardcontrol = pytest.importorskip('plover.oslayer.xkeyboardcontrol')
+
+from Xlib import X, XK
+
+
+PRESS, RELEASE = X.KeyPress, X.KeyRelease
+
+# Keycodes of the mock keymap.
+SHIFT, BACKSPACE, KEY_A, KEY_B, CONTROL, KEY_TAB = range(8, 14)
+# Unused keycodes: for custom mappings.
+FREE = (14, 15, 16)
+
+PLOVER_MAPPING_KEYSYM = xkeyboardcontrol.KeyboardEmulation.PLOVER_MAPPING_KEYSYM
+
+
+def keysym(name):
+    return XK.string_to_keysym(name)
+
+
+def custom(*names):
+    mapping = [X.NoSymbol] * 3
+    for n, name in enumerate(names):
+        mapping[n] = keysym(name)
+    mapping[-1] = PLOVER_MAPPING_KEYSYM
+    return mapping
+
+
+class FakeDisplay:
+
+    def __init__(self, log):
+        self.log = log
+        self.keymap = {
+            SHIFT: ['Shift_L'],
+            BACKSPACE: ['BackSpace'],
+            KEY_A: ['a', 'A'],
+            KEY_B: ['b', 'B'],
+            CONTROL: ['Control_L'],
+            KEY_TAB: ['Tab'],
+        }
+        min_keycode, max_keycode = SHIFT, FREE[-1]
+        self.display = SimpleNamespace(info=SimpleNamespace(min_keycode=min_keycode,
+                                                            max_keycode=max_keycode))
+
+    def get_keyboard_mapping(self, first_keycode, count):
+        return [
+            [keysym(name) for name in self.keymap.get(keycode, ())] + [X.NoSymbol] * 4
+            for keycode in range(first_keycode, first_keycode + count)
+        ]
+
+    def get_modifier_mapping(self):
+        modifiers = [[0, 0] for n in range(8)]
+        modifiers[0] = [SHIFT, 0]
+        modifiers[2] = [CONTROL, 0]
+        return modifiers
+
+    def change_keyboard_mapping(self, first_keycode, keysyms):
+        self.log.append(('change_keyboard_mapping', first_keycode, [list(k) for k in keysyms]))
+
+    def sync(self):
+        self.log.append(('sync',))
+
+
+@pytest.fixture
+def log():
+    return []
+
+
+@pytest.fixture
+def kbd(monkeypatch, log):
+    monkeypatch.setattr(xkeyboardcontrol.display, 'Display', lambda: FakeDisplay(log))
+    monkeypatch.setattr(xkeyboardcontrol.xtest, 'fake_input',
+                        lambda display, event_type, keycode: log.append((event_type, keycode)))
+    return xkeyboardcontrol.KeyboardEmulation()
+
+
+def test_send_string(kbd, log):
+    kbd.send_string('aAAb')
+    # Modifiers are only toggled when needed.
+    assert log == [
+        (PRESS, KEY_A), (RELEASE, KEY_A),
+        (PRESS, SHIFT),
+        (PRESS, KEY_A), (RELEASE, KEY_A),
+        (PRESS, KEY_A), (RELEASE, KEY_A),
+        (RELEASE, SHIFT),
+        (PRESS, KEY_B), (RELEASE, KEY_B),
+        ('sync',),
+    ]
+    log.clear()
+    kbd.send_string('B')
+    assert log == [
+        (PRESS, SHIFT),
+        (PRESS, KEY_B), (RELEASE, KEY_B),
+        (RELEASE, SHIFT),
+        ('sync',),
+    ]
+
+
+def test_batch(kbd, log):
+    with kbd.batch():
+        kbd.send_backspaces(2)
+        with kbd.batch():
+            kbd.send_string('a')
+        kbd.send_key_combination('control_l(b)')
+        # Nothing is sent before the end of the batch.
+        assert log == []
+    assert log == [
+        (PRESS, BACKSPACE), (RELEASE, BACKSPACE),
+        (PRESS, BACKSPACE), (RELEASE, BACKSPACE),
+        (PRESS, KEY_A), (RELEASE, KEY_A),
+        (PRESS, CONTROL), (PRESS, KEY_B), (RELEASE, KEY_B), (RELEASE, CONTROL),
+        ('sync',),
+    ]
+
+
+def test_send_string_remapping(kbd, log):
+    # Unmapped keysyms are mapped ahead of time, with a
+    # single request for the consecutive free keycodes.
+    kbd.send_string('xyz')
+    assert log == [
+        ('change_keyboard_mapping', FREE[0], [custom('x', 'y'), custom('z')]),
+        (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        (PRESS, SHIFT), (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        (RELEASE, SHIFT), (PRESS, FREE[1]), (RELEASE, FREE[1]),
+        ('sync',),
+    ]
+    log.clear()
+    # Mappings are reused, and the ones still needed are not recycled.
+    kbd.send_string('z1234')
+    assert log == [
+        ('change_keyboard_mapping', FREE[0], [custom('4', 'y'), custom('z', '1'), custom('2', '3')]),
+        (PRESS, FREE[1]), (RELEASE, FREE[1]),
+        (PRESS, SHIFT), (PRESS, FREE[1]), (RELEASE, FREE[1]),
+        (RELEASE, SHIFT), (PRESS, FREE[2]), (RELEASE, FREE[2]),
+        (PRESS, SHIFT), (PRESS, FREE[2]), (RELEASE, FREE[2]),
+        (RELEASE, SHIFT), (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        ('sync',),
+    ]
+
+
+def test_send_string_remapping_overflow(kbd, log):
+    # More keysyms than custom mappings: the last one is mapped on the fly,
+    # after sending the events already queued (using the previous mapping).
+    kbd.send_string('1234567')
+    assert log == [
+        ('change_keyboard_mapping', FREE[0], [custom('1', '2'), custom('3', '4'), custom('5', '6')]),
+        (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        (PRESS, SHIFT), (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        (RELEASE, SHIFT), (PRESS, FREE[1]), (RELEASE, FREE[1]),
+        (PRESS, SHIFT), (PRESS, FREE[1]), (RELEASE, FREE[1]),
+        (RELEASE, SHIFT), (PRESS, FREE[2]), (RELEASE, FREE[2]),
+        (PRESS, SHIFT), (PRESS, FREE[2]), (RELEASE, FREE[2]),
+        ('change_keyboard_mapping', FREE[0], [custom('7', '2')]),
+        (RELEASE, SHIFT), (PRESS, FREE[0]), (RELEASE, FREE[0]),
+        ('sync',),
+    ]
+
+
+def test_key_combination_cache(kbd, log, monkeypatch):
+    parsed = []
+    parse_key_combo = xkeyboardcontrol.parse_key_combo
+    def counting_parse_key_combo(combo_string, *args):
+        parsed.append(combo_string)
+        return parse_key_combo(combo_string, *args)
+    monkeypatch.setattr(xkeyboardcontrol, 'parse_key_combo', counting_parse_key_combo)
+    for n in range(2):
+        kbd.send_key_combination('control_l(a tab)')
+    assert parsed == ['control_l(a tab)']
+    assert log == 2 * [
+        (PRESS, CONTROL),
+        (PRESS, KEY_A), (RELEASE, KEY_A),
+        (PRESS, KEY_TAB), (RELEASE, KEY_TAB),
+        (RELEASE, CONTROL),
+        ('sync',),
+    ]
+    # Invalid combos are not cached.
+    for n in range(2):
+        with pytest.raises(SyntaxError):
+            kbd.send_key_combination('control_l(a')
+    assert parsed.count('control_l(a') == 2
+    # Neither are combos using custom mappings (they can be reassigned).
+    kbd.send_string('x')
+    log.clear()
+    for n in range(2):
+        kbd.send_key_combination('x')
+    assert parsed.count('x') == 2
+    assert log == 2 * [(PRESS, FREE[0]), (RELEASE, FREE[0]), ('sync',)]
+
+
+def test_key_combination_cache_layout_change(kbd, log):
+    kbd.send_key_combination('a')
+    assert log == [(PRESS, KEY_A), (RELEASE, KEY_A), ('sync',)]
+    log.clear()
+    # Layout change: a and b are swapped.
+    keymap = kbd._display.keymap
+    keymap[KEY_A], keymap[KEY_B] = keymap[KEY_B], keymap[KEY_A]
+    kbd._update_keymap()
+    kbd.send_key_combination('a')
+    assert log == [(PRESS, KEY_B), (RELEASE, KEY_B), ('sync',)]